@@ -1,7 +1,9 @@
 # custom class that calculate accuracy at the neighborhood level
 # input: surpriselib predictions (after training a model)
-# the class is initialized with the model predictions and uses them to map them to all the users in a dictionary
+# the class is initialized with the model predictions and stores them as contiguous float32 arrays grouped by user,
+# every metric of all the neighborhoods is then computed in one vectorized pass over per-user error sums
 
+from neighborhood_eval.nbhd_stats import nbhd_arrays
 from collections import defaultdict
 import pandas as pd
 import numpy as np
@@ -12,57 +14,75 @@ class NeighborhoodAccuracy:
 
         self.neighborhood_mae = defaultdict(list)
         self.neighborhood_rmse = defaultdict(list)
-        self.map_users = defaultdict(list)
-
-        # map the predictions to each user
-        for uid, iid, true_r, est, _ in predictions:
-            self.map_users[uid].append((iid, true_r, est))
+        self._map_users = None
+
+        uids, iids, true_r, est, _ = zip(*predictions) if len(predictions) else ((), (), (), (), ())
+
+        # users are coded in order of appearance, their predictions are stored contiguously between offsets[u] and
+        # offsets[u + 1]
+        user_codes, users = pd.factorize(pd.Series(uids, dtype=object))
+        order = np.argsort(user_codes, kind='stable')
+
+        self.users = pd.Index(users)
+        self.iids = np.asarray(iids, dtype=object)[order]
+        self.true_r = np.ascontiguousarray(np.asarray(true_r, dtype=np.float32)[order])
+        self.est = np.ascontiguousarray(np.asarray(est, dtype=np.float32)[order])
+        self.offsets = np.zeros(len(self.users) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(user_codes, minlength=len(self.users)), out=self.offsets[1:])
+
+    def compute_all(self, neighbors):
+
+        # per-user count and error sums (accumulated in float64)
+        user_codes = np.repeat(np.arange(len(self.users)), np.diff(self.offsets))
+        err = (self.true_r - self.est).astype(np.float64)
+        count = np.diff(self.offsets).astype(np.float64)
+        abs_err = np.bincount(user_codes, weights=np.abs(err), minlength=len(self.users))
+        sq_err = np.bincount(user_codes, weights=err**2, minlength=len(self.users))
+
+        # the neighborhood of every user is centered at the user, each neighbor adds its own ratings
+        # (neighbors without predictions add nothing, repeated neighbors are added as many times as they appear)
+        anchor_codes, indptr, indices = nbhd_arrays({uid: neighbors[uid] for uid in self.users}, self.users)
+        rows = np.repeat(anchor_codes, np.diff(indptr))[indices >= 0]
+        members = indices[indices >= 0]
+
+        nbhd_count = count + np.bincount(rows, weights=count[members], minlength=len(self.users))
+        nbhd_abs_err = abs_err + np.bincount(rows, weights=abs_err[members], minlength=len(self.users))
+        nbhd_sq_err = sq_err + np.bincount(rows, weights=sq_err[members], minlength=len(self.users))
+
+        mse = nbhd_sq_err / nbhd_count
+
+        # uid -> [metric, neighborhood size], as filled by the per-user loops of the original class
+        sizes = nbhd_count.astype(np.int64).tolist()
+        mae = (nbhd_abs_err / nbhd_count).tolist()
+        rmse = np.sqrt(mse).tolist()
+        self.neighborhood_mae = defaultdict(list, {uid: [mae[u], sizes[u]] for u, uid in enumerate(self.users)})
+        self.neighborhood_rmse = defaultdict(list, {uid: [rmse[u], sizes[u]] for u, uid in enumerate(self.users)})
+
+        neighborhood_accuracy_df = pd.DataFrame({
+                        'user_id': self.users,
+                        'mae': nbhd_abs_err / nbhd_count,
+                        'mse': mse,
+                        'rmse': np.sqrt(mse),
+                        'neighborhood_size': nbhd_count.astype(np.int64)}) \
+                        .sort_values(by=['user_id'])
+
+        return neighborhood_accuracy_df
+
+    # uid -> list of (iid, true_r, est), built from the grouped arrays on first access
+    @property
+    def map_users(self):
+        if self._map_users is None:
+            self._map_users = defaultdict(list)
+            rows = zip(self.iids.tolist(), self.true_r.tolist(), self.est.tolist())
+            for uid, start, stop in zip(self.users, self.offsets[:-1], self.offsets[1:]):
+                self._map_users[uid] = [next(rows) for _ in range(start, stop)]
+
+        return self._map_users
 
     def compute_neighborhood_mae(self, neighbors):
 
-        # append the neighborhood ratings to every user and calculate the mae at each iteration
-        for uid, user_ratings in list(self.map_users.items()):
-            # work on a copy of the user_ratings list rather to avoid overwriting it
-            user_neighbors_ratings = user_ratings.copy()
-
-            for neighbor in neighbors[uid]:
-                neighbor_ratings = self.map_users[neighbor]
-                user_neighbors_ratings.extend(neighbor_ratings)
-
-            # calculate the mae for every user in the testset (neighborhood cetered at the user if the neighborhood list is not empty)
-            mae = np.mean([float(abs(true_r - est))
-                    for (_, true_r, est) in user_neighbors_ratings])
-                        
-            self.neighborhood_mae[uid].extend((mae, len(user_neighbors_ratings)))
-
-        neighborhood_mae_df = pd.DataFrame.from_dict(self.neighborhood_mae, orient='index') \
-                        .reset_index() \
-                        .sort_values(by=['index']) \
-                        .rename({'index' : 'user_id', 0 : 'mae', 1 : 'neighborhood_size'}, axis=1)
-
-        return neighborhood_mae_df
+        return self.compute_all(neighbors)[['user_id', 'mae', 'neighborhood_size']]
 
     def compute_neighborhood_rmse(self, neighbors):
 
-        # append the neighborhood ratings to every user and calculate the rmse at each iteration
-        for uid, user_ratings in list(self.map_users.items()):
-            # work on a copy of the user_ratings list rather to avoid overwriting it
-            user_neighbors_ratings = user_ratings.copy()
-
-            for neighbor in neighbors[uid]:
-                neighbor_ratings = self.map_users[neighbor]
-                user_neighbors_ratings.extend(neighbor_ratings)
-
-            # calculate the rmse for every user in the testset (neighborhood cetered at the user if the neighborhood list is not empty)
-            mse = np.mean([float((true_r - est)**2)
-                   for (_, true_r, est) in user_neighbors_ratings])
-            rmse = np.sqrt(mse)
-                        
-            self.neighborhood_rmse[uid].extend((rmse, len(user_neighbors_ratings)))
-
-        neighborhood_rmse_df = pd.DataFrame.from_dict(self.neighborhood_rmse, orient='index') \
-                        .reset_index() \
-                        .sort_values(by=['index']) \
-                        .rename({'index' : 'user_id', 0 : 'rmse', 1 : 'neighborhood_size'}, axis=1)
-        
-        return neighborhood_rmse_df
+        return self.compute_all(neighbors)[['user_id', 'rmse', 'neighborhood_size']]
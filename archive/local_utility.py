@@ -1,5 +1,8 @@
 from collections import defaultdict
+from neighborhood_eval.nbhd_stats import nbhd_arrays
+from neighborhood_eval.parallel import run_sharded, load_shared, slice_nbhds
 import pandas as pd
+import numpy as np
 import math
 
 '''
@@ -10,7 +13,13 @@ import math
         It's better to consider NDCG of the whole user/user+neighborhood when considering neighborhood metric evaluation
 '''
 
-def compute_neighborhood_ndcg(predictions, neighbors, n=10000):
+# runs the vectorized engine, n_jobs > 1 shards the users across a process pool
+def compute_neighborhood_ndcg(predictions, neighbors, n=10000, n_jobs=1):
+    return compute_neighborhood_ndcg_vectorized(predictions, neighbors, n, n_jobs)
+
+
+# original per-user loop, kept as the reference of the vectorized engine in the tests and benchmarks
+def _compute_neighborhood_ndcg_loop(predictions, neighbors, n=10000):
     neighborhood_ndcg = defaultdict(list)
     map_users = defaultdict(list)
     top_n = defaultdict(list)
@@ -58,7 +67,8 @@ def compute_neighborhood_ndcg(predictions, neighbors, n=10000):
 
             # IDCG calculation
                 # an additional one is added (index + 1) since the index starts at 0 as the 1st position
-            search_top_n_real = [index + 1 for index, v in enumerate(top_n_real[uid]) if v[0] == iid] # find the location of the item in the ground-truth rankings
+            # find the location of the item in the ground-truth rankings
+            search_top_n_real = [index + 1 for index, v in enumerate(top_n_real[uid]) if v[0] == iid]
             if not search_top_n_real:
                 # print("item not found in the ground-truth rankings, using lowest values instead")
                 search_top_n_real = n + 1
@@ -78,3 +88,118 @@ def compute_neighborhood_ndcg(predictions, neighbors, n=10000):
                             .rename({'index' : 'user_id', 0 : 'ndcg', 1 : 'neighborhood_size'}, axis=1)
 
     return neighborhood_ndcg_df
+
+
+# vectorized compute_neighborhood_ndcg: the neighborhoods of a batch of users are concatenated into one array,
+# sorted once per criterion with lexsort and scored with precomputed log2 discount tables (same ndcg/neighborhood_size)
+# with n_jobs > 1 the batches are sharded across a process pool and the predictions are shared as memory-mapped arrays
+def compute_neighborhood_ndcg_vectorized(predictions, neighbors, n=10000, n_jobs=1, batch_size=1024):
+    user_index, arrays = ndcg_arrays(predictions, neighbors)
+
+    if n_jobs > 1 and len(user_index):
+        columns = run_sharded(_ndcg_shard, arrays, len(user_index), n_jobs, n, batch_size)
+    else:
+        columns = ndcg_batches(arrays, 0, len(user_index), n, batch_size)
+
+    neighborhood_ndcg = {uid: [ndcg, size] for uid, ndcg, size in
+                         zip(user_index, columns['ndcg'], columns['neighborhood_size'].tolist())}
+    neighborhood_ndcg_df = pd.DataFrame.from_dict(neighborhood_ndcg, orient='index') \
+                            .reset_index() \
+                            .sort_values(by=['index']) \
+                            .rename({'index' : 'user_id', 0 : 'ndcg', 1 : 'neighborhood_size'}, axis=1)
+
+    return neighborhood_ndcg_df
+
+
+# prediction arrays grouped by user (rows of user u between offsets[u] and offsets[u + 1]) and the CSR neighborhoods
+def ndcg_arrays(predictions, neighbors):
+    uids, iids, true_r, est, _ = zip(*predictions)
+    user_codes, user_index = pd.factorize(pd.Series(uids, dtype=object))
+    user_index = pd.Index(user_index)
+
+    # group the prediction rows by user, keeping their original order within each user
+    rows = np.argsort(user_codes, kind='stable')
+    offsets = np.zeros(len(user_index) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(user_codes, minlength=len(user_index)), out=offsets[1:])
+
+    # every user of the testset is an anchor, neighbors without predictions get the code -1
+    _, indptr, indices = nbhd_arrays({uid: neighbors[uid] for uid in user_index}, user_index)
+
+    return user_index, {
+        'iid': pd.factorize(pd.Series(iids, dtype=object))[0][rows].astype(np.int64),
+        'true_r': np.asarray(true_r, dtype=np.float64)[rows],
+        'est': np.asarray(est, dtype=np.float64)[rows],
+        'offsets': offsets,
+        'indptr': indptr,
+        'indices': indices
+    }
+
+
+# process-pool task: ndcg of the users in [start, stop) read from the memory-mapped prediction arrays
+def _ndcg_shard(paths, start, stop, n, batch_size):
+    return ndcg_batches(load_shared(paths), start, stop, n, batch_size)
+
+
+def ndcg_batches(arrays, start, stop, n, batch_size):
+    parts = [ndcg_batch(arrays, batch_start, min(batch_start + batch_size, stop), n)
+             for batch_start in range(start, stop, batch_size)]
+    if not parts:
+        return {'ndcg': np.zeros(0), 'neighborhood_size': np.zeros(0, dtype=np.int64)}
+
+    return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+
+
+# ndcg of the neighborhoods of users [start, stop), computed over their concatenated ratings
+def ndcg_batch(arrays, start, stop, n):
+    offsets = arrays['offsets']
+    indptr, indices = slice_nbhds(arrays['indptr'], arrays['indices'], start, stop)
+    n_segments = stop - start
+
+    # members of every neighborhood: the user first, then its neighbors in the order of the neighbors list
+    nbhd_segments = np.repeat(np.arange(n_segments), np.diff(indptr))
+    valid = indices >= 0
+    member_segments = np.concatenate([np.arange(n_segments), nbhd_segments[valid]])
+    member_codes = np.concatenate([np.arange(start, stop), indices[valid]])
+    member_order = np.lexsort((np.concatenate([np.zeros(n_segments), np.arange(1, valid.sum() + 1)]), member_segments))
+    member_segments = member_segments[member_order]
+    member_codes = member_codes[member_order]
+
+    # expand every member into its prediction rows
+    counts = offsets[member_codes + 1] - offsets[member_codes]
+    row_starts = np.repeat(offsets[member_codes] - (np.cumsum(counts) - counts), counts)
+    rows = row_starts + np.arange(counts.sum())
+    segments = np.repeat(member_segments, counts)
+    segment_len = np.bincount(segments, minlength=n_segments)
+    segment_start = np.cumsum(segment_len) - segment_len
+
+    iid = np.asarray(arrays['iid'][rows])
+    true_r = np.asarray(arrays['true_r'][rows])
+    est = np.asarray(arrays['est'][rows])
+    position = np.arange(len(rows))
+
+    # stable sorts, as the list sorts: by prediction, then the prediction-sorted list by the real rating
+    by_est = np.lexsort((position, -est, segments))
+    est_rank = np.empty(len(rows), dtype=np.int64)
+    est_rank[by_est] = position - segment_start[segments[by_est]]
+    by_real = np.lexsort((est_rank, -true_r, segments))
+    real_rank = np.empty(len(rows), dtype=np.int64)
+    real_rank[by_real] = position - segment_start[segments[by_real]]
+
+    # log2 discount tables, the rank r (0-based) is discounted by log2(r + 2)
+    discount = np.log2(np.arange(2, min(n, max(segment_len.max(initial=0), 1)) + 2))
+    top = est_rank < n
+    utility = 2**true_r[top] - 1
+    dcg = np.bincount(segments[top], weights=utility / discount[est_rank[top]], minlength=n_segments)
+
+    # position of the first occurrence of every (neighborhood, item) in the ground-truth top-n
+    n_items = iid.max(initial=0) + 1
+    real_top = by_real[real_rank[by_real] < n]
+    gt_keys, gt_first = np.unique(segments[real_top] * n_items + iid[real_top], return_index=True)
+    keys = segments[top] * n_items + iid[top]
+    pos = np.minimum(np.searchsorted(gt_keys, keys), len(gt_keys) - 1)
+    found = gt_keys[pos] == keys
+    gt_rank = real_rank[real_top][gt_first][pos]
+    gains = np.where(found, utility / np.log2(gt_rank + 2), 1 / np.log2(n + 2))
+    idcg = np.bincount(segments[top], weights=gains, minlength=n_segments)
+
+    return {'ndcg': dcg / idcg, 'neighborhood_size': np.minimum(segment_len, n)}
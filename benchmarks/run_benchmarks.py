@@ -0,0 +1,196 @@
+'''
+    scaling benchmarks of the neighborhood evaluation stages on synthetic workloads, fully offline
+    every stage is timed on each size (best of --repeat runs) and rerun under tracemalloc for its peak memory,
+    the JSON report can be compared with the report of another commit through --compare
+
+    python -m benchmarks.run_benchmarks --sizes 500 2000 10000 --output report.json
+    python -m benchmarks.run_benchmarks --sizes 500 2000 10000 --compare report.json
+'''
+from benchmarks.synthetic import synthetic_ratings, synthetic_predictions, predictions_list, \
+    synthetic_neighborhoods, synthetic_precisions_recalls
+from neighborhood_eval.neighborhood_accuracy import _critical_nbhds_accuracy_loop, critical_nbhds_accuracy_vectorized
+from neighborhood_eval.neighborhood_rankings import _get_critical_nbhds_loop, get_critical_nbhds_vectorized
+from archive.local_utility import _compute_neighborhood_ndcg_loop, compute_neighborhood_ndcg_vectorized
+from archive.local_accuracy import NeighborhoodAccuracy
+from util.nbhd_builder import build_knn
+from util.knn import get_knn, get_knn_batched
+from util.instrumentation import stage
+from recommenders.utils.timer import Timer
+from contextlib import redirect_stdout
+import numpy as np
+import subprocess
+import tracemalloc
+import platform
+import argparse
+import json
+import io
+import os
+
+
+# stage name -> (function of the workload, whether it is a per-neighborhood loop limited to --loop-max-users)
+STAGES = {
+    'critical_nbhds_accuracy_loop': (lambda w: _critical_nbhds_accuracy_loop(w['nbhds'], w['predictions_df']), True),
+    'critical_nbhds_accuracy_vectorized':
+        (lambda w: critical_nbhds_accuracy_vectorized(w['nbhds'], w['predictions_df']), False),
+    'get_critical_nbhds_loop': (lambda w: _get_critical_nbhds_loop(
+        w['nbhds'], w['predictions_df'], w['precisions_df'], w['recalls_df']), True),
+    'get_critical_nbhds_vectorized': (lambda w: get_critical_nbhds_vectorized(
+        w['nbhds'], w['predictions_df'], w['precisions_df'], w['recalls_df']), False),
+    'compute_neighborhood_ndcg_loop':
+        (lambda w: _compute_neighborhood_ndcg_loop(w['predictions'], w['nbhds']), True),
+    'compute_neighborhood_ndcg_vectorized':
+        (lambda w: compute_neighborhood_ndcg_vectorized(w['predictions'], w['nbhds']), False),
+    'NeighborhoodAccuracy': (lambda w: NeighborhoodAccuracy(w['predictions']).compute_all(w['nbhds']), False),
+    'build_knn': (lambda w: build_knn(w['ratings'], 'pearson', w['nbhd_size']), False),
+    'get_knn': (lambda w: get_knn(w['ratings'], w['knn_algo'], w['nbhd_size']), True),
+    'get_knn_batched': (lambda w: get_knn_batched(w['ratings'], w['knn_algo'], w['nbhd_size']), False)
+}
+
+# stages that need a fitted surprise KNN algorithm
+KNN_STAGES = ['get_knn', 'get_knn_batched']
+
+
+def make_workload(n_users, n_items, density, nbhd_size, seed=0):
+    ratings = synthetic_ratings(n_users, n_items, density, seed=seed)
+    predictions_df = synthetic_predictions(ratings, seed=seed)
+    precisions_df, recalls_df = synthetic_precisions_recalls(predictions_df)
+
+    return {
+        'ratings': ratings,
+        'predictions_df': predictions_df,
+        'predictions': predictions_list(predictions_df),
+        'precisions_df': precisions_df,
+        'recalls_df': recalls_df,
+        'nbhds': synthetic_neighborhoods(ratings.user_id, nbhd_size, seed),
+        'nbhd_size': nbhd_size
+    }
+
+
+# KNNWithMeans fitted on the synthetic ratings, None when surprise is not installed
+def fit_knn_algo(ratings):
+    try:
+        from surprise import Dataset, Reader, KNNWithMeans
+    except ImportError:
+        return None
+
+    data = Dataset.load_from_df(ratings[['user_id', 'item_id', 'rating']], Reader(rating_scale=(0.5, 5)))
+    algo = KNNWithMeans(sim_options={'name': 'pearson', 'user_based': True}, verbose=False)
+    trainset = data.build_full_trainset()
+
+    with stage('fit', rows=trainset.n_ratings, algo=type(algo).__name__):
+        return algo.fit(trainset)
+
+
+# best wall time over repeat runs, then the tracemalloc peak of one more run (the prints of the stages are muted)
+def measure(stage_fn, workload, repeat=1, memory=True):
+    seconds = []
+    for _ in range(repeat):
+        with redirect_stdout(io.StringIO()), Timer() as t:
+            stage_fn(workload)
+        seconds.append(t.interval)
+
+    peak_mb = None
+    if memory:
+        tracemalloc.start()
+        with redirect_stdout(io.StringIO()):
+            stage_fn(workload)
+        peak_mb = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+
+    return min(seconds), peak_mb
+
+
+def run_benchmarks(sizes, items_per_user=2, density=0.01, nbhd_size=10, stages=None, loop_max_users=2000,
+                   repeat=1, memory=True, seed=0):
+    stages = stages or list(STAGES)
+    results = []
+
+    for n_users in sizes:
+        n_items = int(n_users * items_per_user)
+        workload = make_workload(n_users, n_items, density, nbhd_size, seed)
+        if any(name in KNN_STAGES for name in stages):
+            workload['knn_algo'] = fit_knn_algo(workload['ratings'])
+
+        for name in stages:
+            stage_fn, is_loop = STAGES[name]
+            record = {'stage': name, 'n_users': n_users, 'n_items': n_items, 'density': density,
+                      'nbhd_size': nbhd_size, 'n_ratings': len(workload['ratings'])}
+
+            if is_loop and n_users > loop_max_users:
+                record['skipped'] = 'loop stage above loop_max_users'
+            elif name in KNN_STAGES and workload['knn_algo'] is None:
+                record['skipped'] = 'surprise is not installed'
+            else:
+                record['seconds'], record['peak_mb'] = measure(stage_fn, workload, repeat, memory)
+
+            print(name, n_users, record.get('skipped', '{:0.4f}s'.format(record.get('seconds', 0))))
+            results.append(record)
+
+    return {'meta': report_meta(), 'results': results}
+
+
+def report_meta():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+
+    return {'commit': commit, 'python': platform.python_version(), 'numpy': np.__version__,
+            'machine': platform.machine(), 'cpus': os.cpu_count()}
+
+
+# a stage measured on one workload
+def record_key(record):
+    return record['stage'], record['n_users'], record['n_items'], record['density'], record['nbhd_size']
+
+
+# time and memory ratios (current / baseline) of the stages measured in both reports
+def compare_reports(baseline, current):
+    baseline_results = {record_key(record): record for record in baseline['results'] if 'seconds' in record}
+
+    rows = []
+    for record in current['results']:
+        old = baseline_results.get(record_key(record))
+        if old is None or 'seconds' not in record:
+            continue
+        row = {'stage': record['stage'], 'n_users': record['n_users'],
+               'time_ratio': record['seconds'] / old['seconds'] if old['seconds'] else float('nan')}
+        if record.get('peak_mb') is not None and old.get('peak_mb'):
+            row['memory_ratio'] = record['peak_mb'] / old['peak_mb']
+        rows.append(row)
+
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Neighborhood evaluation benchmarks on synthetic data')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[500, 2000])
+    parser.add_argument('--items-per-user', type=float, default=2)
+    parser.add_argument('--density', type=float, default=0.01)
+    parser.add_argument('--nbhd-size', type=int, default=10)
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), default=None)
+    parser.add_argument('--loop-max-users', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--no-memory', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None)
+    parser.add_argument('--compare', default=None)
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.sizes, args.items_per_user, args.density, args.nbhd_size, args.stages,
+                            args.loop_max_users, args.repeat, not args.no_memory, args.seed)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            for row in compare_reports(json.load(f), report):
+                print(row['stage'], row['n_users'], 'time x{:0.2f}'.format(row['time_ratio']),
+                      'memory x{:0.2f}'.format(row['memory_ratio']) if 'memory_ratio' in row else '')
+
+
+if __name__ == '__main__':
+    main()
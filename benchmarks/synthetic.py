@@ -0,0 +1,87 @@
+'''
+    synthetic long-tailed workloads for the neighborhood evaluation benchmarks (no dataset download needed)
+    item popularity follows a power law and user activity a log-normal, ratings come from user and item biases plus
+    noise on the 0.5 -> 5 scale, predictions are the ratings blurred by a model error
+'''
+from neighborhood_eval.neighborhood_rankings import precision_recall_at_ks
+from collections import defaultdict
+import pandas as pd
+import numpy as np
+
+
+# ratings frame (user_id, item_id, rating, timestamp) of about density * n_users * n_items distinct pairs
+def synthetic_ratings(n_users=1000, n_items=2000, density=0.01, alpha=1.1, seed=0):
+    rng = np.random.default_rng(seed)
+    n_ratings = max(1, int(density * n_users * n_items))
+
+    # long tail: a few items and users hold most of the ratings
+    item_weights = 1 / np.arange(1, n_items + 1)**alpha
+    user_weights = rng.lognormal(0, 1, n_users)
+    items = rng.permutation(n_items)[rng.choice(n_items, n_ratings, p=item_weights / item_weights.sum())]
+    users = rng.choice(n_users, n_ratings, p=user_weights / user_weights.sum())
+
+    # every user rates an item at most once
+    pairs = np.unique(users.astype(np.int64) * n_items + items)
+    users, items = pairs // n_items + 1, pairs % n_items + 1
+
+    user_bias = rng.normal(0, 0.5, n_users + 1)
+    item_bias = rng.normal(0, 0.5, n_items + 1)
+    ratings = np.clip(np.round((3.5 + user_bias[users] + item_bias[items] + rng.normal(0, 0.8, len(pairs))) * 2) / 2,
+                      0.5, 5)
+
+    return pd.DataFrame({
+        'user_id': users,
+        'item_id': items,
+        'rating': ratings,
+        'timestamp': rng.integers(9 * 10**8, 16 * 10**8, len(pairs))
+    })
+
+
+# predictions in the layout of pd.DataFrame(algo.test(testset)) plus the prediction_loss column of the notebooks
+def synthetic_predictions(ratings, noise=0.9, seed=0):
+    rng = np.random.default_rng(seed)
+    r_ui = ratings.rating.to_numpy(dtype=np.float64)
+    est = np.clip(r_ui + rng.normal(0, noise, len(r_ui)), 0.5, 5)
+
+    predictions_df = pd.DataFrame({
+        'uid': ratings.user_id.to_numpy(),
+        'iid': ratings.item_id.to_numpy(),
+        'r_ui': r_ui,
+        'est': est,
+        'details': [{'was_impossible': False}] * len(r_ui)
+    })
+    predictions_df['prediction_loss'] = (predictions_df.r_ui - predictions_df.est)**2
+
+    return predictions_df
+
+
+# surprise-style list of (uid, iid, r_ui, est, details) tuples, as used by the archive classes
+def predictions_list(predictions_df):
+    return list(predictions_df[['uid', 'iid', 'r_ui', 'est', 'details']].itertuples(index=False, name=None))
+
+
+# random neighborhoods of nbhd_size other users (same layout as get_knn), for the stages that do not build them
+def synthetic_neighborhoods(user_ids, nbhd_size=10, seed=0):
+    rng = np.random.default_rng(seed)
+    user_ids = np.unique(user_ids)
+    k = min(nbhd_size, len(user_ids) - 1)
+
+    nbhds = defaultdict(list)
+    for position, uid in enumerate(user_ids):
+        # draw among the other users by skipping the user's own position
+        others = rng.choice(len(user_ids) - 1, k, replace=False)
+        nbhds[uid] = user_ids[others + (others >= position)].tolist()
+
+    return nbhds
+
+
+# per-user precision and recall frames, as built in the ranking notebooks
+def synthetic_precisions_recalls(predictions_df, k=10, threshold=3.5):
+    user_codes, users = pd.factorize(predictions_df.uid)
+    metrics = precision_recall_at_ks(user_codes, predictions_df.est.to_numpy(), predictions_df.r_ui.to_numpy(), [k],
+                                     threshold)
+
+    precisions_df = pd.DataFrame({'user_id': users, 'precision': metrics['precision@' + str(k)]})
+    recalls_df = pd.DataFrame({'user_id': users, 'recall': metrics['recall@' + str(k)]})
+
+    return precisions_df, recalls_df
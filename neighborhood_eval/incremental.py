@@ -0,0 +1,152 @@
+# incremental critical neighborhood evaluation, for reruns where only a fraction of the users get new predictions
+# the state keeps the per-user sufficient statistics, the sums over every neighborhood and the reverse neighbor
+# lists (a users x neighborhoods CSC matrix); a delta of changed users only touches the sums of the neighborhoods
+# that contain them and the global totals
+# only those sufficient statistics are incremental: D' is the global totals minus N, so any change moves the D' of
+# every neighborhood and result() re-derives the tests of all of them from the cached sums (a few vector operations
+# per neighborhood, without scanning any prediction)
+
+from neighborhood_eval.nbhd_stats import encode_users, extend_users, nbhd_arrays, csr_membership, with_anchors, \
+    user_sums, nbhd_sums, total_sums
+from neighborhood_eval.neighborhood_accuracy import accuracy_user_sums, accuracy_tests, critical_nbhds_frame \
+    as accuracy_frame
+from neighborhood_eval.neighborhood_rankings import prediction_user_sums, ranking_tests, critical_nbhds_frame \
+    as ranking_frame
+import numpy as np
+
+
+class IncrementalState:
+
+    def __init__(self, neighborhoods, user_index, sums, closed=False):
+        self.neighborhoods = neighborhoods
+        self.user_index = user_index
+        self.anchor_codes, indptr, indices = nbhd_arrays(neighborhoods, user_index)
+
+        # membership matrices: N (neighbors only) and, when closed is set (ranking tests), N u {uid}
+        self.membership = {'members': csr_membership(indptr, indices, len(user_index))}
+        if closed:
+            self.membership['closed'] = with_anchors(self.membership['members'], self.anchor_codes)
+        self.reverse = {kind: matrix.tocsc() for kind, matrix in self.membership.items()}
+
+        # sums is a dict of groups (e.g. 'pred'), each mapping statistic names to per-user arrays
+        self.sums = sums
+        self.totals = {group: total_sums(group_sums) for group, group_sums in sums.items()}
+        self.nbhd = {kind: {group: nbhd_sums(matrix, group_sums) for group, group_sums in sums.items()}
+                     for kind, matrix in self.membership.items()}
+
+    # codes of the given users, appending the users never seen before (they belong to no neighborhood)
+    def codes(self, uids):
+        codes, self.user_index = extend_users(self.user_index, uids)
+        n_users = len(self.user_index)
+        for group_sums in self.sums.values():
+            for name, values in group_sums.items():
+                if len(values) < n_users:
+                    group_sums[name] = np.concatenate([values, np.zeros(n_users - len(values))])
+
+        return codes
+
+    # replace the per-user sums of the changed users (new_sums holds their full new sums, aligned with users)
+    # returns the positions of the neighborhoods whose N sums changed (the changed user is the anchor or a neighbor)
+    def apply(self, group, users, new_sums):
+        group_sums = self.sums[group]
+        delta = {name: new_sums[name] - group_sums[name][users] for name in group_sums}
+        for name in group_sums:
+            group_sums[name][users] = new_sums[name]
+            self.totals[group][name] += delta[name].sum()
+
+        # only the columns of the changed users are read from the reverse neighbor lists
+        in_nbhds = users < self.membership['members'].shape[1]
+        affected = [np.flatnonzero(np.isin(self.anchor_codes, users))]
+        for kind, reverse in self.reverse.items():
+            sub = reverse[:, users[in_nbhds]]
+            touched = np.unique(sub.indices)
+            affected.append(touched)
+            for name in group_sums:
+                self.nbhd[kind][group][name][touched] += (sub @ delta[name][in_nbhds])[touched]
+
+        return np.unique(np.concatenate(affected))
+
+    # full new sums of the changed users from their new rows (users listed only in removed get zeros)
+    def changed_sums(self, row_codes, removed, make_sums):
+        users, inverse = np.unique(np.concatenate([row_codes, self.codes(list(removed))]), return_inverse=True)
+        new_sums = make_sums(inverse[:len(row_codes)], len(users))
+
+        return users, new_sums
+
+    def anchor_sums(self, group):
+        return {name: values[self.anchor_codes] for name, values in self.sums[group].items()}
+
+
+# state of critical_nbhds_accuracy that can be updated with the new predictions of the changed users
+class IncrementalCriticalAccuracy(IncrementalState):
+
+    def __init__(self, neighborhoods, predictions_df, p_thresh=0.5):
+        codes, user_index = encode_users(neighborhoods, predictions_df['uid'])
+        super().__init__(neighborhoods, user_index,
+                         {'pred': accuracy_user_sums(codes, len(user_index), predictions_df)})
+        self.p_thresh = p_thresh
+
+    # changed_predictions_df holds all the new predictions of the changed users, removed lists users left without any
+    # returns the positions of the neighborhoods whose N sums changed
+    def update(self, changed_predictions_df, removed=()):
+        row_codes = self.codes(changed_predictions_df['uid'])
+        users, new_sums = self.changed_sums(
+            row_codes, removed, lambda codes, n: accuracy_user_sums(codes, n, changed_predictions_df))
+
+        return self.apply('pred', users, new_sums)
+
+    # tests of every neighborhood, D' depends on the global totals
+    def result(self):
+        columns = accuracy_tests(self.nbhd['members']['pred'], self.anchor_sums('pred'), self.totals['pred'])
+
+        return accuracy_frame(self.neighborhoods, columns, self.p_thresh)
+
+
+# state of get_critical_nbhds that can be updated with the new predictions/precisions/recalls of the changed users
+class IncrementalCriticalRankings(IncrementalState):
+
+    def __init__(self, neighborhoods, predictions_df, precisions_df, recalls_df, p_thresh=0.5):
+        codes, user_index = encode_users(neighborhoods, predictions_df['uid'])
+        prec_codes, user_index = extend_users(user_index, precisions_df['user_id'])
+        recall_codes, user_index = extend_users(user_index, recalls_df['user_id'])
+        n_users = len(user_index)
+
+        super().__init__(neighborhoods, user_index, {
+            'pred': prediction_user_sums(codes, n_users, predictions_df),
+            'prec': metric_user_sums(prec_codes, n_users, precisions_df, 'precision'),
+            'recall': metric_user_sums(recall_codes, n_users, recalls_df, 'recall')
+        }, closed=True)
+        self.p_thresh = p_thresh
+
+    # each frame holds all the new rows of its changed users, removed lists users left without any row
+    # removed only applies to the frames that are passed: a user removed along with changed predictions alone keeps
+    # its precision and recall, pass an empty frame (e.g. precisions_df.iloc[:0]) to drop the rows of another group
+    # returns the positions of the neighborhoods whose N sums changed
+    def update(self, changed_predictions_df=None, precisions_df=None, recalls_df=None, removed=()):
+        affected = [np.zeros(0, dtype=np.int64)]
+
+        if changed_predictions_df is not None:
+            users, new_sums = self.changed_sums(
+                self.codes(changed_predictions_df['uid']), removed,
+                lambda codes, n: prediction_user_sums(codes, n, changed_predictions_df))
+            affected.append(self.apply('pred', users, new_sums))
+
+        for group, metric_df, column in [('prec', precisions_df, 'precision'), ('recall', recalls_df, 'recall')]:
+            if metric_df is not None:
+                users, new_sums = self.changed_sums(
+                    self.codes(metric_df['user_id']), removed,
+                    lambda codes, n: metric_user_sums(codes, n, metric_df, column))
+                affected.append(self.apply(group, users, new_sums))
+
+        return np.unique(np.concatenate(affected))
+
+    # tests of every neighborhood, D' depends on the global totals
+    def result(self):
+        anchors = {group: self.anchor_sums(group) for group in self.sums}
+        columns = ranking_tests(self.nbhd['members'], self.nbhd['closed'], anchors, self.totals)
+
+        return ranking_frame(self.neighborhoods, columns, self.p_thresh)
+
+
+def metric_user_sums(codes, n_users, metric_df, column):
+    return user_sums(codes, n_users, value=np.asarray(metric_df[column], dtype=np.float64))
@@ -0,0 +1,134 @@
+# sufficient-statistics engine shared by the critical neighborhood evaluators
+# every prediction row is mapped to a dense user code once and the per-user sums are aggregated with bincount,
+# the neighborhood (N) and complement (D') sums are then derived from a sparse neighborhood x user membership matrix
+
+from itertools import chain
+from scipy import sparse, stats
+import pandas as pd
+import numpy as np
+
+
+# map the uid column of the predictions to dense codes
+# users that only appear as anchors or neighbors are appended after the ones seen in the predictions
+# an already coded (categorical) column is used as is, its categories becoming the first users of the index
+def encode_users(neighborhoods, uids):
+    codes, user_index = factorize_users(uids)
+
+    nbhd_users = pd.Index(pd.unique(pd.Series(
+        list(neighborhoods.keys()) + list(chain.from_iterable(neighborhoods.values())), dtype=object)))
+    missing = nbhd_users[~nbhd_users.isin(user_index)]
+    if len(missing):
+        user_index = user_index.append(missing)
+
+    return codes, user_index
+
+
+# dense codes of another user column (e.g. the user_id of a metrics frame), unseen users are appended to the index
+def extend_users(user_index, uids):
+    codes, uniques = factorize_users(uids)
+    missing = uniques[~uniques.isin(user_index)]
+    if len(missing):
+        user_index = user_index.append(missing)
+
+    return user_index.get_indexer(uniques).astype(np.int64)[codes], user_index
+
+
+def factorize_users(uids):
+    uids = uids if isinstance(uids, pd.Series) else pd.Series(uids)
+    if isinstance(uids.dtype, pd.CategoricalDtype):
+        return uids.cat.codes.to_numpy().astype(np.int64), pd.Index(uids.cat.categories)
+
+    codes, uniques = pd.factorize(uids)
+
+    return codes.astype(np.int64), pd.Index(uniques)
+
+
+# CSR-style view of the neighborhoods: dense anchor codes plus (indptr, indices) of the neighbor codes
+def nbhd_arrays(neighborhoods, user_index):
+    anchors = list(neighborhoods.keys())
+    lengths = np.fromiter((len(nbhd) for nbhd in neighborhoods.values()), dtype=np.int64, count=len(anchors))
+
+    indptr = np.zeros(len(anchors) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=indptr[1:])
+    indices = user_index.get_indexer(list(chain.from_iterable(neighborhoods.values()))).astype(np.int64)
+    anchor_codes = user_index.get_indexer(anchors).astype(np.int64)
+
+    return anchor_codes, indptr, indices
+
+
+# binary (neighborhoods x users) matrix built from (indptr, indices), row i flags the members of the i-th neighborhood
+# duplicated neighbors are flagged once, in line with the isin() semantics of the loop implementations
+def csr_membership(indptr, indices, n_users):
+    membership = sparse.csr_matrix(
+        (np.ones(len(indices)), indices, indptr), shape=(len(indptr) - 1, n_users))
+    membership.sum_duplicates()
+    membership.data[:] = 1
+
+    return membership
+
+
+def membership_matrix(neighborhoods, user_index):
+    anchor_codes, indptr, indices = nbhd_arrays(neighborhoods, user_index)
+
+    return csr_membership(indptr, indices, len(user_index)), anchor_codes
+
+
+# same as the membership matrix with the anchor user of every row flagged as well (N u {uid})
+def with_anchors(membership, anchor_codes):
+    anchors = sparse.csr_matrix(
+        (np.ones(len(anchor_codes)), (np.arange(len(anchor_codes)), anchor_codes)), shape=membership.shape)
+    closed = (membership + anchors).tocsr()
+    closed.data[:] = 1
+
+    return closed
+
+
+# per-user sums of every column (plus the prediction count) given the dense user code of each row
+def user_sums(codes, n_users, **columns):
+    sums = {'count': np.bincount(codes, minlength=n_users).astype(np.float64)}
+    for name, values in columns.items():
+        sums[name] = np.bincount(codes, weights=np.asarray(values, dtype=np.float64), minlength=n_users)
+
+    return sums
+
+
+# aggregate the per-user sums over the rows of a membership matrix, one sparse product per statistic
+def nbhd_sums(membership, sums):
+    return {name: membership @ values for name, values in sums.items()}
+
+
+def total_sums(sums):
+    return {name: values.sum() for name, values in sums.items()}
+
+
+# sample mean and (ddof=1) variance from the count, sum and sum of squares
+def mean_var(n, total, total_sq):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = total / n
+        var = (total_sq - n * mean**2) / (n - 1)
+
+    return mean, np.maximum(var, 0)
+
+
+# batched Welch's t-test from the (n, mean, var) arrays of both samples, one entry per neighborhood
+# equivalent to stats.ttest_ind(a, b, equal_var=False) without materializing a or b
+def welch_ttest(n1, mean1, var1, n2, mean2, var2):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        se1 = var1 / n1
+        se2 = var2 / n2
+        t = (mean1 - mean2) / np.sqrt(se1 + se2)
+        # Welch-Satterthwaite degrees of freedom, 1 when undefined (both variances 0) as in scipy
+        df = (se1 + se2)**2 / (se1**2 / (n1 - 1) + se2**2 / (n2 - 1))
+        df = np.where(np.isnan(df), 1, df)
+        pvalue = 2 * stats.t.sf(np.abs(t), df)
+
+    return t, df, pvalue
+
+
+# Welch's t-test p-values between two groups of summed predictions (dicts holding count, est and est_sq)
+def welch_from_sums(sums_1, sums_2):
+    mean_1, var_1 = mean_var(sums_1['count'], sums_1['est'], sums_1['est_sq'])
+    mean_2, var_2 = mean_var(sums_2['count'], sums_2['est'], sums_2['est_sq'])
+    _, _, pvalue = welch_ttest(sums_1['count'], mean_1, var_1, sums_2['count'], mean_2, var_2)
+
+    return pvalue
@@ -3,11 +3,23 @@ import pandas as pd
 from scipy import stats
 from math import sqrt
 from collections import defaultdict
+from neighborhood_eval.nbhd_stats import encode_users, nbhd_arrays, csr_membership, membership_matrix, user_sums, \
+    nbhd_sums, total_sums, welch_from_sums
+from neighborhood_eval.parallel import run_sharded, load_shared, slice_nbhds
+from neighborhood_eval.resampling import bootstrap_pvalues
+from util.instrumentation import stage
 
 
 # Function that returns the critical neighborhoods, suitable prediction-based algorithms
 # p-threshold for the t-test, ref: https://docs.scipy.org/doc/scipy/reference/generated/scipy.stats.ttest_ind.html
-def critical_nbhds_accuracy(neighborhoods, predictions_df, p_thresh=0.5):
+# runs the vectorized engine, n_jobs > 1 shards it across a process pool
+def critical_nbhds_accuracy(neighborhoods, predictions_df, p_thresh=0.5, n_jobs=1):
+    return critical_nbhds_accuracy_vectorized(neighborhoods, predictions_df, p_thresh, n_jobs)
+
+
+# original per-neighborhood loop (pandas filters and scipy's Welch's t-test), kept as the reference of the vectorized
+# engine in the tests and benchmarks
+def _critical_nbhds_accuracy_loop(neighborhoods, predictions_df, p_thresh=0.5):
     critical_nbhds_test_1 = defaultdict(list)  # mse positive
     critical_nbhds_test_2 = defaultdict(list)  # whelch's t-test
 
@@ -79,6 +91,135 @@ def critical_nbhds_accuracy(neighborhoods, predictions_df, p_thresh=0.5):
     return critical_nbhds_final_df
 
 
+# vectorized engine of critical_nbhds_accuracy, returns the same critical_nbhds_final_df
+# the predictions are scanned once to build per-user sufficient statistics, N and D' are then derived for all
+# the neighborhoods at once from a sparse membership matrix instead of filtering predictions_df per user
+def critical_nbhds_accuracy_vectorized(neighborhoods, predictions_df, p_thresh=0.5, n_jobs=1):
+    # rows are counted on the codes, len() of the columns dict of predict_columnar is its number of columns
+    with stage('user_sums') as record:
+        codes, user_index = encode_users(neighborhoods, predictions_df['uid'])
+        record['rows'] = len(codes)
+        sums = accuracy_user_sums(codes, len(user_index), predictions_df)
+
+    return critical_nbhds_from_sums(neighborhoods, user_index, sums, p_thresh, n_jobs)
+
+
+# critical_nbhds_accuracy with a bootstrap test in place of the Welch's t-test for test-2
+# the bootstrap p-values (pvalue) and the Welch's ones (pvalue_welch) are returned alongside the usual columns
+def critical_nbhds_accuracy_bootstrap(neighborhoods, predictions_df, p_thresh=0.5, n_resamples=1000, seed=None,
+                                      memory_mb=256):
+    codes, user_index = encode_users(neighborhoods, predictions_df['uid'])
+    sums = accuracy_user_sums(codes, len(user_index), predictions_df)
+    membership, anchor_codes = membership_matrix(neighborhoods, user_index)
+    members = nbhd_sums(membership, sums)
+    totals = total_sums(sums)
+
+    columns = accuracy_tests(members, {name: values[anchor_codes] for name, values in sums.items()}, totals)
+    columns['pvalue_welch'] = columns['pvalue']
+
+    # mean estimate in N (user + neighbors) minus the mean estimate in D' (all but the neighbors)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        observed = (members['est'] + sums['est'][anchor_codes]) / columns['nbhd_size'] - \
+            (totals['est'] - members['est']) / columns['equiv_size']
+    columns['pvalue'] = bootstrap_pvalues(predictions_df['est'], columns['nbhd_size'].astype(np.int64), observed,
+                                          n_resamples, seed, memory_mb, columns['equiv_size'].astype(np.int64))
+
+    return critical_nbhds_frame(neighborhoods, columns, p_thresh)
+
+
+# per-user sufficient statistics of the predictions: count, loss, est, est^2, err, |err| and err^2
+def accuracy_user_sums(codes, n_users, predictions_df):
+    est = np.asarray(predictions_df['est'], dtype=np.float64)
+    err = np.asarray(predictions_df['r_ui'], dtype=np.float64) - est
+
+    return user_sums(
+        codes, n_users,
+        loss=np.asarray(predictions_df['prediction_loss'], dtype=np.float64),
+        est=est, est_sq=est**2,
+        err=err, abs_err=np.abs(err), err_sq=err**2)
+
+
+# run test-1 and test-2 for every neighborhood given the per-user sums (indexed by the codes of user_index)
+# with n_jobs > 1 the neighborhoods are sharded across a process pool, the merged result does not depend on n_jobs
+def critical_nbhds_from_sums(neighborhoods, user_index, sums, p_thresh=0.5, n_jobs=1):
+    anchor_codes, indptr, indices = nbhd_arrays(neighborhoods, user_index)
+    totals = total_sums(sums)
+
+    with stage('critical_tests', rows=len(anchor_codes), n_jobs=n_jobs):
+        if n_jobs > 1 and len(anchor_codes):
+            arrays = dict(sums, anchor_codes=anchor_codes, indptr=indptr, indices=indices)
+            columns = run_sharded(_accuracy_shard, arrays, len(anchor_codes), n_jobs, totals)
+        else:
+            columns = accuracy_columns(csr_membership(indptr, indices, len(user_index)), anchor_codes, sums, totals)
+
+    return critical_nbhds_frame(neighborhoods, columns, p_thresh)
+
+
+# N and D' statistics of the neighborhoods in the rows of the membership matrix
+def accuracy_columns(membership, anchor_codes, sums, totals):
+    members = nbhd_sums(membership, sums)
+
+    return accuracy_tests(members, {name: values[anchor_codes] for name, values in sums.items()}, totals)
+
+
+# N and D' statistics from the sums over the neighbors (members), over the anchor users and the global totals
+def accuracy_tests(members, anchors, totals):
+    # N holds the predictions of the user and its neighbors, D' all the predictions outside the neighbors
+    nbhd = {name: members[name] + anchors[name] for name in members}
+    equiv = {name: totals[name] - members[name] for name in members}
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return {
+            'loss_diff': nbhd['loss'] / nbhd['count'] - equiv['loss'] / equiv['count'],
+            'pvalue': welch_from_sums(nbhd, equiv),
+            'nbhd_size': nbhd['count'],
+            'equiv_size': equiv['count'],
+            'mse_nbhd': nbhd['err_sq'] / nbhd['count'],
+            'mse_equiv': equiv['err_sq'] / equiv['count'],
+            'mae_nbhd': nbhd['abs_err'] / nbhd['count'],
+            'mae_equiv': equiv['abs_err'] / equiv['count']
+        }
+
+
+# process-pool task: accuracy columns of the neighborhoods in [start, stop) read from the memory-mapped arrays
+def _accuracy_shard(paths, start, stop, totals):
+    arrays = load_shared(paths)
+    indptr, indices = slice_nbhds(arrays['indptr'], arrays['indices'], start, stop)
+    sums = {name: arrays[name] for name in totals}
+    membership = csr_membership(indptr, indices, len(sums['count']))
+
+    return accuracy_columns(membership, np.asarray(arrays['anchor_codes'][start:stop]), sums, totals)
+
+
+# apply test-1 (loss in N higher than in D') and test-2 (Welch's t-test) and build critical_nbhds_final_df
+def critical_nbhds_frame(neighborhoods, columns, p_thresh):
+    test_1 = columns['loss_diff'] > 0
+    test_2 = test_1 & (columns['pvalue'] > p_thresh)
+
+    anchors = list(neighborhoods.keys())
+    critical_nbhds_test_1 = {anchors[i]: neighborhoods[anchors[i]] for i in np.flatnonzero(test_1)}
+    passed = np.flatnonzero(test_2)
+
+    critical_nbhds_final_df = pd.DataFrame({
+        'uid': [anchors[i] for i in passed],
+        'nbhd': [neighborhoods[anchors[i]] for i in passed],
+        'nbhd_size': columns['nbhd_size'][passed].astype(np.int64),
+        'equiv_size': columns['equiv_size'][passed].astype(np.int64),
+        'mse_nbhd': columns['mse_nbhd'][passed],
+        'mse_equiv': columns['mse_equiv'][passed],
+        'mae_nbhd': columns['mae_nbhd'][passed],
+        'mae_equiv': columns['mae_equiv'][passed],
+        'rmse_nbhd': np.sqrt(columns['mse_nbhd'][passed]),
+        'rmse_equiv': np.sqrt(columns['mse_equiv'][passed])
+    })
+    if 'pvalue_welch' in columns:
+        critical_nbhds_final_df['pvalue'] = columns['pvalue'][passed]
+        critical_nbhds_final_df['pvalue_welch'] = columns['pvalue_welch'][passed]
+    critical_nbhd_stats(critical_nbhds_test_1, critical_nbhds_final_df, neighborhoods)
+
+    return critical_nbhds_final_df
+
+
 def critical_nbhd_stats(critical_nbhds_test_1, critical_nbhds, neighborhoods):
     print('total nbhds - test1:', len(critical_nbhds_test_1))
     print('total nbhds - test2:', len(critical_nbhds))
@@ -1,9 +1,21 @@
 from collections import defaultdict
 from scipy import stats
+from neighborhood_eval.nbhd_stats import encode_users, extend_users, nbhd_arrays, csr_membership, with_anchors, \
+    user_sums, nbhd_sums, total_sums, welch_from_sums
+from neighborhood_eval.parallel import run_sharded, load_shared, slice_nbhds
+from util.instrumentation import stage
 import pandas as pd
+import numpy as np
 
 
-def get_critical_nbhds(neighborhoods, predictions_df, precisions_df, recalls_df, p_thresh=0.5):
+# runs the vectorized engine, n_jobs > 1 shards it across a process pool
+def get_critical_nbhds(neighborhoods, predictions_df, precisions_df, recalls_df, p_thresh=0.5, n_jobs=1):
+    return get_critical_nbhds_vectorized(neighborhoods, predictions_df, precisions_df, recalls_df, p_thresh, n_jobs)
+
+
+# original per-neighborhood loop (pandas filters and scipy's Welch's t-test), kept as the reference of the vectorized
+# engine in the tests and benchmarks
+def _get_critical_nbhds_loop(neighborhoods, predictions_df, precisions_df, recalls_df, p_thresh=0.5):
     critical_nbhds_test_1 = defaultdict(list)
     critical_nbhds_test_2 = defaultdict(list)
 
@@ -75,74 +87,194 @@ def get_critical_nbhds(neighborhoods, predictions_df, precisions_df, recalls_df,
     return critical_nbhds_final_df
 
 
-def precision_recall_at_k(predictions, k=10, threshold=3.5):
-    """Return precision and recall at k metrics for each user"""
+# vectorized engine of get_critical_nbhds, returns the same frame and prints the same percentage
+# precision, recall and prediction statistics are indexed by dense user code, N and D' values of every
+# neighborhood then come from one sparse matrix-vector product per statistic
+def get_critical_nbhds_vectorized(neighborhoods, predictions_df, precisions_df, recalls_df, p_thresh=0.5, n_jobs=1):
+    # rows are counted on the codes, len() of the columns dict of predict_columnar is its number of columns
+    with stage('user_sums') as record:
+        codes, user_index = encode_users(neighborhoods, predictions_df['uid'])
+        record['rows'] = len(codes)
+        prec_codes, user_index = extend_users(user_index, precisions_df['user_id'])
+        recall_codes, user_index = extend_users(user_index, recalls_df['user_id'])
+        n_users = len(user_index)
+
+        pred_sums = prediction_user_sums(codes, n_users, predictions_df)
+        prec_sums = user_sums(prec_codes, n_users, value=np.asarray(precisions_df['precision'], dtype=np.float64))
+        recall_sums = user_sums(recall_codes, n_users, value=np.asarray(recalls_df['recall'], dtype=np.float64))
+
+    return critical_nbhds_from_sums(neighborhoods, user_index, pred_sums, prec_sums, recall_sums, p_thresh, n_jobs)
+
+
+# per-user count, sum and sum of squares of the predictions, used by the Welch's t-test
+def prediction_user_sums(codes, n_users, predictions_df):
+    est = np.asarray(predictions_df['est'], dtype=np.float64)
+
+    return user_sums(codes, n_users, est=est, est_sq=est**2)
+
+
+# run the ranking tests for every neighborhood given the per-user sums (indexed by the codes of user_index)
+# pred_sums holds count/est/est_sq of the predictions, prec_sums and recall_sums hold count/value of the metrics
+# with n_jobs > 1 the neighborhoods are sharded across a process pool, the merged result does not depend on n_jobs
+def critical_nbhds_from_sums(neighborhoods, user_index, pred_sums, prec_sums, recall_sums, p_thresh=0.5, n_jobs=1):
+    anchor_codes, indptr, indices = nbhd_arrays(neighborhoods, user_index)
+    sums = {'pred': pred_sums, 'prec': prec_sums, 'recall': recall_sums}
+    totals = {group: total_sums(group_sums) for group, group_sums in sums.items()}
+
+    with stage('critical_tests', rows=len(anchor_codes), n_jobs=n_jobs):
+        if n_jobs > 1 and len(anchor_codes):
+            arrays = {group + '_' + name: values for group, group_sums in sums.items()
+                      for name, values in group_sums.items()}
+            arrays.update(anchor_codes=anchor_codes, indptr=indptr, indices=indices)
+            columns = run_sharded(_ranking_shard, arrays, len(anchor_codes), n_jobs, totals)
+        else:
+            membership = csr_membership(indptr, indices, len(user_index))
+            columns = ranking_columns(membership, anchor_codes, sums, totals)
+
+    return critical_nbhds_frame(neighborhoods, columns, p_thresh)
+
+
+# apply test-2 (Welch's t-test) and build critical_nbhds_final_df
+def critical_nbhds_frame(neighborhoods, columns, p_thresh):
+    passed = np.flatnonzero(columns['pvalue'] > p_thresh)
+
+    anchors = list(neighborhoods.keys())
+    critical_nbhds_final_df = pd.DataFrame({
+        'uid': [anchors[i] for i in passed],
+        'nbhd': [neighborhoods[anchors[i]] for i in passed],
+        'nbhd_size': columns['nbhd_size'][passed].astype(np.int64),
+        'equiv_size': columns['equiv_size'][passed].astype(np.int64),
+        'precision_nbhd': columns['precision_nbhd'][passed],
+        'precision_equiv': columns['precision_equiv'][passed],
+        'recall_nbhd': columns['recall_nbhd'][passed],
+        'recall_equiv': columns['recall_equiv'][passed],
+        'f1_nbhd': columns['f1_nbhd'][passed],
+        'f1_equiv': columns['f1_equiv'][passed]
+    })
 
-    # First map the predictions to each user.
-    user_est_true = defaultdict(list)
-    for uid, _, true_r, est, _ in predictions:
-        user_est_true[uid].append((est, true_r))
+    print('Percentage of critical neighborhoods:', round(len(critical_nbhds_final_df) / len(neighborhoods) * 100, 2))
 
-    precisions = dict()
-    recalls = dict()
-    for uid, user_ratings in user_est_true.items():
+    return critical_nbhds_final_df
 
-        # Sort user ratings by estimated value
-        user_ratings.sort(key=lambda x: x[0], reverse=True)
 
-        # Number of relevant items
-        n_rel = sum((true_r >= threshold) for (_, true_r) in user_ratings)
+# N and D' metrics of the neighborhoods in the rows of the membership matrix
+# sums and totals map 'pred', 'prec' and 'recall' to the per-user sums and global totals of each group
+def ranking_columns(membership, anchor_codes, sums, totals):
+    closed = with_anchors(membership, anchor_codes)
+    members = {group: nbhd_sums(membership, group_sums) for group, group_sums in sums.items()}
+    outside = {group: nbhd_sums(closed, group_sums) for group, group_sums in sums.items()}
+    anchors = {group: {name: values[anchor_codes] for name, values in group_sums.items()}
+               for group, group_sums in sums.items()}
 
-        # Number of recommended items in top k
-        n_rec_k = sum((est >= threshold) for (est, _) in user_ratings[:k])
+    return ranking_tests(members, outside, anchors, totals)
 
-        # Number of relevant and recommended items in top k
-        n_rel_and_rec_k = sum(((true_r >= threshold) and (est >= threshold)) for (est, true_r) in user_ratings[:k])
 
-        # Precision@K: Proportion of recommended items that are relevant
-        # When n_rec_k is 0, Precision is undefined. We here set it to 0.
+# N and D' metrics from the per-group sums over the neighbors (members), over the neighbors and the anchor user
+# (closed), over the anchor users alone and the global totals
+def ranking_tests(members, closed, anchors, totals):
+
+    # metrics are averaged over the user and its neighbors in N, and over the remaining users in D'
+    def metric_values(group):
+        value_n = (members[group]['value'] + anchors[group]['value']) / \
+            (members[group]['count'] + anchors[group]['count'])
+        value_equiv = (totals[group]['value'] - closed[group]['value']) / \
+            (totals[group]['count'] - closed[group]['count'])
+
+        return value_n, value_equiv
+
+    # test-2 - Welch's t-test on the predictions of the neighbors and D'
+    pred_nbhd = members['pred']
+    pred_equiv = {name: totals['pred'][name] - closed['pred'][name] for name in pred_nbhd}
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        prec_n, prec_equiv = metric_values('prec')
+        recall_n, recall_equiv = metric_values('recall')
+
+        return {
+            'pvalue': welch_from_sums(pred_nbhd, pred_equiv),
+            'nbhd_size': pred_nbhd['count'],
+            'equiv_size': pred_equiv['count'],
+            'precision_nbhd': prec_n,
+            'precision_equiv': prec_equiv,
+            'recall_nbhd': recall_n,
+            'recall_equiv': recall_equiv,
+            'f1_nbhd': (2 * prec_n * recall_n) / (prec_n + recall_n),
+            'f1_equiv': (2 * prec_equiv * recall_equiv) / (prec_equiv + recall_equiv)
+        }
 
-        precisions[uid] = n_rel_and_rec_k / n_rec_k if n_rec_k != 0 else 0
 
-        # Recall@K: Proportion of relevant items that are recommended
-        # When n_rel is 0, Recall is undefined. We here set it to 0.
+# process-pool task: ranking columns of the neighborhoods in [start, stop) read from the memory-mapped arrays
+def _ranking_shard(paths, start, stop, totals):
+    arrays = load_shared(paths)
+    indptr, indices = slice_nbhds(arrays['indptr'], arrays['indices'], start, stop)
+    sums = {group: {name: arrays[group + '_' + name] for name in group_totals}
+            for group, group_totals in totals.items()}
+    membership = csr_membership(indptr, indices, len(sums['pred']['count']))
 
-        recalls[uid] = n_rel_and_rec_k / n_rel if n_rel != 0 else 0
+    return ranking_columns(membership, np.asarray(arrays['anchor_codes'][start:stop]), sums, totals)
+
+
+def precision_recall_at_k(predictions, k=10, threshold=3.5):
+    """Return precision and recall at k metrics for each user"""
+
+    # map the predictions to columns, users are coded in order of appearance
+    uids, _, true_r, est, _ = zip(*predictions) if len(predictions) else ((), (), (), (), ())
+    user_codes, users = pd.factorize(pd.Series(uids, dtype=object))
+
+    metrics = precision_recall_at_ks(user_codes, np.asarray(est, dtype=np.float64),
+                                     np.asarray(true_r, dtype=np.float64), [k], threshold)
+
+    precisions = dict(zip(users, metrics['precision@' + str(k)].tolist()))
+    recalls = dict(zip(users, metrics['recall@' + str(k)].tolist()))
 
     return precisions, recalls
 
 
 def precision_recall_at_k_dfs(predictions, k=10, threshold=3.5):
 
-    users = list(set(predictions.userID.to_list()))
-    precisions = dict()
-    recalls = dict()
+    user_codes, users = pd.factorize(predictions['userID'])
+    metrics = precision_recall_at_ks(user_codes, np.asarray(predictions['prediction'], dtype=np.float64),
+                                     np.asarray(predictions['rating'], dtype=np.float64), [k], threshold)
+    metrics.index = users
 
-    for uid in users:
-        user_df = predictions[predictions['userID'] == uid]
-        user_df_sorted = user_df.sort_values(by=['prediction'], ascending=False)
-        user_predictions = user_df_sorted.prediction.to_list()
-        user_real_ratings = user_df_sorted.rating.to_list()
+    # same user order as the set the metrics used to be computed over
+    order = list(set(predictions.userID.to_list()))
+    precisions = dict(zip(order, metrics['precision@' + str(k)].loc[order].tolist()))
+    recalls = dict(zip(order, metrics['recall@' + str(k)].loc[order].tolist()))
 
-        user_ratings = list(zip(user_predictions, user_real_ratings))
+    return precisions, recalls
 
-        # Number of relevant items
-        n_rel = sum((true_r >= threshold) for (_, true_r) in user_ratings)
 
-        # Number of recommended items in top k
-        n_rec_k = sum((est >= threshold) for (est, _) in user_ratings[:k])
+# columnar precision and recall at several k values for all users in one pass
+# the rows are sorted once by (user, -est), ties keep their input order like the stable list sort
+# returns a frame indexed by user code with n_rel and a precision@k / recall@k column pair per k
+def precision_recall_at_ks(user_codes, est, true_r, ks=(10,), threshold=3.5):
+    user_codes = np.asarray(user_codes, dtype=np.int64)
+    n_users = user_codes.max(initial=-1) + 1
 
-        # Number of relevant and recommended items in top k
-        n_rel_and_rec_k = sum(((true_r >= threshold) and (est >= threshold)) for (est, true_r) in user_ratings[:k])
+    order = np.lexsort((np.arange(len(user_codes)), -est, user_codes))
+    users = user_codes[order]
+    rel = true_r[order] >= threshold
+    rec = est[order] >= threshold
 
-        # Precision@K: Proportion of recommended items that are relevant
-        # When n_rec_k is 0, Precision is undefined. We here set it to 0.
+    # rank of every row within its user
+    counts = np.bincount(users, minlength=n_users)
+    rank = np.arange(len(users)) - np.repeat(np.cumsum(counts) - counts, counts)
 
-        precisions[uid] = n_rel_and_rec_k / n_rec_k if n_rec_k != 0 else 0
+    # Number of relevant items
+    n_rel = np.bincount(users, weights=rel, minlength=n_users)
+    metrics = {'n_rel': n_rel.astype(np.int64)}
 
-        # Recall@K: Proportion of relevant items that are recommended
-        # When n_rel is 0, Recall is undefined. We here set it to 0.
+    for k in ks:
+        top = rank < k
+        # Number of recommended items in top k
+        n_rec_k = np.bincount(users[top], weights=rec[top], minlength=n_users)
+        # Number of relevant and recommended items in top k
+        n_rel_and_rec_k = np.bincount(users[top], weights=(rel & rec)[top], minlength=n_users)
 
-        recalls[uid] = n_rel_and_rec_k / n_rel if n_rel != 0 else 0
+        # Precision@K and Recall@K, set to 0 when undefined (n_rec_k or n_rel is 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            metrics['precision@' + str(k)] = np.where(n_rec_k != 0, n_rel_and_rec_k / n_rec_k, 0)
+            metrics['recall@' + str(k)] = np.where(n_rel != 0, n_rel_and_rec_k / n_rel, 0)
 
-    return precisions, recalls
+    return pd.DataFrame(metrics)
@@ -0,0 +1,141 @@
+# out-of-core critical neighborhood evaluation over chunked prediction files
+# the predictions are read one shard at a time (.npy columns or Parquet files), every shard only updates the per-user
+# sufficient statistics, so memory stays proportional to the number of users instead of the number of predictions;
+# the neighborhood and complement tests then run from those aggregates like in the vectorized engines
+
+from neighborhood_eval.nbhd_stats import extend_users, user_sums
+from neighborhood_eval.neighborhood_accuracy import accuracy_user_sums, critical_nbhds_from_sums as accuracy_from_sums
+from neighborhood_eval.neighborhood_rankings import prediction_user_sums, critical_nbhds_from_sums as \
+    rankings_from_sums
+from util.streaming import encode_chunk, chunk_path
+from util.instrumentation import stage
+from itertools import chain
+import pandas as pd
+import numpy as np
+import glob
+import json
+import os
+
+
+PREDICTION_COLUMNS = ['uid', 'r_ui', 'est', 'prediction_loss']
+
+
+# write predictions (a predictions_df or the columns of predict_columnar) as .npy shards of shard_size rows
+def write_prediction_shards(predictions, out_dir, shard_size=1000000):
+    os.makedirs(out_dir, exist_ok=True)
+    columns = {name: np.asarray(predictions[name]) for name in PREDICTION_COLUMNS if name in predictions}
+    # user ids are stored as int codes into an id table, so that every shard can be memory-mapped and the ids keep
+    # their type (ints held in an object column stay ints and still match the neighborhood keys)
+    codes, user_ids = pd.factorize(pd.Series(columns['uid']))
+    columns['uid'] = codes.astype(np.int64)
+    np.save(os.path.join(out_dir, 'user_ids.npy'), np.asarray(user_ids), allow_pickle=True)
+    n_rows = len(codes)
+
+    n_shards = 0
+    for start in range(0, n_rows, shard_size):
+        for name, values in columns.items():
+            np.save(chunk_path(out_dir, n_shards, name), values[start:start + shard_size])
+        n_shards += 1
+
+    with open(os.path.join(out_dir, 'meta.json'), 'w') as f:
+        json.dump({'chunks': n_shards, 'rows': n_rows, 'columns': list(columns), 'user_ids': True}, f)
+
+    return n_shards
+
+
+# the prediction shards one at a time, as dicts of columns
+# source is a directory of .npy shards (write_prediction_shards) or a Parquet file, directory or list of files
+# .npy shards hold uid codes, the id table they index is passed along as 'user_ids'
+def iter_prediction_shards(source):
+    if isinstance(source, str) and os.path.exists(os.path.join(source, 'meta.json')):
+        with open(os.path.join(source, 'meta.json')) as f:
+            meta = json.load(f)
+        user_ids = np.load(os.path.join(source, 'user_ids.npy'), allow_pickle=True) if meta.get('user_ids') else None
+        for shard in range(meta['chunks']):
+            columns = {name: np.load(chunk_path(source, shard, name), mmap_mode='r') for name in meta['columns']}
+            if user_ids is not None:
+                columns['user_ids'] = user_ids
+            yield columns
+        return
+
+    if isinstance(source, str):
+        paths = sorted(glob.glob(os.path.join(source, '*.parquet'))) if os.path.isdir(source) else [source]
+    else:
+        paths = list(source)
+
+    # Parquet shards need pyarrow or fastparquet, which pd.read_parquet asks for when missing
+    for path in paths:
+        shard = pd.read_parquet(path)
+        yield {name: shard[name].to_numpy() for name in PREDICTION_COLUMNS if name in shard.columns}
+
+
+# per-user sums accumulated over the shards, users are coded incrementally starting with the neighborhood users
+# raises when no prediction user is a neighborhood user (e.g. ids of another type), instead of finding no critical
+# neighborhoods
+def streamed_user_sums(neighborhoods, source, make_sums):
+    codes_dict = dict()
+    for uid in chain(neighborhoods.keys(), chain.from_iterable(neighborhoods.values())):
+        codes_dict.setdefault(uid, len(codes_dict))
+    n_nbhd_users = len(codes_dict)
+
+    sums = None
+    n_rows = 0
+    n_matched = 0
+    table_codes = None
+    for shard in iter_prediction_shards(source):
+        if 'prediction_loss' not in shard:
+            shard['prediction_loss'] = (np.asarray(shard['r_ui']) - np.asarray(shard['est']))**2
+        if 'user_ids' in shard:
+            # the id table is shared by every shard and encoded once
+            if table_codes is None:
+                table_codes = encode_chunk(pd.Series(shard['user_ids']), codes_dict)
+            codes = table_codes[np.asarray(shard['uid'])]
+        else:
+            codes = encode_chunk(pd.Series(np.asarray(shard['uid'])), codes_dict)
+        n_matched += np.count_nonzero(codes < n_nbhd_users)
+
+        shard_sums = make_sums(codes, len(codes_dict), shard)
+        if sums is None:
+            sums = shard_sums
+        else:
+            # users first seen in this shard extend the accumulated arrays
+            sums = {name: grow(sums[name], len(codes_dict)) + values for name, values in shard_sums.items()}
+        n_rows += len(codes)
+
+    if n_rows and n_nbhd_users and not n_matched:
+        raise ValueError('none of the prediction user ids match the neighborhood user ids')
+
+    user_index = pd.Index(list(codes_dict))
+    if sums is None:
+        empty = {name: np.zeros(0) for name in PREDICTION_COLUMNS}
+        sums = make_sums(np.zeros(0, dtype=np.int64), len(user_index), empty)
+
+    return user_index, {name: grow(values, len(user_index)) for name, values in sums.items()}, n_rows
+
+
+def grow(values, n):
+    return values if len(values) >= n else np.concatenate([values, np.zeros(n - len(values))])
+
+
+# critical_nbhds_accuracy over prediction shards that do not fit in memory
+def critical_nbhds_accuracy_out_of_core(neighborhoods, source, p_thresh=0.5, n_jobs=1):
+    with stage('user_sums_out_of_core') as record:
+        user_index, sums, record['rows'] = streamed_user_sums(neighborhoods, source, accuracy_user_sums)
+
+    return accuracy_from_sums(neighborhoods, user_index, sums, p_thresh, n_jobs)
+
+
+# get_critical_nbhds over prediction shards that do not fit in memory (the per-user metric frames are small)
+def get_critical_nbhds_out_of_core(neighborhoods, source, precisions_df, recalls_df, p_thresh=0.5, n_jobs=1):
+    with stage('user_sums_out_of_core') as record:
+        user_index, pred_sums, record['rows'] = streamed_user_sums(neighborhoods, source, prediction_user_sums)
+
+    prec_codes, user_index = extend_users(user_index, precisions_df['user_id'])
+    recall_codes, user_index = extend_users(user_index, recalls_df['user_id'])
+    n_users = len(user_index)
+
+    pred_sums = {name: grow(values, n_users) for name, values in pred_sums.items()}
+    prec_sums = user_sums(prec_codes, n_users, value=np.asarray(precisions_df['precision'], dtype=np.float64))
+    recall_sums = user_sums(recall_codes, n_users, value=np.asarray(recalls_df['recall'], dtype=np.float64))
+
+    return rankings_from_sums(neighborhoods, user_index, pred_sums, prec_sums, recall_sums, p_thresh, n_jobs)
@@ -0,0 +1,65 @@
+# process-pool sharding for the neighborhood evaluators
+# the input arrays are written once as .npy files and memory-mapped by every worker, so a task only pickles the
+# file paths and its shard bounds; shards are contiguous ranges of anchor users merged back in their original order,
+# which keeps the merged result identical whatever the number of workers
+
+from concurrent.futures import ProcessPoolExecutor
+import tempfile
+import shutil
+import os
+import numpy as np
+
+
+class SharedArrays:
+
+    def __init__(self, arrays):
+        self.arrays = arrays
+        self.paths = dict()
+        self.tmp_dir = None
+
+    def __enter__(self):
+        # publish each array once, workers open them read-only with np.load(mmap_mode='r')
+        self.tmp_dir = tempfile.mkdtemp(prefix='nbhd_eval_')
+        for name, values in self.arrays.items():
+            path = os.path.join(self.tmp_dir, name + '.npy')
+            np.save(path, np.ascontiguousarray(values))
+            self.paths[name] = path
+
+        return self.paths
+
+    def __exit__(self, *args):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+def load_shared(paths):
+    return {name: np.load(path, mmap_mode='r') for name, path in paths.items()}
+
+
+# split n_items into contiguous (start, stop) ranges, a few per worker to balance uneven neighborhoods
+def shard_bounds(n_items, n_jobs, shards_per_job=4):
+    n_shards = max(1, min(n_items, n_jobs * shards_per_job))
+    edges = np.linspace(0, n_items, n_shards + 1).astype(np.int64)
+
+    return [(int(start), int(stop)) for start, stop in zip(edges[:-1], edges[1:]) if stop > start]
+
+
+# run worker(paths, start, stop, *args) over all the shards and concatenate the returned dicts of arrays in shard order
+def run_sharded(worker, arrays, n_items, n_jobs, *args):
+    bounds = shard_bounds(n_items, n_jobs)
+
+    with SharedArrays(arrays) as paths:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            futures = [executor.submit(worker, paths, start, stop, *args) for start, stop in bounds]
+            parts = [future.result() for future in futures]
+
+    if not parts:
+        return dict()
+
+    return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+
+
+# (indptr, indices) of the neighborhoods in [start, stop), re-based so that the slice is a standalone CSR structure
+def slice_nbhds(indptr, indices, start, stop):
+    offset = indptr[start]
+
+    return np.asarray(indptr[start:stop + 1]) - offset, np.asarray(indices[offset:indptr[stop]])
@@ -0,0 +1,67 @@
+# non-parametric alternative to the Welch's t-test of the critical neighborhood evaluators
+# under the null hypothesis the predictions of a neighborhood are a random sample of all the predictions, so the
+# difference between the mean estimate in N and in D' is compared with the same difference for samples of the same
+# size drawn with replacement from the pooled estimates
+# D' is not drawn on its own: the observed D' is all the predictions minus those of the neighbors (the anchor user is
+# in both N and D'), so the D' of a resample is the pool minus the neighbor part of that resample, taken as its first
+# n_pool - |D'| draws (the draws are i.i.d., so any |N| - (n_pool - |D'|) of them stand for the anchor as well as the
+# last ones); N and D' then overlap and differ as in the observed test, and drawing the neighbor part with replacement
+# is the usual bootstrap approximation of the complement while N is small next to the pool
+# the resample index matrices of many neighborhoods are drawn at once with a numpy Generator, in blocks bounded by
+# memory_mb
+
+import numpy as np
+
+
+# two-sided bootstrap p-values of the observed mean differences (mean in N - mean in D'), one per neighborhood
+# values holds the pooled estimates, sizes the number of predictions in every N and rest_sizes the number in every
+# D' (the pool minus N by default)
+# results are reproducible for a given seed (an int or a numpy Generator) and memory_mb
+def bootstrap_pvalues(values, sizes, observed, n_resamples=1000, seed=None, memory_mb=256, rest_sizes=None):
+    rng = np.random.default_rng(seed)
+    values = np.asarray(values, dtype=np.float64)
+    sizes = np.asarray(sizes, dtype=np.int64)
+    observed = np.abs(np.asarray(observed, dtype=np.float64))
+    n_pool, total = len(values), values.sum()
+    rest_sizes = n_pool - sizes if rest_sizes is None else np.asarray(rest_sizes, dtype=np.int64)
+    # draws of the sample that are not in D'
+    excluded = n_pool - rest_sizes
+
+    exceed = np.zeros(len(sizes), dtype=np.int64)
+    pvalues = np.full(len(sizes), np.nan)
+    testable = np.flatnonzero((sizes > 0) & (rest_sizes > 0) & (excluded >= 0) & (excluded <= sizes) &
+                              np.isfinite(observed))
+
+    # neighborhoods of similar size share a block, so little of the (block, resamples, max size) matrix is padding
+    order = testable[np.argsort(sizes[testable], kind='stable')]
+    budget = max(1, int(memory_mb * 2**20) // 32)  # an int64 index, a float64 draw and two masked copies per cell
+    sorted_sizes = sizes[order]
+
+    start = 0
+    while start < len(order):
+        # largest block whose full (block, resamples, max size) matrix fits, the resamples are split otherwise
+        # sizes only grow, so the block holds at most max_cells // sizes[start] neighborhoods and only that window
+        # is searched
+        max_cells = budget // n_resamples
+        window = sorted_sizes[start:start + max_cells // sorted_sizes[start] + 1]
+        cells = np.arange(1, len(window) + 1) * window
+        block = order[start:start + max(1, np.searchsorted(cells, max_cells, side='right'))]
+        n_max = sizes[block[-1]]
+        resample_block = max(1, min(n_resamples, budget // (len(block) * n_max)))
+
+        for done in range(0, n_resamples, resample_block):
+            n_draws = min(resample_block, n_resamples - done)
+            draws = values[rng.integers(0, n_pool, size=(len(block), n_draws, n_max))]
+            # only the first sizes[i] draws of every row belong to the i-th neighborhood, and the first
+            # excluded[i] of them are left out of its D'
+            positions = np.arange(n_max)[None, None, :]
+            sample = np.where(positions < sizes[block][:, None, None], draws, 0).sum(axis=2)
+            left_out = np.where(positions < excluded[block][:, None, None], draws, 0).sum(axis=2)
+            diff = sample / sizes[block][:, None] - (total - left_out) / rest_sizes[block][:, None]
+            exceed[block] += (np.abs(diff) >= observed[block][:, None]).sum(axis=1)
+
+        start += len(block)
+
+    pvalues[testable] = (1 + exceed[testable]) / (1 + n_resamples)
+
+    return pvalues
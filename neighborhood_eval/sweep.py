@@ -0,0 +1,139 @@
+# neighborhood size and p-threshold sweeps from a single top-kmax extraction
+# the neighborhoods are extracted once at kmax = max(ks) (get_knn / get_knn_batched return every list sorted by
+# decreasing similarity), so the neighborhood of size k is the first k entries of each list; the per-user sufficient
+# statistics are gathered into a (neighborhoods x kmax) matrix and accumulated along the neighbors, every k is then
+# one column of the cumulative sums and every p_thresh one comparison on the same test columns
+
+from neighborhood_eval.nbhd_stats import encode_users, extend_users, nbhd_arrays, user_sums, total_sums
+from neighborhood_eval.neighborhood_accuracy import accuracy_user_sums, accuracy_tests
+from neighborhood_eval.neighborhood_rankings import prediction_user_sums, ranking_tests
+import pandas as pd
+import numpy as np
+
+
+# critical_nbhds_accuracy for every (k, p_thresh), one row per neighborhood with the test columns and the outcomes
+def critical_nbhds_accuracy_sweep(neighborhoods, predictions_df, ks=(5, 10, 20, 50), p_threshs=(0.5,)):
+    ks = sweep_ks(ks)
+    codes, user_index = encode_users(neighborhoods, predictions_df['uid'])
+    sums = accuracy_user_sums(codes, len(user_index), predictions_df)
+
+    anchor_codes, indptr, indices = nbhd_arrays(neighborhoods, user_index)
+    neighbors, _ = prefix_matrix(anchor_codes, indptr, indices, max(ks))
+    anchors = {name: values[anchor_codes] for name, values in sums.items()}
+    totals = total_sums(sums)
+
+    frames = []
+    for k, members in prefix_sums(neighbors, sums, ks).items():
+        columns = accuracy_tests(members, anchors, totals)
+        columns['rmse_nbhd'] = np.sqrt(columns['mse_nbhd'])
+        columns['rmse_equiv'] = np.sqrt(columns['mse_equiv'])
+        frames.append(sweep_frame(neighborhoods, k, columns, p_threshs, columns['loss_diff'] > 0))
+
+    return pd.concat(frames).set_index(['k', 'p_thresh', 'uid'])
+
+
+# get_critical_nbhds for every (k, p_thresh), one row per neighborhood with the test columns and the outcome
+def get_critical_nbhds_sweep(neighborhoods, predictions_df, precisions_df, recalls_df, ks=(5, 10, 20, 50),
+                             p_threshs=(0.5,)):
+    ks = sweep_ks(ks)
+    codes, user_index = encode_users(neighborhoods, predictions_df['uid'])
+    prec_codes, user_index = extend_users(user_index, precisions_df['user_id'])
+    recall_codes, user_index = extend_users(user_index, recalls_df['user_id'])
+    n_users = len(user_index)
+
+    sums = {
+        'pred': prediction_user_sums(codes, n_users, predictions_df),
+        'prec': user_sums(prec_codes, n_users, value=np.asarray(precisions_df['precision'], dtype=np.float64)),
+        'recall': user_sums(recall_codes, n_users, value=np.asarray(recalls_df['recall'], dtype=np.float64))
+    }
+
+    anchor_codes, indptr, indices = nbhd_arrays(neighborhoods, user_index)
+    neighbors, anchor_position = prefix_matrix(anchor_codes, indptr, indices, max(ks))
+    anchors = {group: {name: values[anchor_codes] for name, values in group_sums.items()}
+               for group, group_sums in sums.items()}
+    totals = {group: total_sums(group_sums) for group, group_sums in sums.items()}
+
+    group_prefixes = {group: prefix_sums(neighbors, group_sums, ks) for group, group_sums in sums.items()}
+
+    frames = []
+    for k in ks:
+        members = {group: prefixes[k] for group, prefixes in group_prefixes.items()}
+        # N u {uid}: the anchor is added unless it is already one of its first k neighbors
+        outside = (anchor_position >= k).astype(np.float64)
+        closed = {group: {name: members[group][name] + outside * anchors[group][name] for name in members[group]}
+                  for group in members}
+
+        columns = ranking_tests(members, closed, anchors, totals)
+        frames.append(sweep_frame(neighborhoods, k, columns, p_threshs))
+
+    return pd.concat(frames).set_index(['k', 'p_thresh', 'uid'])
+
+
+# the neighborhood sizes of a sweep, sorted and deduplicated, every k must be a positive int
+def sweep_ks(ks):
+    ks = list(ks)
+    if not ks or not all(isinstance(k, (int, np.integer)) and not isinstance(k, bool) and k > 0 for k in ks):
+        raise ValueError('ks must be a non-empty list of positive ints, got ' + str(ks))
+
+    return sorted(set(int(k) for k in ks))
+
+
+# (neighborhoods x kmax) matrix of the first kmax neighbor codes, -1 where a list is shorter or a neighbor is repeated
+# (repeated neighbors count once, like the membership matrix), plus the position of every anchor in its own list
+# (kmax when it is not among the first kmax neighbors)
+def prefix_matrix(anchor_codes, indptr, indices, kmax):
+    lengths = np.minimum(np.diff(indptr), kmax)
+    rows = np.repeat(np.arange(len(anchor_codes)), lengths)
+    cols = np.arange(len(rows)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+
+    neighbors = np.full((len(anchor_codes), kmax), -1, dtype=np.int64)
+    neighbors[rows, cols] = indices[np.repeat(indptr[:-1], lengths) + cols]
+
+    # blank the later occurrences of a neighbor within its row
+    order = np.argsort(neighbors, axis=1, kind='stable')
+    ordered = np.take_along_axis(neighbors, order, axis=1)
+    repeated = np.zeros(neighbors.shape, dtype=bool)
+    np.put_along_axis(repeated, order[:, 1:], (ordered[:, 1:] == ordered[:, :-1]) & (ordered[:, 1:] >= 0), axis=1)
+    neighbors[repeated] = -1
+
+    is_anchor = (neighbors == anchor_codes[:, None]) & (neighbors >= 0)
+    anchor_position = np.where(is_anchor.any(axis=1), is_anchor.argmax(axis=1), kmax)
+
+    return neighbors, anchor_position
+
+
+# sums over the first k neighbors of every neighborhood for each k, one cumulative sum per statistic
+def prefix_sums(neighbors, sums, ks):
+    valid = neighbors >= 0
+    safe = np.where(valid, neighbors, 0)
+
+    prefixes = {k: dict() for k in ks}
+    for name, values in sums.items():
+        cumulative = np.cumsum(np.where(valid, values[safe], 0), axis=1)
+        for k in ks:
+            prefixes[k][name] = cumulative[:, k - 1]
+
+    return prefixes
+
+
+# tidy rows of one k: every test column, then one copy per p_thresh with the outcome of the tests
+def sweep_frame(neighborhoods, k, columns, p_threshs, test_1=None):
+    frame = pd.DataFrame(columns)
+    frame.insert(0, 'uid', list(neighborhoods.keys()))
+    frame.insert(0, 'k', k)
+    for name in ['nbhd_size', 'equiv_size']:
+        frame[name] = frame[name].astype(np.int64)
+    if test_1 is not None:
+        frame['test_1'] = test_1
+
+    frames = []
+    for p_thresh in p_threshs:
+        passed = frame['pvalue'] > p_thresh
+        frames.append(frame.assign(p_thresh=p_thresh, critical=passed & test_1 if test_1 is not None else passed))
+
+    return pd.concat(frames, ignore_index=True)
+
+
+# percentage of critical neighborhoods per (k, p_thresh), as printed by the evaluators
+def sweep_summary(sweep_df):
+    return sweep_df.groupby(level=['k', 'p_thresh'])['critical'].mean().mul(100).round(2).rename('critical_pct')
@@ -2,6 +2,7 @@
 # Licensed under the MIT License.
 
 import logging
+import hashlib
 import pandas as pd
 import numpy as np
 from functools import lru_cache, wraps
@@ -409,8 +410,55 @@ def has_same_base_dtype(df_1, df_2, columns=None):
     return result
 
 
+def _column_digest(digest, name, values):
+    """Feed one column (name, dtype and values) into a streaming digest.
+
+    Numeric buffers are hashed in place, other columns through their pandas row hashes.
+
+    Args:
+        digest (hashlib._Hash): digest to update
+        name (object): column name
+        values (pandas.Series): column values
+    """
+    digest.update(repr(name).encode())
+    digest.update(str(values.dtype).encode())
+    if isinstance(values.dtype, np.dtype) and values.dtype.kind in "biufcmM":
+        digest.update(np.ascontiguousarray(values.to_numpy()).view(np.uint8))
+    else:
+        try:
+            hashed = pd.util.hash_pandas_object(values, index=False)
+        except TypeError:
+            # unhashable values (e.g. dicts) are hashed through their string representation
+            hashed = pd.util.hash_pandas_object(values.astype(str), index=False)
+        digest.update(hashed.to_numpy().view(np.uint8))
+
+
+def _pandas_digest(pandas_object):
+    """Streaming digest of the values, dtypes, shape and column metadata of a pandas object.
+
+    Args:
+        pandas_object (pandas.DataFrame|pandas.Series): pandas object
+
+    Returns:
+        bytes: 16 bytes digest
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr(pandas_object.shape).encode())
+    if isinstance(pandas_object, pd.DataFrame):
+        for i, name in enumerate(pandas_object.columns):
+            _column_digest(digest, name, pandas_object.iloc[:, i])
+    else:
+        _column_digest(digest, pandas_object.name, pandas_object)
+    return digest.digest()
+
+
 class PandasHash:
-    """Wrapper class to allow pandas objects (DataFrames or Series) to be hashable"""
+    """Wrapper class to allow pandas objects (DataFrames or Series) to be hashable
+
+    The hash is a streaming digest of the column buffers, dtypes, shape and column names. It is computed on every
+    call, so in place edits of a cached object change its hash, and equal hashes are confirmed by comparing the
+    objects.
+    """
 
     # reserve space just for a single pandas object
     __slots__ = "pandas_object"
@@ -436,7 +484,16 @@ class PandasHash:
             bool: whether other object is the same as this one
         """
 
-        return hash(self) == hash(other)
+        if not isinstance(other, PandasHash):
+            return False
+        if self.pandas_object is other.pandas_object:
+            return True
+        if type(self.pandas_object) is not type(other.pandas_object):
+            return False
+        # different digests rule out equality, equal ones are confirmed on the values
+        if _pandas_digest(self.pandas_object) != _pandas_digest(other.pandas_object):
+            return False
+        return self.pandas_object.equals(other.pandas_object)
 
     def __hash__(self):
         """Overwrite hash operator for use with pandas objects
@@ -445,12 +502,7 @@ class PandasHash:
             int: hashed value of object
         """
 
-        hashable = tuple(self.pandas_object.values.tobytes())
-        if isinstance(self.pandas_object, pd.DataFrame):
-            hashable += tuple(self.pandas_object.columns)
-        else:
-            hashable += tuple(self.pandas_object.name)
-        return hash(hashable)
+        return int.from_bytes(_pandas_digest(self.pandas_object)[:8], "little", signed=True)
 
 
 def lru_cache_df(maxsize, typed=False):
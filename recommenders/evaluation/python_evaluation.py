@@ -4,6 +4,7 @@
 import numpy as np
 import pandas as pd
 from functools import wraps
+from scipy import sparse
 from sklearn.metrics import (
     mean_squared_error,
     mean_absolute_error,
@@ -672,17 +673,153 @@ def get_top_k_items(
     # Sort dataframe by col_user and (top k) col_rating
     if k is None:
         top_k_items = dataframe
-    else:
-        top_k_items = (
-            dataframe.groupby(col_user, as_index=False)
-            .apply(lambda x: x.nlargest(k, col_rating))
-            .reset_index(drop=True)
-        )
+        # Add ranks
+        top_k_items["rank"] = top_k_items.groupby(col_user, sort=False).cumcount() + 1
+        return top_k_items
+
+    # Sort once by user code and decreasing rating, ties keep their input order
+    user_codes, users = pd.factorize(dataframe[col_user], sort=True)
+    ratings = np.asarray(dataframe[col_rating], dtype=np.float64)
+    order = np.lexsort((np.arange(len(dataframe)), -ratings, user_codes))
+    # Missing users are dropped, as groupby does
+    order = order[user_codes[order] >= 0]
+
+    # Position of every row within its user segment
+    counts = np.bincount(user_codes[order], minlength=len(users))
+    rank = np.arange(len(order)) - np.repeat(np.cumsum(counts) - counts, counts)
+    keep = rank < k
+
+    top_k_items = dataframe.iloc[order[keep]].reset_index(drop=True)
     # Add ranks
-    top_k_items["rank"] = top_k_items.groupby(col_user, sort=False).cumcount() + 1
+    top_k_items["rank"] = rank[keep] + 1
     return top_k_items
 
 
+def _get_top_k_indices(scores, k):
+    """Column indices of the k largest scores of every row of a dense matrix.
+
+    Every row is sorted by decreasing score, ties are broken by increasing column index and NaN scores come last,
+    which is the order `get_top_k_items` gives to the same scores in a long DataFrame sorted by item.
+
+    Args:
+        scores (numpy.ndarray): Score matrix (users x items).
+        k (int): Number of top items per row, at most the number of columns.
+
+    Returns:
+        numpy.ndarray: Column indices (users x k).
+    """
+    key = np.where(np.isnan(scores), -np.inf, scores)
+    if k <= 0:
+        return np.empty((key.shape[0], 0), dtype=np.int64)
+
+    # k-th largest score of every row
+    part = np.argpartition(-key, k - 1, axis=1)[:, :k]
+    kth = np.take_along_axis(key, part, axis=1).min(axis=1)[:, None]
+
+    # Keep the scores above the k-th one, fill up with the lowest columns among ties
+    above = key > kth
+    ties = key == kth
+    n_missing = k - above.sum(axis=1, keepdims=True)
+    selected = above | (ties & (np.cumsum(ties, axis=1) <= n_missing))
+
+    rows, cols = np.nonzero(selected)
+    order = np.lexsort((cols, -key[rows, cols], rows))
+    return cols[order].reshape(key.shape[0], k)
+
+
+def get_top_k_items_dense(
+    scores,
+    user_ids,
+    item_ids,
+    col_user=DEFAULT_USER_COL,
+    col_item=DEFAULT_ITEM_COL,
+    col_prediction=DEFAULT_PREDICTION_COL,
+    k=DEFAULT_K,
+    block_size=1024,
+):
+    """Get the top k items of every user from a dense user x item score matrix.
+
+    This is the fast path of `get_top_k_items` for models that score every item of every user: the top k columns
+    of each block of rows are found with `np.argpartition` and the long DataFrame of all the scores is never built.
+
+    Args:
+        scores (numpy.ndarray): Score matrix (users x items).
+        user_ids (array-like): User id of every row of `scores`.
+        item_ids (array-like): Item id of every column of `scores`.
+        col_user (str): column name for user
+        col_item (str): column name for item
+        col_prediction (str): column name for prediction
+        k (int): number of items for each user
+        block_size (int): number of rows processed at once
+
+    Returns:
+        pandas.DataFrame: DataFrame of top k items for each user, in the order of `user_ids` and sorted by `rank`
+    """
+    n_users, n_items = scores.shape
+    if len(user_ids) != n_users or len(item_ids) != n_items:
+        raise ValueError("Score matrix shape does not match the user and item ids")
+
+    k = min(k, n_items)
+    top_items = np.empty((n_users, k), dtype=np.int64)
+    top_scores = np.empty((n_users, k), dtype=np.asarray(scores[:0]).dtype)
+    for start in range(0, n_users, block_size):
+        block = np.asarray(scores[start : start + block_size])
+        top_items[start : start + block_size] = _get_top_k_indices(block, k)
+        top_scores[start : start + block_size] = np.take_along_axis(
+            block, top_items[start : start + block_size], axis=1
+        )
+
+    return pd.DataFrame(
+        {
+            col_user: np.repeat(np.asarray(user_ids), k),
+            col_item: np.asarray(item_ids)[top_items.ravel()],
+            col_prediction: top_scores.ravel(),
+            "rank": np.tile(np.arange(1, k + 1), n_users),
+        }
+    )
+
+
+def get_ground_truth_csr(
+    rating_true,
+    user_ids,
+    item_ids,
+    col_user=DEFAULT_USER_COL,
+    col_item=DEFAULT_ITEM_COL,
+):
+    """Get the relevant items of every user as a sparse matrix aligned with a user x item score matrix.
+
+    Users missing from `user_ids` are dropped, as users without predictions are left out of the ranking metrics.
+    Relevant items missing from `item_ids` are appended as extra columns after the scored items, so that they
+    still count as relevant items that can never be recommended.
+
+    Args:
+        rating_true (pandas.DataFrame): True DataFrame
+        user_ids (array-like): User id of every row of the score matrix.
+        item_ids (array-like): Item id of every column of the score matrix.
+        col_user (str): column name for user
+        col_item (str): column name for item
+
+    Returns:
+        scipy.sparse.csr_matrix: Binary matrix (users x items, plus the unscored relevant items).
+    """
+    rows = pd.Index(user_ids).get_indexer(rating_true[col_user])
+    known = rows >= 0
+    items = rating_true[col_item].to_numpy()[known]
+    cols = pd.Index(item_ids).get_indexer(items)
+
+    unscored = cols < 0
+    extra_codes, extra_items = pd.factorize(items[unscored])
+    cols[unscored] = len(item_ids) + extra_codes
+
+    ground_truth = sparse.csr_matrix(
+        (np.ones(len(cols), dtype=np.float32), (rows[known], cols)),
+        shape=(len(user_ids), len(item_ids) + len(extra_items)),
+    )
+    # Repeated (user, item) pairs count once
+    ground_truth.data[:] = 1
+    return ground_truth
+
+
 """Function name and function mapper.
 Useful when we have to serialize evaluation metric names
 and call the functions based on deserialized names"""
@@ -698,6 +835,260 @@ metrics = {
 }
 
 
+class RankingEvaluator:
+    """Single pass evaluator of the ranking metrics at several values of k.
+
+    Users and items are encoded to integer codes once, the predictions are sorted once per user by decreasing
+    score and flagged as hits against the ground truth, and precision, recall, nDCG, MAP, hit rate and MRR are then
+    computed for every k with vectorized per-user aggregations, instead of merging both DataFrames for each metric.
+
+    The metrics follow `precision_at_k`, `recall_at_k`, `ndcg_at_k` and `map_at_k`: they are averaged over the
+    users present in both DataFrames, ties between predictions keep their input order as in `nlargest`, and the
+    (user, item) pairs of `rating_true` are assumed to be unique. The hit rate is the fraction of users with at
+    least one hit in their top k, and MRR the mean reciprocal rank of their first hit.
+
+    Examples:
+        >>> evaluator = RankingEvaluator(test, top_all, k=[5, 10])
+        >>> evaluator.evaluate()["ndcg@10"]  # doctest: +SKIP
+        >>> evaluator.evaluate(per_user=True)  # doctest: +SKIP
+    """
+
+    def __init__(
+        self,
+        rating_true,
+        rating_pred,
+        col_user=DEFAULT_USER_COL,
+        col_item=DEFAULT_ITEM_COL,
+        col_rating=DEFAULT_RATING_COL,
+        col_prediction=DEFAULT_PREDICTION_COL,
+        relevancy_method="top_k",
+        k=DEFAULT_K,
+        threshold=DEFAULT_THRESHOLD,
+    ):
+        """Initialize the evaluator and compute the hits of the predictions.
+
+        Args:
+            rating_true (pandas.DataFrame): True DataFrame
+            rating_pred (pandas.DataFrame): Predicted DataFrame
+            col_user (str): column name for user
+            col_item (str): column name for item
+            col_rating (str): column name for rating
+            col_prediction (str): column name for prediction
+            relevancy_method (str): method for determining relevancy ['top_k', 'by_threshold', None]. None means
+                that the top k items are directly provided, so there is no need to compute the relevancy operation.
+            k (int|list): number(s) of top k items per user
+            threshold (float): threshold of top items per user (optional)
+        """
+        if not has_columns(rating_true, [col_user, col_item, col_rating]):
+            raise ValueError("Missing columns in true rating DataFrame")
+        if not has_columns(rating_pred, [col_user, col_item, col_prediction]):
+            raise ValueError("Missing columns in predicted rating DataFrame")
+        if not has_same_base_dtype(
+            rating_true, rating_pred, columns=[col_user, col_item]
+        ):
+            raise ValueError("Columns in provided DataFrames are not the same datatype")
+        if relevancy_method not in ["top_k", "by_threshold", None]:
+            raise NotImplementedError("Invalid relevancy_method")
+
+        self.col_user = col_user
+        self.ks = sorted(set([k] if np.isscalar(k) else k))
+        self.relevancy_method = relevancy_method
+        self.threshold = threshold
+
+        # encode users and items of both DataFrames to integer codes once
+        n_true = len(rating_true)
+        user_codes, users = pd.factorize(
+            pd.concat([rating_true[col_user], rating_pred[col_user]], ignore_index=True)
+        )
+        item_codes, items = pd.factorize(
+            pd.concat([rating_true[col_item], rating_pred[col_item]], ignore_index=True)
+        )
+        true_users, pred_users = user_codes[:n_true], user_codes[n_true:]
+        true_items, pred_items = item_codes[:n_true], item_codes[n_true:]
+
+        # users present in both DataFrames
+        n_codes = len(users)
+        common = (np.bincount(true_users, minlength=n_codes) > 0) & (
+            np.bincount(pred_users, minlength=n_codes) > 0
+        )
+        self.users = users[common]
+        self.n_users = int(common.sum())
+        # dense codes of the common users, -1 for the others
+        dense = np.full(n_codes, -1, dtype=np.int64)
+        dense[common] = np.arange(self.n_users)
+
+        # number of relevant items of every common user
+        true_dense = dense[true_users]
+        self.actual = np.bincount(
+            true_dense[true_dense >= 0], minlength=self.n_users
+        )
+
+        # predictions of the common users sorted by user, then by decreasing score
+        keep = np.flatnonzero(dense[pred_users] >= 0)
+        pred_dense = dense[pred_users][keep]
+        if relevancy_method is None:
+            order = np.lexsort((keep, pred_dense))
+        else:
+            scores = rating_pred[col_prediction].to_numpy()[keep]
+            order = np.lexsort((keep, -scores, pred_dense))
+        self.pred_users = pred_dense[order]
+        counts = np.bincount(self.pred_users, minlength=self.n_users)
+        self.rank = (
+            np.arange(len(order)) - np.repeat(np.cumsum(counts) - counts, counts) + 1
+        )
+
+        # a prediction is a hit when its (user, item) pair is in the ground truth
+        n_items = max(len(items), 1)
+        true_pairs = true_dense[true_dense >= 0] * n_items + true_items[true_dense >= 0]
+        pred_pairs = self.pred_users * n_items + pred_items[keep][order]
+        self.hit = np.isin(pred_pairs, true_pairs)
+
+    @classmethod
+    def from_scores(
+        cls,
+        scores,
+        ground_truth,
+        user_ids=None,
+        col_user=DEFAULT_USER_COL,
+        k=DEFAULT_K,
+        block_size=1024,
+    ):
+        """Initialize the evaluator from a dense user x item score matrix, without building a long DataFrame.
+
+        The top items of every user are selected block by block as in `get_top_k_items_dense`, and only the rows
+        with at least one relevant item are scored, since the others are left out of the metrics.
+
+        Args:
+            scores (numpy.ndarray): Score matrix (users x items).
+            ground_truth (scipy.sparse.csr_matrix): Relevant items of every user, aligned with `scores` and
+                optionally followed by unscored relevant items (see `get_ground_truth_csr`).
+            user_ids (array-like): User id of every row of `scores`, row numbers by default.
+            col_user (str): column name for user in the per-user metrics
+            k (int|list): number(s) of top k items per user
+            block_size (int): number of rows processed at once
+
+        Returns:
+            RankingEvaluator: Evaluator of the top k items of the score matrix.
+        """
+        ground_truth = sparse.csr_matrix(ground_truth)
+        n_rows, n_items = scores.shape
+        if ground_truth.shape[0] != n_rows or ground_truth.shape[1] < n_items:
+            raise ValueError("Ground truth shape does not match the score matrix")
+
+        evaluator = cls.__new__(cls)
+        evaluator.col_user = col_user
+        evaluator.ks = sorted(set([k] if np.isscalar(k) else k))
+        evaluator.relevancy_method = "top_k"
+        evaluator.threshold = None
+
+        # users with relevant items, the others have no predictions to compare with
+        actual = np.diff(ground_truth.indptr)
+        common = np.flatnonzero(actual > 0)
+        user_ids = np.arange(n_rows) if user_ids is None else np.asarray(user_ids)
+        evaluator.users = user_ids[common]
+        evaluator.n_users = len(common)
+        evaluator.actual = actual[common]
+
+        # hits of the top items of every user, one block of rows at a time
+        kmax = min(evaluator.ks[-1], n_items)
+        n_cols = ground_truth.shape[1]
+        hit = np.empty((len(common), kmax), dtype=bool)
+        for start in range(0, len(common), block_size):
+            rows = common[start : start + block_size]
+            top_items = _get_top_k_indices(np.asarray(scores[rows]), kmax)
+            truth = ground_truth[rows]
+            truth_keys = (
+                np.repeat(np.arange(len(rows)), np.diff(truth.indptr)) * n_cols
+                + truth.indices
+            )
+            pred_keys = np.arange(len(rows))[:, None] * n_cols + top_items
+            hit[start : start + len(rows)] = np.isin(pred_keys, truth_keys)
+
+        evaluator.pred_users = np.repeat(np.arange(evaluator.n_users), kmax)
+        evaluator.rank = np.tile(np.arange(1, kmax + 1), evaluator.n_users)
+        evaluator.hit = hit.ravel()
+        return evaluator
+
+    def _cutoff(self, k):
+        """Number of top items per user considered for k, as in `merge_ranking_true_pred`.
+
+        Args:
+            k (int): number of top k items per user
+
+        Returns:
+            int|float: rank cutoff
+        """
+        if self.relevancy_method == "top_k":
+            return k
+        if self.relevancy_method == "by_threshold":
+            return self.threshold
+        return np.inf
+
+    def _user_metrics(self, k):
+        """Per-user metrics at k.
+
+        Args:
+            k (int): number of top k items per user
+
+        Returns:
+            dict: metric name to per-user numpy.ndarray
+        """
+        n_users = self.n_users
+        selected = self.hit & (self.rank <= self._cutoff(k))
+        users, rank = self.pred_users[selected], self.rank[selected]
+
+        hits = np.bincount(users, minlength=n_users)
+        dcg = np.bincount(users, weights=1 / np.log1p(rank), minlength=n_users)
+
+        # position of every hit among the hits of its user, in rank order
+        hit_counts = np.cumsum(hits) - hits
+        hit_position = np.arange(len(users)) - np.repeat(hit_counts, hits) + 1
+        reciprocal = np.bincount(users, weights=hit_position / rank, minlength=n_users)
+
+        # first hit of every user
+        first_users, first = np.unique(users, return_index=True)
+        first_rank = np.zeros(n_users)
+        first_rank[first_users] = 1 / rank[first]
+
+        # ideal DCG of min(actual, k) hits at the top
+        discounts = np.concatenate([[0], np.cumsum(1 / np.log1p(np.arange(1, k + 1)))])
+        idcg = discounts[np.minimum(self.actual, k)]
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return {
+                "precision": hits / k,
+                "recall": np.where(self.actual > 0, hits / self.actual, 0),
+                "ndcg": np.where(hits > 0, dcg / idcg, 0),
+                "map": np.where(self.actual > 0, reciprocal / self.actual, 0),
+                "hit_rate": (hits > 0).astype(np.float64),
+                "mrr": first_rank,
+            }
+
+    def evaluate(self, per_user=False):
+        """Compute every metric at every k.
+
+        Args:
+            per_user (bool): return the per-user metrics instead of their averages
+
+        Returns:
+            dict|pandas.DataFrame: metric@k to value, or a DataFrame with one row per common user and one
+            column per metric@k when `per_user` is set
+        """
+        metrics = {}
+        for k in self.ks:
+            for name, values in self._user_metrics(k).items():
+                metrics["{}@{}".format(name, k)] = values
+
+        if per_user:
+            df = pd.DataFrame(metrics)
+            df.insert(0, self.col_user, np.asarray(self.users))
+            return df
+
+        if self.n_users == 0:
+            return {name: 0.0 for name in metrics}
+        return {name: values.sum() / self.n_users for name, values in metrics.items()}
+
+
 # diversity metrics
 def _check_column_dtypes_diversity_serendipity(func):
     """Checks columns of DataFrame inputs
@@ -738,8 +1129,9 @@ def _check_column_dtypes_diversity_serendipity(func):
                 have interacted with; contains col_user, col_item. Assumed to not contain any duplicate rows.
             reco_df (pandas.DataFrame): Recommender's prediction output, containing col_user, col_item,
                 col_relevance (optional). Assumed to not contain any duplicate user-item pairs.
-            item_feature_df (pandas.DataFrame): (Optional) It is required only when item_sim_measure='item_feature_vector'.
-                It contains two columns: col_item and features (a feature vector).
+            item_feature_df (pandas.DataFrame): (Optional) It is required only when
+                item_sim_measure='item_feature_vector'. It contains two columns: col_item and features
+                (a feature vector).
             item_sim_measure (str): (Optional) This column indicates which item similarity measure to be used.
                 Available measures include item_cooccurrence_count (default choice) and item_feature_vector.
             col_item_features (str): item feature column name.
@@ -1525,3 +1917,316 @@ def distributional_coverage(
     d_coverage = -df_entropy.agg({"entropy(i)": "sum"})[0]
 
     return d_coverage
+
+
+class DiversityEvaluator:
+    """Sparse matrix engine of the diversity, novelty, serendipity and coverage metrics.
+
+    Users and items are encoded to integer codes once and both DataFrames become binary user x item CSR matrices,
+    X for the training set and R for the recommendations. The item co-occurrence cosine similarity is then
+    D^-1/2 X^T X D^-1/2 with D the item counts, the intra-list similarity of a user is read from the rows of
+    R S gathered at the recommended items, and the similarity of a recommended item to the history of its user
+    from the rows of X S, one block of users at a time. This replaces the pairwise self-merges of
+    `_get_pairwise_items` and the recommendation x history merge of `user_item_serendipity`.
+
+    With item_sim_measure='item_feature_vector', the normalized feature vectors F are used instead of S, through
+    R F and X F. The metrics and their DataFrames are the same as those of the metric functions of this module.
+
+    Examples:
+        >>> evaluator = DiversityEvaluator(train, top_k)
+        >>> evaluator.diversity(), evaluator.serendipity()  # doctest: +SKIP
+    """
+
+    def __init__(
+        self,
+        train_df,
+        reco_df,
+        item_feature_df=None,
+        item_sim_measure=DEFAULT_ITEM_SIM_MEASURE,
+        col_item_features=DEFAULT_ITEM_FEATURES_COL,
+        col_user=DEFAULT_USER_COL,
+        col_item=DEFAULT_ITEM_COL,
+        col_relevance=None,
+        block_size=1024,
+    ):
+        """Initialize the evaluator and encode the training set and the recommendations.
+
+        Args:
+            train_df (pandas.DataFrame): Data set with historical data for users and items they have interacted with;
+                contains col_user, col_item. Assumed to not contain any duplicate rows.
+            reco_df (pandas.DataFrame): Recommender's prediction output, containing col_user, col_item,
+                col_relevance (optional). Assumed to not contain any duplicate user-item pairs.
+            item_feature_df (pandas.DataFrame): (Optional) It is required only when
+                item_sim_measure='item_feature_vector'. It contains two columns: col_item and features
+                (a feature vector).
+            item_sim_measure (str): (Optional) This column indicates which item similarity measure to be used.
+                Available measures include item_cooccurrence_count (default choice) and item_feature_vector.
+            col_item_features (str): item feature column name.
+            col_user (str): User id column name.
+            col_item (str): Item id column name.
+            col_relevance (str): This column indicates whether the recommended item is actually relevant to the
+                user or not.
+            block_size (int): number of users processed at once
+        """
+        if not has_columns(train_df, [col_user, col_item]):
+            raise ValueError("Missing columns in train_df DataFrame")
+        if not has_columns(reco_df, [col_user, col_item]):
+            raise ValueError("Missing columns in reco_df DataFrame")
+        if not has_same_base_dtype(train_df, reco_df, columns=[col_user, col_item]):
+            raise ValueError("Columns in provided DataFrames are not the same datatype")
+        if item_sim_measure not in ["item_cooccurrence_count", "item_feature_vector"]:
+            raise Exception(
+                "item_sim_measure not recognized! The available options include 'item_cooccurrence_count' and "
+                "'item_feature_vector'."
+            )
+        if item_sim_measure == "item_feature_vector":
+            required_columns = [col_item, col_item_features]
+            if item_feature_df is None:
+                raise Exception(
+                    "item_feature_df not specified! item_feature_df must be provided "
+                    "if choosing to use item_feature_vector to calculate item similarity. "
+                    "item_feature_df should have columns: " + str(required_columns)
+                )
+            if not has_columns(item_feature_df, required_columns):
+                raise ValueError("Missing columns in item_feature_df DataFrame")
+
+        self.col_user = col_user
+        self.col_item = col_item
+        self.item_sim_measure = item_sim_measure
+        self.block_size = block_size
+
+        # encode users and items of both DataFrames (and item features) to codes once
+        n_train, n_reco = len(train_df), len(reco_df)
+        item_columns = [train_df[col_item], reco_df[col_item]]
+        if item_sim_measure == "item_feature_vector":
+            item_columns.append(item_feature_df[col_item])
+        item_codes, self.items = pd.factorize(
+            pd.concat(item_columns, ignore_index=True)
+        )
+        user_codes, self.users = pd.factorize(
+            pd.concat([train_df[col_user], reco_df[col_user]], ignore_index=True)
+        )
+        n_users, n_items = len(self.users), len(self.items)
+
+        self.train_users, self.train_items = user_codes[:n_train], item_codes[:n_train]
+        self.reco_users = user_codes[n_train : n_train + n_reco]
+        self.reco_items = item_codes[n_train : n_train + n_reco]
+
+        # recommendations must not contain user-item pairs of the training set
+        if np.isin(
+            self.reco_users.astype(np.int64) * n_items + self.reco_items,
+            self.train_users.astype(np.int64) * n_items + self.train_items,
+        ).any():
+            raise Exception(
+                "reco_df should not contain any user_item pairs that are already shown in train_df"
+            )
+
+        if col_relevance is None:
+            self.relevance = np.ones(n_reco)
+        else:
+            self.relevance = reco_df[col_relevance].to_numpy().astype(np.float16)
+
+        self.train = sparse.csr_matrix(
+            (np.ones(n_train), (self.train_users, self.train_items)),
+            shape=(n_users, n_items),
+        )
+        self.reco = sparse.csr_matrix(
+            (np.ones(n_reco), (self.reco_users, self.reco_items)),
+            shape=(n_users, n_items),
+        )
+        self.item_counts = np.bincount(self.train_items, minlength=n_items)
+
+        if item_sim_measure == "item_feature_vector":
+            features = np.vstack(item_feature_df[col_item_features].to_numpy()).astype(
+                np.float64
+            )
+            features /= np.linalg.norm(features, axis=1, keepdims=True)
+            # items without features are not similar to any item
+            self.features = np.zeros((n_items, features.shape[1]))
+            self.features[item_codes[n_train + n_reco :]] = features
+        self._similarity = None
+
+    def item_similarity(self):
+        """Item co-occurrence cosine similarity of the training set.
+
+        Returns:
+            scipy.sparse.csr_matrix: Similarity (items x items), with item codes as in `items`.
+        """
+        if self._similarity is None:
+            with np.errstate(divide="ignore"):
+                scale = np.where(
+                    self.item_counts > 0, 1 / np.sqrt(self.item_counts), 0
+                )
+            scaled = self.train @ sparse.diags(scale)
+            self._similarity = (scaled.T @ scaled).tocsr()
+        return self._similarity
+
+    def _blocks(self):
+        """Blocks of user codes with recommendations.
+
+        Returns:
+            generator: numpy.ndarray of user codes.
+        """
+        users = np.flatnonzero(np.diff(self.reco.indptr))
+        for start in range(0, len(users), self.block_size):
+            yield users[start : start + self.block_size]
+
+    def _user_frame(self, users, name, values):
+        """DataFrame of per-user values sorted by user id, as returned by the metric functions.
+
+        Returns:
+            pandas.DataFrame: A dataframe with the following columns: col_user, name.
+        """
+        df = pd.DataFrame({self.col_user: np.asarray(self.users)[users], name: values})
+        return df.sort_values(self.col_user).reset_index(drop=True)
+
+    def user_diversity(self):
+        """Calculate average diversity of recommendations for each user, as `user_diversity`.
+
+        Returns:
+            pandas.DataFrame: A dataframe with the following columns: col_user, user_diversity.
+        """
+        users, similarity_sums = [], []
+        for block in self._blocks():
+            reco = self.reco[block]
+            if self.item_sim_measure == "item_cooccurrence_count":
+                similarity = self.item_similarity()
+                # similarities of all ordered pairs of recommended items and diagonal
+                total = np.asarray(
+                    (reco @ similarity).multiply(reco).sum(axis=1)
+                ).ravel()
+                diagonal = reco @ similarity.diagonal()
+            else:
+                profile = reco @ self.features
+                total = (profile**2).sum(axis=1)
+                diagonal = reco @ (self.features**2).sum(axis=1)
+            users.append(block)
+            similarity_sums.append((total - diagonal) / 2)
+
+        users = np.concatenate(users) if users else np.zeros(0, dtype=np.int64)
+        similarity_sums = np.concatenate(similarity_sums) if users.size else np.zeros(0)
+        # users with a single recommended item have no pairs
+        n_items = np.diff(self.reco.indptr)[users]
+        keep = n_items > 1
+        n_pairs = n_items[keep] * (n_items[keep] - 1) / 2
+        avg_il_sim = similarity_sums[keep] / n_pairs
+
+        return self._user_frame(users[keep], "user_diversity", 1 - avg_il_sim)
+
+    def diversity(self):
+        """Calculate average diversity of recommendations across all users, as `diversity`.
+
+        Returns:
+            float: diversity.
+        """
+        return self.user_diversity()["user_diversity"].mean()
+
+    def historical_item_novelty(self):
+        """Calculate novelty for each item of the training set, as `historical_item_novelty`.
+
+        Returns:
+            pandas.DataFrame: A dataframe with the following columns: col_item, item_novelty.
+        """
+        items = np.flatnonzero(self.item_counts)
+        df = pd.DataFrame(
+            {
+                self.col_item: np.asarray(self.items)[items],
+                "item_novelty": -np.log2(
+                    self.item_counts[items] / len(self.train_items)
+                ),
+            }
+        )
+        return df.sort_values(self.col_item).reset_index(drop=True)
+
+    def novelty(self):
+        """Calculate the average novelty in the list of recommended items, as `novelty`.
+
+        Returns:
+            float: novelty.
+        """
+        counts = self.item_counts[self.reco_items]
+        # recommended items never seen in training have no novelty
+        seen = counts > 0
+        novelty = -np.log2(counts[seen] / len(self.train_items))
+        return novelty.sum() / len(self.reco_items)
+
+    def user_item_serendipity(self):
+        """Calculate serendipity of each item in the recommendations for each user, as `user_item_serendipity`.
+
+        Returns:
+            pandas.DataFrame: A dataframe with columns: col_user, col_item, user_item_serendipity.
+        """
+        n_history = np.diff(self.train.indptr)
+        order = np.lexsort((self.reco_items, self.reco_users))
+        reco_users, reco_items = self.reco_users[order], self.reco_items[order]
+
+        avg_sim = np.empty(len(order))
+        reco_indptr = np.searchsorted(reco_users, np.arange(len(self.users) + 1))
+        for block in self._blocks():
+            # recommendations of the block users, contiguous once sorted by user
+            start, stop = reco_indptr[block[0]], reco_indptr[block[-1] + 1]
+            rows = np.searchsorted(block, reco_users[start:stop])
+            if self.item_sim_measure == "item_cooccurrence_count":
+                history_sim = (self.train[block] @ self.item_similarity()).tocsr()
+                sums = np.asarray(history_sim[rows, reco_items[start:stop]]).ravel()
+            else:
+                profile = self.train[block] @ self.features
+                sums = (profile[rows] * self.features[reco_items[start:stop]]).sum(
+                    axis=1
+                )
+            with np.errstate(divide="ignore", invalid="ignore"):
+                avg_sim[start:stop] = sums / n_history[reco_users[start:stop]]
+
+        # users without history are left out
+        keep = n_history[reco_users] > 0
+        df = pd.DataFrame(
+            {
+                self.col_user: np.asarray(self.users)[reco_users[keep]],
+                self.col_item: np.asarray(self.items)[reco_items[keep]],
+                "user_item_serendipity": (1 - avg_sim[keep])
+                * self.relevance[order][keep],
+            }
+        )
+        return df.sort_values([self.col_user, self.col_item]).reset_index(drop=True)
+
+    def user_serendipity(self):
+        """Calculate average serendipity for each user's recommendations, as `user_serendipity`.
+
+        Returns:
+            pandas.DataFrame: A dataframe with following columns: col_user, user_serendipity.
+        """
+        df = (
+            self.user_item_serendipity()
+            .groupby(self.col_user)
+            .agg({"user_item_serendipity": "mean"})
+            .reset_index()
+        )
+        df.columns = [self.col_user, "user_serendipity"]
+        return df.sort_values(self.col_user).reset_index(drop=True)
+
+    def serendipity(self):
+        """Calculate average serendipity for recommendations across all users, as `serendipity`.
+
+        Returns:
+            float: serendipity.
+        """
+        return self.user_serendipity()["user_serendipity"].mean()
+
+    def catalog_coverage(self):
+        """Calculate catalog coverage for recommendations across all users, as `catalog_coverage`.
+
+        Returns:
+            float: catalog coverage
+        """
+        n_reco_items = np.count_nonzero(np.bincount(self.reco_items))
+        return n_reco_items / np.count_nonzero(self.item_counts)
+
+    def distributional_coverage(self):
+        """Calculate distributional coverage for recommendations across all users, as `distributional_coverage`.
+
+        Returns:
+            float: distributional coverage
+        """
+        counts = np.bincount(self.reco_items)
+        p = counts[counts > 0] / len(self.reco_items)
+        return -(p * np.log2(p)).sum()
@@ -0,0 +1,51 @@
+'''
+    shared synthetic workload of the neighborhood evaluator tests
+    the repository is not an installed package, so its root is put on the import path
+'''
+import numpy as np
+import pandas as pd
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+# predictions of n_users users (some without predictions), with a biased subset so that some neighborhoods are
+# critical, and neighborhoods of k users drawn among the users with and without predictions
+def make_workload(n_users=200, n_preds=4000, k=10, seed=0):
+    rng = np.random.default_rng(seed)
+    uids = rng.integers(1, n_users + 1, n_preds)
+    uids = uids[uids % 17 != 0]
+    n = len(uids)
+    r_ui = rng.integers(1, 11, n) / 2
+    est = np.clip(r_ui + rng.normal(0, 0.9, n) + (uids % 7 == 0) * 0.8, 0.5, 5)
+    predictions_df = pd.DataFrame({'uid': uids, 'iid': rng.integers(1, 500, n), 'r_ui': r_ui, 'est': est,
+                                   'details': [{}] * n})
+    predictions_df['prediction_loss'] = (predictions_df.r_ui - predictions_df.est)**2
+
+    neighborhoods = dict()
+    for uid in range(1, n_users + 1):
+        others = rng.choice(np.arange(1, n_users + 40), k, replace=False)
+        neighborhoods[uid] = [int(other) for other in others if other != uid]
+
+    users = np.unique(uids)
+    precisions_df = pd.DataFrame({'user_id': users, 'precision': rng.random(len(users))})
+    recalls_df = pd.DataFrame({'user_id': users, 'recall': rng.random(len(users))})
+
+    return neighborhoods, predictions_df, precisions_df, recalls_df
+
+
+# same critical neighborhoods in the same order with the same statistics
+def assert_same_critical(result, expected, skip=('nbhd', 'mask')):
+    assert list(result['uid']) == list(expected['uid'])
+    for name in expected.columns:
+        if name in skip or name == 'uid':
+            continue
+        np.testing.assert_allclose(result[name].astype(float), expected[name].astype(float), rtol=1e-9, atol=1e-12,
+                                   err_msg=name)
+
+
+@pytest.fixture(scope='module')
+def workload():
+    return make_workload()
@@ -0,0 +1,71 @@
+from util.ann import IVFNeighbors, exact_knn_csr, knn_recall_report, cluster_csr, prefix_csr
+import pandas as pd
+import numpy as np
+
+
+def factors(n_users=300, n_factors=8, seed=0):
+    rng = np.random.default_rng(seed)
+
+    return ['u' + str(uid) for uid in range(n_users)], rng.standard_normal((n_users, n_factors))
+
+
+def csr_rows(indptr, indices):
+    return [indices[indptr[row]:indptr[row + 1]].tolist() for row in range(len(indptr) - 1)]
+
+
+# probing every cluster makes the search exhaustive, so the approximate neighbors are the exact ones
+def test_ivf_probing_every_cluster_is_exact():
+    user_ids, user_factors = factors()
+    ivf = IVFNeighbors(n_clusters=12, n_probe=12, seed=0).fit_factors(user_ids, user_factors)
+
+    assert csr_rows(*ivf.knn_csr(10)) == csr_rows(*exact_knn_csr(ivf.vectors, 10))
+
+
+def test_ivf_recall_report():
+    user_ids, user_factors = factors()
+    ivf = IVFNeighbors(n_clusters=30, n_probe=4, seed=0).fit_factors(user_ids, user_factors)
+    exact = csr_rows(*exact_knn_csr(ivf.vectors, 10))
+    approx = csr_rows(*ivf.knn_csr(10))
+
+    exact_nbhds = {user_ids[row]: [user_ids[other] for other in nbhd] for row, nbhd in enumerate(exact)}
+    approx_nbhds = {user_ids[row]: [user_ids[other] for other in nbhd] for row, nbhd in enumerate(approx)}
+    report, recall_df = knn_recall_report(exact_nbhds, approx_nbhds)
+
+    expected = [len(set(e) & set(a)) / len(e) for e, a in zip(exact, approx)]
+    np.testing.assert_allclose(recall_df.set_index('user_id').loc[user_ids, 'recall'], expected)
+    assert report['users'] == len(user_ids)
+    assert report['mean_recall'] == np.mean(expected) and 0.5 < report['mean_recall'] < 1
+
+
+def test_recall_report_critical_overlap():
+    exact = {1: [2, 3], 2: [1, 3], 3: [], 4: [1, 2]}
+    approx = {1: [2, 4], 2: [1, 3], 3: [1]}
+
+    # neighborhoods holding user 3 are critical
+    def evaluate(nbhds):
+        return pd.DataFrame({'uid': [uid for uid, nbhd in nbhds.items() if 3 in nbhd]})
+
+    report, recall_df = knn_recall_report(exact, approx, evaluate)
+
+    assert recall_df.set_index('user_id').recall.to_dict() == {1: 0.5, 2: 1.0, 3: 1.0, 4: 0.0}
+    assert report['critical_pct_exact'] == 50.0 and report['critical_pct_approx'] == round(100 / 3, 2)
+    assert report['critical_overlap'] == 0.5
+
+
+def test_get_neighbors_serves_prefixes_of_the_cached_search():
+    user_ids, user_factors = factors()
+    ivf = IVFNeighbors(n_clusters=20, n_probe=3, seed=1).fit_factors(user_ids, user_factors)
+    rows_10 = csr_rows(*ivf.knn_csr(10))
+
+    assert csr_rows(*ivf.knn_csr(4)) == [row[:4] for row in rows_10]
+    assert ivf.get_neighbors(7, 10) == rows_10[7]
+    assert csr_rows(*prefix_csr(np.array([0, 2, 2, 5]), np.arange(5), 1)) == [[0], [], [2]]
+
+
+def test_cluster_csr_matches_a_scan_per_cluster():
+    rng = np.random.default_rng(0)
+    labels = rng.integers(0, 9, 200)
+    rows = rng.permutation(200)
+    indptr, ids = cluster_csr(labels, rows, 10)
+
+    assert csr_rows(indptr, ids) == [rows[labels == cluster].tolist() for cluster in range(10)]
@@ -0,0 +1,43 @@
+from util.artifact_cache import ArtifactCache, frame_fingerprint, cached_neighborhoods, cached_predictions
+import pandas as pd
+import numpy as np
+import os
+
+
+def test_frame_fingerprint_follows_the_values_and_dtypes():
+    df = pd.DataFrame({'user_id': [1, 2, 3], 'item_id': ['a', 'b', 'c'], 'details': [{}, {'k': 1}, {}]})
+
+    assert frame_fingerprint(df) == frame_fingerprint(df.copy())
+    assert frame_fingerprint(df) != frame_fingerprint(df.assign(user_id=[1, 2, 4]))
+    assert frame_fingerprint(df) != frame_fingerprint(df.astype({'user_id': np.int32}))
+    assert frame_fingerprint(df) != frame_fingerprint(df.assign(item_id=df['item_id'].astype('category')))
+    assert frame_fingerprint(df) != frame_fingerprint(df.iloc[:2])
+
+
+def test_cached_artifacts_round_trip(tmp_path):
+    cache = ArtifactCache(str(tmp_path))
+    nbhds = {'u1': ['u2', 'u3'], 'u2': [], 'u3': ['u1']}
+    predictions = {'uid': pd.Categorical(['u1', 'u2', 'u1']), 'est': np.array([3.5, 4.0, 2.5])}
+    calls = []
+
+    def compute_nbhds():
+        calls.append('nbhds')
+        return nbhds
+
+    for _ in range(2):
+        assert dict(cached_neighborhoods(cache, cache.key(artifact='nbhds'), compute_nbhds)) == nbhds
+        cached = cached_predictions(cache, cache.key(artifact='predictions'), lambda: predictions)
+    assert calls == ['nbhds']
+    assert list(cached['uid']) == ['u1', 'u2', 'u1'] and cached['est'].tolist() == [3.5, 4.0, 2.5]
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ArtifactCache(str(tmp_path), max_bytes=2500 * 8)
+    for name in ['a', 'b']:
+        cache.put(name, {'values': np.zeros(1000)})
+    os.utime(cache.path('a'), (0, 0))
+    os.utime(cache.path('b'), (1, 1))
+    cache.get('a')
+
+    cache.put('c', {'values': np.zeros(1000)})
+    assert 'a' in cache and 'b' not in cache and 'c' in cache
@@ -0,0 +1,96 @@
+from neighborhood_eval.neighborhood_accuracy import _critical_nbhds_accuracy_loop
+from neighborhood_eval.neighborhood_rankings import _get_critical_nbhds_loop
+from neighborhood_eval.incremental import IncrementalCriticalAccuracy, IncrementalCriticalRankings
+from conftest import assert_same_critical
+import pandas as pd
+import numpy as np
+
+
+# new rows for the given users, built like the predictions of the workload
+def new_predictions(uids, seed, rows_per_user=5):
+    rng = np.random.default_rng(seed)
+    uids = np.repeat(uids, rows_per_user)
+    r_ui = rng.integers(1, 11, len(uids)) / 2
+    est = np.clip(r_ui + rng.normal(0, 1.2, len(uids)), 0.5, 5)
+
+    return pd.DataFrame({'uid': uids, 'iid': rng.integers(1, 500, len(uids)), 'r_ui': r_ui, 'est': est,
+                         'details': [{}] * len(uids), 'prediction_loss': (r_ui - est)**2})
+
+
+def new_metrics(user_ids, column, seed):
+    return pd.DataFrame({'user_id': user_ids, column: np.random.default_rng(seed).random(len(user_ids))})
+
+
+# the full frame after a delta: the rows of the changed and removed users are replaced by the rows of the delta
+def apply_delta(frame, column, delta, removed):
+    replaced = set(delta[column]) | set(removed)
+
+    return pd.concat([frame[~frame[column].isin(replaced)], delta], ignore_index=True)
+
+
+# users whose predictions change, users without predictions so far (neighbors only, and an id never seen) and
+# users left without any prediction
+def deltas(predictions_df):
+    users = np.unique(predictions_df['uid'])
+    changed = users[:40:3].tolist()
+    new = [17, 34, 210, 10**6]
+    removed = users[41:60:4].tolist()
+
+    return changed, new, removed
+
+
+# neighborhoods whose anchor or one of its neighbors is among the users
+def containing(neighborhoods, users):
+    users = set(users)
+
+    return [i for i, (uid, nbhd) in enumerate(neighborhoods.items()) if uid in users or users & set(nbhd)]
+
+
+def test_incremental_accuracy_matches_recompute(workload):
+    neighborhoods, predictions_df, _, _ = workload
+    incremental = IncrementalCriticalAccuracy(neighborhoods, predictions_df)
+    assert_same_critical(incremental.result(), _critical_nbhds_accuracy_loop(neighborhoods, predictions_df))
+
+    # two successive deltas, the second one changes users of the first one again
+    changed, new, removed = deltas(predictions_df)
+    for step, (changed_users, removed_users) in enumerate([(changed + new, removed), (changed[:5] + removed[:2], new)]):
+        delta = new_predictions(changed_users, seed=step)
+        affected = incremental.update(delta, removed=removed_users)
+        predictions_df = apply_delta(predictions_df, 'uid', delta, removed_users)
+
+        assert affected.tolist() == containing(neighborhoods, changed_users + removed_users)
+        assert_same_critical(incremental.result(), _critical_nbhds_accuracy_loop(neighborhoods, predictions_df))
+
+
+def test_incremental_rankings_matches_recompute(workload):
+    neighborhoods, predictions_df, precisions_df, recalls_df = workload
+    incremental = IncrementalCriticalRankings(neighborhoods, predictions_df, precisions_df, recalls_df)
+    assert_same_critical(incremental.result(),
+                         _get_critical_nbhds_loop(neighborhoods, predictions_df, precisions_df, recalls_df))
+
+    changed, new, removed = deltas(predictions_df)
+    delta = new_predictions(changed + new, seed=0)
+    precision_delta = new_metrics(changed + new, 'precision', seed=1)
+    recall_delta = new_metrics(changed[::2] + new, 'recall', seed=2)
+    affected = incremental.update(delta, precision_delta, recall_delta, removed=removed)
+
+    predictions_df = apply_delta(predictions_df, 'uid', delta, removed)
+    precisions_df = apply_delta(precisions_df, 'user_id', precision_delta, removed)
+    recalls_df = apply_delta(recalls_df, 'user_id', recall_delta, removed)
+
+    assert affected.tolist() == containing(neighborhoods, changed + new + removed)
+    assert_same_critical(incremental.result(),
+                         _get_critical_nbhds_loop(neighborhoods, predictions_df, precisions_df, recalls_df))
+
+
+# removed only applies to the frames passed to update(): the removed users keep their precision and recall
+def test_incremental_rankings_removed_applies_to_passed_frames(workload):
+    neighborhoods, predictions_df, precisions_df, recalls_df = workload
+    incremental = IncrementalCriticalRankings(neighborhoods, predictions_df, precisions_df, recalls_df)
+
+    _, _, removed = deltas(predictions_df)
+    incremental.update(predictions_df.iloc[:0], removed=removed)
+    predictions_df = predictions_df[~predictions_df['uid'].isin(removed)]
+
+    assert_same_critical(incremental.result(),
+                         _get_critical_nbhds_loop(neighborhoods, predictions_df, precisions_df, recalls_df))
@@ -0,0 +1,23 @@
+from util.instrumentation import enable_tracing, disable_tracing, stage, process_peak_rss_mb
+import numpy as np
+
+
+def test_stages_record_the_process_peak_and_its_growth():
+    assert stage('disabled') is stage('other')
+
+    tracer = enable_tracing()
+    try:
+        with stage('outer', rows=3):
+            with stage('inner') as record:
+                record['rows'] = 5
+                np.ones(2**26, dtype=np.uint8).sum()
+    finally:
+        assert disable_tracing() is tracer
+
+    summary = tracer.summary().set_index('name')
+    assert summary.loc['inner', 'parent'] == 'outer' and summary.loc['inner', 'rows'] == 5
+    assert (summary['process_peak_rss_mb'] <= process_peak_rss_mb()).all()
+    assert (summary['peak_rss_growth_mb'] ==
+            summary['process_peak_rss_mb'] - summary['process_peak_rss_start_mb']).all()
+    assert (summary['peak_rss_growth_mb'] >= 0).all()
+    assert [event['name'] for event in tracer.to_chrome_trace()['traceEvents']] == ['outer', 'inner']
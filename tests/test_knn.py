@@ -0,0 +1,39 @@
+from util.knn import get_knn_csr, top_k_block
+import numpy as np
+import heapq
+import pytest
+
+
+# surprise's AlgoBase.get_neighbors: the k largest similarities of the other users, ties kept in inner id order
+def surprise_neighbors(sim, inner_id, k):
+    others = [(other, sim[inner_id, other]) for other in range(sim.shape[0]) if other != inner_id]
+
+    return [other for other, _ in heapq.nlargest(k, others, key=lambda other: other[1])]
+
+
+# symmetric similarities rounded to one decimal, so that many rows hold ties around their k-th value
+def similarity_matrix(n, seed=0):
+    rng = np.random.default_rng(seed)
+    sim = np.round(rng.uniform(-1, 1, (n, n)), 1)
+
+    return (sim + sim.T) / 2
+
+
+@pytest.mark.parametrize('nbhd_size', [1, 5, 39, 60])
+@pytest.mark.parametrize('block_size', [7, 2048])
+def test_get_knn_csr_matches_get_neighbors(nbhd_size, block_size):
+    sim = similarity_matrix(40)
+    indptr, indices = get_knn_csr(sim, nbhd_size, block_size)
+
+    k = min(nbhd_size, len(sim) - 1)
+    assert indices.dtype == np.int32 and list(np.diff(indptr)) == [k] * len(sim)
+    for inner_id in range(len(sim)):
+        assert indices[indptr[inner_id]:indptr[inner_id + 1]].tolist() == surprise_neighbors(sim, inner_id, k)
+
+
+def test_top_k_block_excludes_the_diagonal_of_its_rows():
+    sim = np.ones((6, 6))
+    block = sim[2:5].copy()
+
+    assert top_k_block(block, 2, 3).tolist() == [[0, 1, 3], [0, 1, 2], [0, 1, 2]]
+    assert top_k_block(sim[2:5].copy(), 2, 0).shape == (3, 0)
@@ -0,0 +1,59 @@
+from archive.local_accuracy import NeighborhoodAccuracy
+from collections import defaultdict
+import numpy as np
+
+
+def predictions_list(predictions_df):
+    return list(predictions_df[['uid', 'iid', 'r_ui', 'est', 'details']].itertuples(index=False, name=None))
+
+
+# the per-user loops of the original class: the ratings of the user followed by those of every neighbor
+def loop_accuracy(predictions, neighbors):
+    map_users = defaultdict(list)
+    for uid, iid, true_r, est, _ in predictions:
+        map_users[uid].append((iid, true_r, est))
+
+    accuracy = dict()
+    for uid, user_ratings in list(map_users.items()):
+        ratings = user_ratings + [rating for neighbor in neighbors[uid] for rating in map_users.get(neighbor, [])]
+        errors = np.array([true_r - est for _, true_r, est in ratings])
+        accuracy[uid] = (np.mean(np.abs(errors)), np.sqrt(np.mean(errors**2)), len(ratings))
+
+    return map_users, accuracy
+
+
+# ratings and estimates are stored as float32, so the metrics match the float64 loop up to float32 rounding
+def test_compute_all_matches_loop(workload):
+    neighborhoods, predictions_df, _, _ = workload
+    neighborhoods = dict(neighborhoods)
+    neighborhoods[1] = neighborhoods[1] + neighborhoods[1][:2]  # repeated neighbors count every time
+    predictions = predictions_list(predictions_df)
+    map_users, expected = loop_accuracy(predictions, neighborhoods)
+
+    accuracy = NeighborhoodAccuracy(predictions)
+    accuracy_df = accuracy.compute_all(neighborhoods).set_index('user_id')
+
+    users = sorted(expected)
+    assert list(accuracy_df.index) == users
+    np.testing.assert_allclose(accuracy_df.loc[users, 'mae'], [expected[uid][0] for uid in users], rtol=1e-6)
+    np.testing.assert_allclose(accuracy_df.loc[users, 'rmse'], [expected[uid][1] for uid in users], rtol=1e-6)
+    assert accuracy_df.loc[users, 'neighborhood_size'].tolist() == [expected[uid][2] for uid in users]
+
+    # the public attributes of the original class
+    for uid in users:
+        assert accuracy.neighborhood_mae[uid][1] == accuracy.neighborhood_rmse[uid][1] == expected[uid][2]
+        np.testing.assert_allclose(accuracy.neighborhood_mae[uid][0], expected[uid][0], rtol=1e-6)
+        np.testing.assert_allclose(accuracy.neighborhood_rmse[uid][0], expected[uid][1], rtol=1e-6)
+        assert [iid for iid, _, _ in accuracy.map_users[uid]] == [iid for iid, _, _ in map_users[uid]]
+        np.testing.assert_allclose(np.array([rating[1:] for rating in accuracy.map_users[uid]]),
+                                   np.array([rating[1:] for rating in map_users[uid]]), rtol=1e-6)
+
+
+def test_mae_and_rmse_frames(workload):
+    neighborhoods, predictions_df, _, _ = workload
+    accuracy = NeighborhoodAccuracy(predictions_list(predictions_df))
+    accuracy_df = accuracy.compute_all(neighborhoods)
+
+    assert list(accuracy.compute_neighborhood_mae(neighborhoods).columns) == ['user_id', 'mae', 'neighborhood_size']
+    assert list(accuracy.compute_neighborhood_rmse(neighborhoods).columns) == ['user_id', 'rmse', 'neighborhood_size']
+    assert accuracy.compute_neighborhood_rmse(neighborhoods)['rmse'].tolist() == accuracy_df['rmse'].tolist()
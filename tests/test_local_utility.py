@@ -0,0 +1,24 @@
+from archive.local_utility import compute_neighborhood_ndcg, compute_neighborhood_ndcg_vectorized, \
+    _compute_neighborhood_ndcg_loop
+import numpy as np
+import pytest
+
+
+def predictions_list(predictions_df):
+    return list(predictions_df[['uid', 'iid', 'r_ui', 'est', 'details']].itertuples(index=False, name=None))
+
+
+# the ratings are on a half-star scale and the items repeat across users, so both sorts and the ground-truth
+# lookup of an item hit ties
+@pytest.mark.parametrize('n', [1, 5, 10000])
+@pytest.mark.parametrize('n_jobs', [1, 2])
+def test_vectorized_matches_loop(workload, n, n_jobs):
+    neighborhoods, predictions_df, _, _ = workload
+    predictions = predictions_list(predictions_df)
+    expected = _compute_neighborhood_ndcg_loop(predictions, neighborhoods, n)
+
+    for result in [compute_neighborhood_ndcg(predictions, neighborhoods, n, n_jobs=n_jobs),
+                   compute_neighborhood_ndcg_vectorized(predictions, neighborhoods, n, n_jobs=n_jobs, batch_size=37)]:
+        assert result['user_id'].tolist() == expected['user_id'].tolist()
+        assert result['neighborhood_size'].tolist() == expected['neighborhood_size'].tolist()
+        np.testing.assert_allclose(result['ndcg'], expected['ndcg'].astype(float), rtol=1e-12)
@@ -0,0 +1,78 @@
+from util.nbhd_builder import build_knn, SIMILARITIES
+from collections import defaultdict
+from math import sqrt
+import pandas as pd
+import numpy as np
+import heapq
+import pytest
+
+
+# ratings on a half-star scale, with users sharing few items so that min_support and the 0 similarities matter
+def make_ratings(n_users=30, n_items=25, n_ratings=300, seed=0):
+    rng = np.random.default_rng(seed)
+    ratings = pd.DataFrame({'user_id': rng.integers(100, 100 + n_users, n_ratings),
+                            'item_id': rng.integers(0, n_items, n_ratings),
+                            'rating': rng.integers(1, 11, n_ratings) / 2})
+
+    return ratings.drop_duplicates(['user_id', 'item_id']).reset_index(drop=True)
+
+
+# surprise's similarities (surprise/similarities.pyx) between two users, from the items rated by both
+def surprise_similarity(ratings_u, ratings_v, name, min_support):
+    common = [(ratings_u[item], ratings_v[item]) for item in ratings_u if item in ratings_v]
+    freq = len(common)
+    if freq < min_support:
+        return 0
+
+    prods = sum(ri * rj for ri, rj in common)
+    sqi = sum(ri**2 for ri, _ in common)
+    sqj = sum(rj**2 for _, rj in common)
+    if name == 'cosine':
+        return prods / sqrt(sqi * sqj)
+    if name == 'msd':
+        return 1 / (sum((ri - rj)**2 for ri, rj in common) / freq + 1)
+
+    si = sum(ri for ri, _ in common)
+    sj = sum(rj for _, rj in common)
+    denum = sqrt((freq * sqi - si**2) * (freq * sqj - sj**2))
+
+    return 0 if denum == 0 else (freq * prods - si * sj) / denum
+
+
+# neighbors of surprise's get_neighbors over the inner ids (users in order of appearance), as raw ids
+def surprise_knn(ratings, name, nbhd_size, min_support):
+    user_ratings = defaultdict(dict)
+    for uid, iid, rating in ratings[['user_id', 'item_id', 'rating']].itertuples(index=False):
+        user_ratings[uid][iid] = rating
+    users = list(user_ratings)
+
+    nbhds = dict()
+    for uid in users:
+        others = [(other, surprise_similarity(user_ratings[uid], user_ratings[other], name, min_support))
+                  for other in users if other != uid]
+        nbhds[uid] = [other for other, _ in heapq.nlargest(nbhd_size, others, key=lambda other: other[1])]
+
+    return nbhds
+
+
+@pytest.mark.parametrize('sim_name', SIMILARITIES)
+@pytest.mark.parametrize('min_support', [1, 3])
+def test_build_knn_matches_surprise_similarities(sim_name, min_support):
+    ratings = make_ratings()
+    expected = surprise_knn(ratings, sim_name, 5, min_support)
+
+    assert dict(build_knn(ratings, sim_name, 5, min_support, block_size=7)) == expected
+
+
+# the same neighbors as the KNN algorithms of surprise itself, when it is installed
+@pytest.mark.parametrize('sim_name', SIMILARITIES)
+def test_build_knn_matches_surprise(sim_name):
+    surprise = pytest.importorskip('surprise')
+    from util.knn import get_knn
+
+    ratings = make_ratings()
+    data = surprise.Dataset.load_from_df(ratings, surprise.Reader(rating_scale=(0.5, 5)))
+    algo = surprise.KNNBasic(sim_options={'name': sim_name, 'user_based': True}, verbose=False)
+    algo.fit(data.build_full_trainset())
+
+    assert dict(build_knn(ratings, sim_name, 5)) == dict(get_knn(ratings, algo, 5))
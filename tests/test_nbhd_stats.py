@@ -0,0 +1,63 @@
+from neighborhood_eval.nbhd_stats import mean_var, welch_ttest, welch_from_sums
+from scipy import stats
+import numpy as np
+import warnings
+import pytest
+
+
+def group_sums(groups):
+    return {
+        'count': np.array([len(group) for group in groups], dtype=np.float64),
+        'est': np.array([np.sum(group) for group in groups], dtype=np.float64),
+        'est_sq': np.array([np.sum(np.square(group)) for group in groups], dtype=np.float64)
+    }
+
+
+def scipy_welch(groups_1, groups_2):
+    # scipy warns about the degenerate groups of the edge cases
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        tests = [stats.ttest_ind(a, b, equal_var=False) for a, b in zip(groups_1, groups_2)]
+
+    return np.array([test.statistic for test in tests]), np.array([test.pvalue for test in tests])
+
+
+def test_welch_ttest_matches_scipy():
+    rng = np.random.default_rng(0)
+    sizes = rng.integers(2, 300, size=(50, 2))
+    groups_1 = [rng.normal(3, rng.uniform(0.1, 2), n) for n in sizes[:, 0]]
+    groups_2 = [rng.normal(3.2, rng.uniform(0.1, 2), n) for n in sizes[:, 1]]
+    expected_t, expected_p = scipy_welch(groups_1, groups_2)
+
+    sums_1, sums_2 = group_sums(groups_1), group_sums(groups_2)
+    mean_1, var_1 = mean_var(sums_1['count'], sums_1['est'], sums_1['est_sq'])
+    mean_2, var_2 = mean_var(sums_2['count'], sums_2['est'], sums_2['est_sq'])
+    t, _, pvalue = welch_ttest(sums_1['count'], mean_1, var_1, sums_2['count'], mean_2, var_2)
+
+    np.testing.assert_allclose(t, expected_t, rtol=1e-8)
+    np.testing.assert_allclose(pvalue, expected_p, rtol=1e-7, atol=1e-12)
+    np.testing.assert_allclose(welch_from_sums(sums_1, sums_2), expected_p, rtol=1e-7, atol=1e-12)
+
+
+# batched edge cases, each one must give the p-value of scipy, NaN included
+EDGE_CASES = {
+    'single prediction': ([3.0], [1.0, 2.0, 4.0]),
+    'single prediction in both': ([3.0], [2.0]),
+    'zero variance in both, different means': ([2.0, 2.0, 2.0], [3.5, 3.5]),
+    'zero variance in both, same mean': ([2.0, 2.0], [2.0, 2.0, 2.0]),
+    'zero variance in one': ([2.0, 2.0, 2.0], [1.0, 3.5, 2.0]),
+    'empty neighborhood': ([], [1.0, 2.0, 3.0]),
+    'empty in both': ([], [])
+}
+
+
+def test_welch_from_sums_edge_cases_match_scipy():
+    groups_1, groups_2 = zip(*EDGE_CASES.values())
+    _, expected = scipy_welch(groups_1, groups_2)
+
+    pvalue = welch_from_sums(group_sums(groups_1), group_sums(groups_2))
+    for name, value, expected_value in zip(EDGE_CASES, pvalue, expected):
+        if np.isnan(expected_value):
+            assert np.isnan(value), name
+        else:
+            assert value == pytest.approx(expected_value, abs=1e-12), name
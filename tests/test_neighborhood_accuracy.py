@@ -0,0 +1,32 @@
+from neighborhood_eval.neighborhood_accuracy import critical_nbhds_accuracy, critical_nbhds_accuracy_vectorized, \
+    critical_nbhds_accuracy_bootstrap, _critical_nbhds_accuracy_loop
+from conftest import assert_same_critical
+import numpy as np
+import pytest
+
+
+# the reference is the original loop: pandas filters for N and D' and scipy's ttest_ind(equal_var=False)
+# per neighborhood
+@pytest.mark.parametrize('p_thresh', [0.05, 0.5])
+@pytest.mark.parametrize('n_jobs', [1, 2])
+def test_vectorized_matches_loop(workload, p_thresh, n_jobs):
+    neighborhoods, predictions_df, _, _ = workload
+    expected = _critical_nbhds_accuracy_loop(neighborhoods, predictions_df, p_thresh)
+    assert len(expected) > 0
+
+    assert_same_critical(critical_nbhds_accuracy(neighborhoods, predictions_df, p_thresh, n_jobs=n_jobs), expected)
+    assert_same_critical(critical_nbhds_accuracy_vectorized(neighborhoods, predictions_df, p_thresh, n_jobs=n_jobs),
+                         expected)
+
+
+def test_bootstrap_is_reproducible(workload):
+    neighborhoods, predictions_df, _, _ = workload
+    result = critical_nbhds_accuracy_bootstrap(neighborhoods, predictions_df, n_resamples=200, seed=3)
+    assert_same_critical(critical_nbhds_accuracy_bootstrap(neighborhoods, predictions_df, n_resamples=200, seed=3),
+                         result)
+    assert ((result['pvalue'] > 0) & (result['pvalue'] <= 1)).all()
+
+    # the neighborhood statistics are those of the Welch's engine
+    vectorized = critical_nbhds_accuracy_vectorized(neighborhoods, predictions_df, p_thresh=-1).set_index('uid')
+    np.testing.assert_allclose(result['mse_nbhd'], vectorized.loc[result['uid'], 'mse_nbhd'])
+    np.testing.assert_allclose(result['mse_equiv'], vectorized.loc[result['uid'], 'mse_equiv'])
@@ -0,0 +1,83 @@
+from neighborhood_eval.neighborhood_rankings import get_critical_nbhds, get_critical_nbhds_vectorized, \
+    _get_critical_nbhds_loop, precision_recall_at_k, precision_recall_at_k_dfs, precision_recall_at_ks
+from conftest import assert_same_critical
+from collections import defaultdict
+import pandas as pd
+import numpy as np
+import pytest
+
+
+# the reference is the original loop: pandas filters for N and D' and scipy's ttest_ind(equal_var=False)
+# per neighborhood
+@pytest.mark.parametrize('p_thresh', [0.05, 0.5])
+@pytest.mark.parametrize('n_jobs', [1, 2])
+def test_vectorized_matches_loop(workload, p_thresh, n_jobs):
+    neighborhoods, predictions_df, precisions_df, recalls_df = workload
+    expected = _get_critical_nbhds_loop(neighborhoods, predictions_df, precisions_df, recalls_df, p_thresh)
+    assert len(expected) > 0
+
+    for evaluate in [get_critical_nbhds, get_critical_nbhds_vectorized]:
+        result = evaluate(neighborhoods, predictions_df, precisions_df, recalls_df, p_thresh, n_jobs=n_jobs)
+        assert_same_critical(result, expected)
+
+
+# a neighborhood without neighbors or whose neighbors have no prediction leaves the t-test with an empty sample
+def test_empty_neighborhoods_match_loop(workload):
+    neighborhoods, predictions_df, precisions_df, recalls_df = workload
+    neighborhoods = dict(neighborhoods)
+    anchors = list(neighborhoods)
+    neighborhoods[anchors[0]] = []
+    neighborhoods[anchors[1]] = [10**6, 10**6 + 1]
+
+    frames = (predictions_df, precisions_df, recalls_df)
+    assert_same_critical(get_critical_nbhds(neighborhoods, *frames, p_thresh=-1),
+                         _get_critical_nbhds_loop(neighborhoods, *frames, p_thresh=-1))
+
+
+# the original per-user loop of precision_recall_at_k, ratings sorted by estimate with a stable list sort
+def loop_precision_recall(predictions, k, threshold):
+    user_est_true = defaultdict(list)
+    for uid, _, true_r, est, _ in predictions:
+        user_est_true[uid].append((est, true_r))
+
+    precisions, recalls = dict(), dict()
+    for uid, user_ratings in user_est_true.items():
+        user_ratings.sort(key=lambda x: x[0], reverse=True)
+        n_rel = sum((true_r >= threshold) for (_, true_r) in user_ratings)
+        n_rec_k = sum((est >= threshold) for (est, _) in user_ratings[:k])
+        n_rel_and_rec_k = sum(((true_r >= threshold) and (est >= threshold)) for (est, true_r) in user_ratings[:k])
+        precisions[uid] = n_rel_and_rec_k / n_rec_k if n_rec_k != 0 else 0
+        recalls[uid] = n_rel_and_rec_k / n_rel if n_rel != 0 else 0
+
+    return precisions, recalls
+
+
+# estimates rounded to half stars, so that the top-k cut often falls among tied estimates
+@pytest.mark.parametrize('k', [1, 3, 10, 1000])
+def test_precision_recall_at_k_matches_loop(workload, k):
+    _, predictions_df, _, _ = workload
+    predictions_df = predictions_df.assign(est=(predictions_df['est'] * 2).round() / 2)
+    predictions = list(predictions_df[['uid', 'iid', 'r_ui', 'est', 'details']].itertuples(index=False, name=None))
+    expected = loop_precision_recall(predictions, k, 3.5)
+
+    assert precision_recall_at_k(predictions, k, 3.5) == expected
+
+    precisions, recalls = precision_recall_at_k_dfs(
+        predictions_df.rename({'uid': 'userID', 'r_ui': 'rating', 'est': 'prediction'}, axis=1), k, 3.5)
+    assert precisions == expected[0] and recalls == expected[1]
+    assert list(precisions) == list(set(predictions_df['uid'].to_list()))
+
+
+def test_precision_recall_at_ks_matches_single_k(workload):
+    _, predictions_df, _, _ = workload
+    user_codes, users = pd.factorize(predictions_df['uid'])
+    est, true_r = predictions_df['est'].to_numpy(), predictions_df['r_ui'].to_numpy()
+    metrics = precision_recall_at_ks(user_codes, est, true_r, ks=(1, 5, 20))
+
+    for k in (1, 5, 20):
+        precisions, recalls = precision_recall_at_k(
+            list(predictions_df[['uid', 'iid', 'r_ui', 'est', 'details']].itertuples(index=False, name=None)), k)
+        assert metrics['precision@' + str(k)].tolist() == [precisions[uid] for uid in users]
+        assert metrics['recall@' + str(k)].tolist() == [recalls[uid] for uid in users]
+    assert metrics['n_rel'].tolist() == (predictions_df['r_ui'] >= 3.5).groupby(user_codes).sum().tolist()
+    assert len(precision_recall_at_ks(np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0))) == 0
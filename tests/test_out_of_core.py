@@ -0,0 +1,39 @@
+from neighborhood_eval.out_of_core import write_prediction_shards, critical_nbhds_accuracy_out_of_core, \
+    get_critical_nbhds_out_of_core
+from neighborhood_eval.neighborhood_accuracy import critical_nbhds_accuracy_vectorized
+from neighborhood_eval.neighborhood_rankings import get_critical_nbhds_vectorized
+from conftest import assert_same_critical
+import pytest
+
+
+def shard_columns(predictions_df, uids):
+    return {'uid': uids, 'r_ui': predictions_df['r_ui'].to_numpy(), 'est': predictions_df['est'].to_numpy()}
+
+
+@pytest.mark.parametrize('as_object', [False, True])
+def test_accuracy_matches_vectorized(workload, tmp_path, as_object):
+    neighborhoods, predictions_df, _, _ = workload
+    uids = predictions_df['uid'].to_numpy()
+    write_prediction_shards(shard_columns(predictions_df, uids.astype(object) if as_object else uids), str(tmp_path),
+                            shard_size=700)
+
+    assert_same_critical(critical_nbhds_accuracy_out_of_core(neighborhoods, str(tmp_path)),
+                         critical_nbhds_accuracy_vectorized(neighborhoods, predictions_df))
+
+
+def test_rankings_matches_vectorized(workload, tmp_path):
+    neighborhoods, predictions_df, precisions_df, recalls_df = workload
+    write_prediction_shards(predictions_df, str(tmp_path), shard_size=700)
+
+    assert_same_critical(
+        get_critical_nbhds_out_of_core(neighborhoods, str(tmp_path), precisions_df, recalls_df),
+        get_critical_nbhds_vectorized(neighborhoods, predictions_df, precisions_df, recalls_df))
+
+
+def test_unmatched_ids_raise(workload, tmp_path):
+    neighborhoods, predictions_df, _, _ = workload
+    write_prediction_shards(shard_columns(predictions_df, predictions_df['uid'].to_numpy().astype(str)),
+                            str(tmp_path))
+
+    with pytest.raises(ValueError):
+        critical_nbhds_accuracy_out_of_core(neighborhoods, str(tmp_path))
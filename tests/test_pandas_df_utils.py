@@ -0,0 +1,57 @@
+from recommenders.datasets.pandas_df_utils import PandasHash, lru_cache_df
+import pandas as pd
+import numpy as np
+import pytest
+
+
+def ratings(seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'userID': rng.integers(0, 50, 200), 'itemID': rng.integers(0, 80, 200),
+                         'rating': rng.integers(1, 6, 200).astype(float), 'title': ['t' + str(i) for i in range(200)]})
+
+
+def test_equal_frames_hash_alike_and_edits_change_the_hash():
+    df = ratings()
+    assert PandasHash(df) == PandasHash(df.copy()) and hash(PandasHash(df)) == hash(PandasHash(df.copy()))
+    assert PandasHash(df['rating']) == PandasHash(df['rating'].copy())
+    assert PandasHash(df) != PandasHash(df['rating']) and PandasHash(df) != df
+
+    for other in [df.astype({'rating': np.float32}), df.rename(columns={'title': 'name'}), df.iloc[:-1],
+                  df.assign(title=df['title'].astype('category'))]:
+        assert PandasHash(other) != PandasHash(df)
+
+    # the digest is computed on every call, so an in place edit changes it
+    edited = df.copy()
+    before = hash(PandasHash(edited))
+    edited.loc[3, 'rating'] += 1
+    assert hash(PandasHash(edited)) != before and PandasHash(edited) != PandasHash(df)
+
+    with pytest.raises(TypeError):
+        PandasHash(df.to_numpy())
+
+
+# the unhashable values of the object columns (e.g. the details dicts of surprise) are hashed through their str
+def test_unhashable_values():
+    df = pd.DataFrame({'uid': [1, 2], 'details': [{'was_impossible': False}, {'was_impossible': True}]})
+    assert PandasHash(df) == PandasHash(df.copy())
+    assert PandasHash(df) != PandasHash(df.assign(details=[{'was_impossible': False}, {'was_impossible': False}]))
+
+
+def test_lru_cache_df_hits_on_equal_frames_and_misses_after_edits():
+    calls = []
+
+    @lru_cache_df(maxsize=2)
+    def top_rating(df, col='rating'):
+        calls.append(len(df))
+        return df[col].max()
+
+    df = ratings()
+    assert top_rating(df) == top_rating(df.copy()) == top_rating(df, col='rating') == df['rating'].max()
+    assert top_rating.cache_info().hits == 1 and len(calls) == 2
+
+    edited = df.copy()
+    edited.loc[0, 'rating'] = 10
+    assert top_rating(edited) == 10 and len(calls) == 3
+
+    top_rating.cache_clear()
+    assert top_rating.cache_info().currsize == 0
@@ -0,0 +1,55 @@
+from util.predictions import predict_columnar, prediction_loss, to_predictions_df
+from neighborhood_eval.neighborhood_accuracy import critical_nbhds_accuracy, _critical_nbhds_accuracy_loop
+from neighborhood_eval.neighborhood_rankings import get_critical_nbhds, _get_critical_nbhds_loop
+from conftest import assert_same_critical
+import pandas as pd
+import numpy as np
+import pytest
+
+
+# the columns of predict_columnar (categorical uid) in place of predictions_df
+def test_columnar_predictions_feed_the_evaluators(workload):
+    neighborhoods, predictions_df, precisions_df, recalls_df = workload
+    columns = {name: predictions_df[name].to_numpy() for name in ['r_ui', 'est', 'prediction_loss']}
+    columns['uid'] = pd.Categorical(predictions_df['uid'])
+
+    assert_same_critical(critical_nbhds_accuracy(neighborhoods, columns),
+                         _critical_nbhds_accuracy_loop(neighborhoods, predictions_df))
+    assert_same_critical(get_critical_nbhds(neighborhoods, columns, precisions_df, recalls_df),
+                         _get_critical_nbhds_loop(neighborhoods, predictions_df, precisions_df, recalls_df))
+
+
+def test_prediction_loss():
+    r_ui, est = np.array([1.0, 4.0]), np.array([2.5, 3.0])
+
+    assert prediction_loss(r_ui, est).tolist() == [2.25, 1.0]
+    assert prediction_loss(r_ui, est, 'absolute').tolist() == [1.5, 1.0]
+    with pytest.raises(ValueError):
+        prediction_loss(r_ui, est, 'huber')
+
+
+# predict_columnar returns the estimates of algo.test() for a factor model (closed form) and a KNN model (predict)
+@pytest.mark.parametrize('algo_name', ['SVD', 'NMF', 'KNNBasic'])
+def test_predict_columnar_matches_algo_test(algo_name):
+    surprise = pytest.importorskip('surprise')
+
+    rng = np.random.default_rng(0)
+    ratings = pd.DataFrame({'user_id': rng.integers(0, 40, 600), 'item_id': rng.integers(0, 60, 600),
+                            'rating': rng.integers(1, 6, 600).astype(float)}).drop_duplicates(['user_id', 'item_id'])
+    train, test = ratings.iloc[:450], ratings.iloc[450:]
+    # users and items unknown to the model
+    test = pd.concat([test, pd.DataFrame({'user_id': [1000, 0], 'item_id': [0, 1000], 'rating': [3.0, 4.0]})])
+
+    data = surprise.Dataset.load_from_df(train, surprise.Reader(rating_scale=(1, 5)))
+    algo = getattr(surprise, algo_name)(random_state=0) if algo_name != 'KNNBasic' else surprise.KNNBasic(verbose=False)
+    algo.fit(data.build_full_trainset())
+    testset = list(test.itertuples(index=False, name=None))
+
+    expected = pd.DataFrame(algo.test(testset))
+    predictions = to_predictions_df(predict_columnar(algo, testset, batch_size=50))
+
+    assert predictions['uid'].tolist() == expected['uid'].tolist()
+    assert predictions['iid'].tolist() == expected['iid'].tolist()
+    np.testing.assert_allclose(predictions['est'], expected['est'], rtol=1e-12)
+    np.testing.assert_allclose(predictions['prediction_loss'], (expected['r_ui'] - expected['est'])**2, rtol=1e-12)
+    assert predictions['was_impossible'].tolist() == [details['was_impossible'] for details in expected['details']]
@@ -0,0 +1,213 @@
+import pytest
+
+# the evaluation module imports its classification metrics from scikit-learn
+pytest.importorskip('sklearn')
+
+from recommenders.evaluation.python_evaluation import RankingEvaluator, precision_at_k, recall_at_k, ndcg_at_k, \
+    map_at_k, get_top_k_items, get_top_k_items_dense, get_ground_truth_csr, DiversityEvaluator, user_diversity, \
+    diversity, historical_item_novelty, novelty, user_item_serendipity, user_serendipity, serendipity, \
+    catalog_coverage, distributional_coverage
+import pandas as pd
+import numpy as np
+
+
+# ground truth and predictions sharing most of their users, with scores rounded so that many predictions are tied
+def ranking_frames(n_users=40, n_items=60, seed=0):
+    rng = np.random.default_rng(seed)
+    true_rows, pred_rows = [], []
+    for user in range(n_users):
+        if user % 7 != 3:
+            for item in rng.choice(n_items, int(rng.integers(1, 12)), replace=False):
+                true_rows.append((user, int(item), float(rng.integers(1, 6))))
+        if user % 11 != 5:
+            for item in rng.choice(n_items, int(rng.integers(1, 30)), replace=False):
+                pred_rows.append((user, int(item), round(float(rng.uniform(0, 1)), 1)))
+
+    return pd.DataFrame(true_rows, columns=['userID', 'itemID', 'rating']), \
+        pd.DataFrame(pred_rows, columns=['userID', 'itemID', 'prediction'])
+
+
+# top k of every user in input order among ties, as nlargest keeps them
+def loop_hits(rating_true, rating_pred, k):
+    relevant = rating_true.groupby('userID')['itemID'].apply(set).to_dict()
+    hits = dict()
+    for user, group in rating_pred.groupby('userID'):
+        if user in relevant:
+            hits[user] = [item in relevant[user] for item in group.nlargest(k, 'prediction')['itemID']]
+
+    return hits
+
+
+@pytest.mark.parametrize('relevancy_method', ['top_k', 'by_threshold', None])
+def test_ranking_evaluator_matches_the_metric_functions(relevancy_method):
+    rating_true, rating_pred = ranking_frames()
+    if relevancy_method is None:
+        rating_pred = rating_pred.sort_values(['userID', 'prediction'], ascending=[True, False], kind='stable')
+    evaluator = RankingEvaluator(rating_true, rating_pred, relevancy_method=relevancy_method, k=[10, 1, 3, 10],
+                                 threshold=5)
+    metrics = evaluator.evaluate()
+
+    assert evaluator.ks == [1, 3, 10]
+    for k in evaluator.ks:
+        for name, metric in [('precision', precision_at_k), ('recall', recall_at_k), ('ndcg', ndcg_at_k),
+                             ('map', map_at_k)]:
+            expected = metric(rating_true, rating_pred, relevancy_method=relevancy_method, k=k, threshold=5)
+            assert metrics[name + '@' + str(k)] == pytest.approx(expected, rel=1e-12), (name, k)
+
+
+def test_hit_rate_and_mrr_match_a_loop():
+    rating_true, rating_pred = ranking_frames(seed=1)
+    per_user = RankingEvaluator(rating_true, rating_pred, k=[1, 5]).evaluate(per_user=True).set_index('userID')
+
+    for k in [1, 5]:
+        hits = loop_hits(rating_true, rating_pred, k)
+        assert sorted(per_user.index) == sorted(hits)
+        np.testing.assert_array_equal(per_user.loc[list(hits), 'hit_rate@' + str(k)], [any(h) for h in hits.values()])
+        np.testing.assert_allclose(per_user.loc[list(hits), 'mrr@' + str(k)],
+                                   [1 / (h.index(True) + 1) if any(h) else 0 for h in hits.values()])
+
+
+def test_no_common_users():
+    rating_true, rating_pred = ranking_frames()
+    metrics = RankingEvaluator(rating_true, rating_pred.assign(userID=rating_pred['userID'] + 1000), k=5).evaluate()
+
+    assert set(metrics.values()) == {0.0} and len(metrics) == 6
+
+
+# the original get_top_k_items: nlargest per user group, whose order among tied ratings is only the input order
+# (keep='first') when k is below the group size, pandas falls back to an unstable sort otherwise
+def groupby_top_k_items(dataframe, k):
+    top_k_items = dataframe.groupby('userID', as_index=False).apply(lambda x: x.nlargest(k, 'prediction')) \
+        .reset_index(drop=True)
+    top_k_items['rank'] = top_k_items.groupby('userID', sort=False).cumcount() + 1
+
+    return top_k_items
+
+
+@pytest.mark.parametrize('k', [1, 4, 100])
+def test_get_top_k_items_matches_groupby_nlargest(k):
+    _, rating_pred = ranking_frames(seed=2)
+    rating_pred = rating_pred.sample(frac=1, random_state=0)
+    top_k_items = get_top_k_items(rating_pred, col_rating='prediction', k=k)
+
+    # ties in input order
+    stable = rating_pred.sort_values(['userID', 'prediction'], ascending=[True, False], kind='stable') \
+        .groupby('userID').head(k).reset_index(drop=True)
+    stable['rank'] = stable.groupby('userID').cumcount() + 1
+    pd.testing.assert_frame_equal(top_k_items, stable)
+
+    # the same ranks, scores and items per user as the original, up to the order of the ties
+    expected = groupby_top_k_items(rating_pred, k)
+    columns = ['userID', 'prediction', 'rank']
+    pd.testing.assert_frame_equal(top_k_items[columns], expected[columns])
+    assert top_k_items.groupby('userID')['itemID'].apply(set).equals(expected.groupby('userID')['itemID'].apply(set))
+
+
+# a long DataFrame of every score sorted by item ranks the tied scores by item, as the dense path does
+@pytest.mark.parametrize('k', [1, 5, 30])
+def test_get_top_k_items_dense_matches_the_long_frame(k):
+    rng = np.random.default_rng(3)
+    scores = np.round(rng.uniform(0, 1, (25, 30)), 1)
+    scores[rng.uniform(size=scores.shape) < 0.1] = np.nan
+    user_ids, item_ids = np.arange(100, 125), np.arange(30) * 2
+
+    long_df = pd.DataFrame({'userID': np.repeat(user_ids, 30), 'itemID': np.tile(item_ids, 25),
+                            'prediction': scores.ravel()})
+    expected = get_top_k_items(long_df.fillna({'prediction': -np.inf}), col_rating='prediction', k=k)
+    expected['prediction'] = expected['prediction'].replace(-np.inf, np.nan)
+
+    result = get_top_k_items_dense(scores, user_ids, item_ids, k=k, block_size=7)
+    pd.testing.assert_frame_equal(result, expected[result.columns], check_dtype=False)
+
+
+def test_get_top_k_items_dense_checks_the_shape():
+    with pytest.raises(ValueError):
+        get_top_k_items_dense(np.zeros((3, 4)), np.arange(3), np.arange(5))
+
+
+# the scores of every item of every user, whose long DataFrame ranks the tied scores by item like the dense path
+def dense_scores(n_users=30, n_items=40, seed=4):
+    rng = np.random.default_rng(seed)
+    scores = np.round(rng.uniform(0, 1, (n_users, n_items)), 1)
+    user_ids, item_ids = np.arange(n_users) * 3, np.arange(n_items) + 500
+    rating_pred = pd.DataFrame({'userID': np.repeat(user_ids, n_items), 'itemID': np.tile(item_ids, n_users),
+                                'prediction': scores.ravel()})
+
+    return scores, user_ids, item_ids, rating_pred
+
+
+# relevant items of scored and unscored users, including items without scores that can never be recommended
+def test_from_scores_matches_the_long_frame():
+    scores, user_ids, item_ids, rating_pred = dense_scores()
+    rng = np.random.default_rng(5)
+    rating_true = pd.DataFrame({'userID': rng.choice(np.arange(100), 300),
+                                'itemID': rng.choice(np.arange(490, 550), 300),
+                                'rating': 1.0}).drop_duplicates(['userID', 'itemID'])
+
+    ground_truth = get_ground_truth_csr(rating_true, user_ids, item_ids)
+    assert ground_truth.shape[0] == len(user_ids) and ground_truth.shape[1] > len(item_ids)
+
+    result = RankingEvaluator.from_scores(scores, ground_truth, user_ids, k=[1, 5, 50], block_size=4)
+    expected = RankingEvaluator(rating_true, rating_pred, k=[1, 5, 50])
+    for name, value in expected.evaluate().items():
+        assert result.evaluate()[name] == pytest.approx(value, rel=1e-12), name
+    pd.testing.assert_frame_equal(result.evaluate(per_user=True).sort_values('userID').reset_index(drop=True),
+                                  expected.evaluate(per_user=True).sort_values('userID').reset_index(drop=True))
+
+
+def test_from_scores_checks_the_shape():
+    scores, user_ids, item_ids, _ = dense_scores()
+    with pytest.raises(ValueError):
+        RankingEvaluator.from_scores(scores, np.zeros((len(user_ids), len(item_ids) - 1)))
+
+
+# histories and recommendations of unseen items (some users with a single recommendation or without history), item
+# feature vectors for the feature similarity and a relevance flag for serendipity
+def diversity_frames(n_users=25, n_items=40, seed=6):
+    rng = np.random.default_rng(seed)
+    train_rows, reco_rows = [], []
+    for user in range(n_users):
+        history = rng.choice(n_items, int(rng.integers(0 if user % 9 == 4 else 1, 12)), replace=False)
+        train_rows.extend((user, int(item)) for item in history)
+        unseen = np.setdiff1d(np.arange(n_items), history)
+        for item in rng.choice(unseen, 1 if user % 5 == 2 else 6, replace=False):
+            reco_rows.append((user, int(item), float(rng.integers(0, 2))))
+
+    train_df = pd.DataFrame(train_rows, columns=['userID', 'itemID'])
+    reco_df = pd.DataFrame(reco_rows, columns=['userID', 'itemID', 'relevance'])
+    item_feature_df = pd.DataFrame({'itemID': np.arange(n_items),
+                                    'features': list(rng.uniform(0, 1, (n_items, 5)))})
+
+    return train_df, reco_df, item_feature_df
+
+
+@pytest.mark.parametrize('item_sim_measure', ['item_cooccurrence_count', 'item_feature_vector'])
+@pytest.mark.parametrize('col_relevance', [None, 'relevance'])
+def test_diversity_evaluator_matches_the_metric_functions(item_sim_measure, col_relevance):
+    train_df, reco_df, item_feature_df = diversity_frames()
+    feature_df = item_feature_df if item_sim_measure == 'item_feature_vector' else None
+    evaluator = DiversityEvaluator(train_df, reco_df, feature_df, item_sim_measure, col_relevance=col_relevance,
+                                   block_size=4)
+    similarity_args = dict(item_feature_df=feature_df, item_sim_measure=item_sim_measure, col_relevance=col_relevance)
+
+    for method, metric, kwargs in [('user_diversity', user_diversity, similarity_args),
+                                   ('historical_item_novelty', historical_item_novelty, dict()),
+                                   ('user_item_serendipity', user_item_serendipity, similarity_args),
+                                   ('user_serendipity', user_serendipity, similarity_args)]:
+        result = getattr(evaluator, method)()
+        expected = metric(train_df, reco_df, **kwargs)
+        assert len(result) > 0
+        pd.testing.assert_frame_equal(result, expected.reset_index(drop=True), check_dtype=False, rtol=1e-6,
+                                      obj=method)
+
+    for method, metric, kwargs in [('diversity', diversity, similarity_args), ('novelty', novelty, dict()),
+                                   ('serendipity', serendipity, similarity_args),
+                                   ('catalog_coverage', catalog_coverage, dict()),
+                                   ('distributional_coverage', distributional_coverage, dict())]:
+        assert getattr(evaluator, method)() == pytest.approx(metric(train_df, reco_df, **kwargs), rel=1e-6), method
+
+
+def test_diversity_evaluator_rejects_seen_items():
+    train_df, reco_df, _ = diversity_frames()
+    with pytest.raises(Exception):
+        DiversityEvaluator(train_df, pd.concat([reco_df, train_df.iloc[:1].assign(relevance=1.0)]))
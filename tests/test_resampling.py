@@ -0,0 +1,46 @@
+from neighborhood_eval.resampling import bootstrap_pvalues
+from scipy import stats
+import numpy as np
+
+
+# neighborhoods drawn at random from a large pool, D' being the pool minus the neighbor rows as in the evaluators
+def null_neighborhoods(values, n_nbhds, rng):
+    sizes, rest_sizes, observed, welch = [], [], [], []
+    for _ in range(n_nbhds):
+        rows = rng.choice(len(values), int(rng.integers(40, 300)), replace=False)
+        neighbor_rows = rows[int(rng.integers(5, 30)):]
+        rest = np.delete(values, neighbor_rows)
+
+        sizes.append(len(rows))
+        rest_sizes.append(len(rest))
+        observed.append(values[rows].mean() - rest.mean())
+        welch.append(stats.ttest_ind(values[rows], rest, equal_var=False).pvalue)
+
+    return sizes, rest_sizes, observed, np.array(welch)
+
+
+# under the null the bootstrap p-values agree with the Welch's ones up to the Monte Carlo error of the resamples
+def test_bootstrap_matches_welch_under_the_null():
+    rng = np.random.default_rng(0)
+    values = rng.normal(3.5, 1, 20000)
+    sizes, rest_sizes, observed, welch = null_neighborhoods(values, 60, rng)
+
+    pvalues = bootstrap_pvalues(values, sizes, observed, n_resamples=4000, seed=1, rest_sizes=rest_sizes)
+
+    assert np.abs(pvalues - welch).max() < 0.07
+    assert np.abs(pvalues - welch).mean() < 0.025
+    assert np.corrcoef(pvalues, welch)[0, 1] > 0.99
+
+
+# empty neighborhoods and undefined observed differences get no p-value
+def test_seeded_pvalues_skip_untestable_neighborhoods():
+    rng = np.random.default_rng(2)
+    values = rng.normal(3.5, 1, 2000)
+    sizes, rest_sizes, observed, _ = null_neighborhoods(values, 10, rng)
+    sizes, rest_sizes = sizes + [0, 50], rest_sizes + [2000, 1950]
+    observed = observed + [0.1, np.nan]
+
+    pvalues = bootstrap_pvalues(values, sizes, observed, n_resamples=300, seed=3, rest_sizes=rest_sizes)
+    assert np.isnan(pvalues[-2:]).all() and ((pvalues[:-2] > 0) & (pvalues[:-2] <= 1)).all()
+    np.testing.assert_array_equal(
+        bootstrap_pvalues(values, sizes, observed, n_resamples=300, seed=3, rest_sizes=rest_sizes), pvalues)
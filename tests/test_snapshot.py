@@ -0,0 +1,71 @@
+from util.snapshot import load_dataset_snapshot
+from util.ratings_files import read_ratings
+import pandas as pd
+import numpy as np
+import os
+
+
+def write_ratings(ds_path, n_users=30, seed=0, movielens_header=True):
+    rng = np.random.default_rng(seed)
+    n = 400
+    ratings = pd.DataFrame({'userId': np.sort(rng.integers(0, n_users, n)), 'movieId': rng.integers(1, 300, n),
+                            'rating': rng.integers(1, 11, n) / 2, 'timestamp': rng.integers(10**9, 2 * 10**9, n)})
+    os.makedirs(ds_path, exist_ok=True)
+    ratings.to_csv(os.path.join(ds_path, 'ratings.csv'), index=False, header=movielens_header)
+
+    return ratings
+
+
+# load_dataset_explicit keeps the users 1 -> total_users - 1 of ml-latest
+def explicit_ratings(ds_name, ds_path, total_users):
+    ratings = read_ratings(ds_name, ds_path)
+    if ds_name == 'ml-latest':
+        ratings = ratings[ratings.user_id.isin(list(range(1, total_users)))]
+
+    return ratings.reset_index(drop=True)
+
+
+def assert_same_ratings(snapshot, expected):
+    assert list(snapshot.columns) == list(expected.columns)
+    for name in expected.columns:
+        np.testing.assert_array_equal(snapshot[name].to_numpy(), expected[name].to_numpy(), err_msg=name)
+
+
+def test_snapshot_matches_the_raw_file(tmp_path):
+    ds_path = str(tmp_path / 'ml-latest')
+    write_ratings(ds_path)
+
+    for ds_name, total_users in [('ml-latest', 10), ('ml-latest', 10000), ('ml-latest-small', 10)]:
+        expected = explicit_ratings(ds_name, ds_path, total_users)
+        snapshot = load_dataset_snapshot(ds_name, ds_path, total_users, snapshot_dir=str(tmp_path / ds_name))
+        assert_same_ratings(snapshot, expected)
+        # the second load reads the snapshot written by the first one
+        assert_same_ratings(load_dataset_snapshot(ds_name, ds_path, total_users, str(tmp_path / ds_name)), expected)
+
+    assert snapshot['user_id'].dtype == np.int32 and snapshot['rating'].dtype == np.float32
+
+
+# ml-1m is split on ':' with the C engine instead of the '::' separator of the python engine
+def test_ml_1m_parsing(tmp_path):
+    ratings = write_ratings(str(tmp_path), movielens_header=False)
+    lines = ['::'.join(str(value) for value in row) for row in ratings.itertuples(index=False)]
+    with open(tmp_path / 'ratings.dat', 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+    expected = pd.read_csv(tmp_path / 'ratings.dat', delimiter='::', engine='python',
+                           names=['user_id', 'item_id', 'rating', 'timestamp'])
+    assert_same_ratings(read_ratings('ml-1m', str(tmp_path)), expected)
+    assert_same_ratings(load_dataset_snapshot('ml-1m', str(tmp_path)), expected)
+
+
+# a raw file that changed since the snapshot was written is parsed again
+def test_stale_snapshot_is_rebuilt(tmp_path):
+    ds_path = str(tmp_path)
+    write_ratings(ds_path, seed=0)
+    load_dataset_snapshot('ml-latest-small', ds_path)
+
+    write_ratings(ds_path, n_users=50, seed=1)
+    os.utime(os.path.join(ds_path, 'ratings.csv'), (0, 10**9))
+
+    assert_same_ratings(load_dataset_snapshot('ml-latest-small', ds_path),
+                        explicit_ratings('ml-latest-small', ds_path, 10000))
@@ -0,0 +1,52 @@
+from util.streaming import stream_dataset, load_encoded, encode_chunk
+from util.ratings_files import read_ratings
+import pandas as pd
+import numpy as np
+import pytest
+import os
+
+
+def write_amazon(ds_path, user_ids, item_ids, seed=0):
+    rng = np.random.default_rng(seed)
+    n = len(user_ids)
+    pd.DataFrame({'user_id': user_ids, 'item_id': item_ids, 'rating': rng.integers(1, 6, n).astype(float),
+                  'timestamp': rng.integers(10**9, 2 * 10**9, n)}).to_csv(
+        os.path.join(ds_path, 'ratings.csv'), index=False, header=False)
+
+
+# numeric ids are parsed as ints by load_dataset_explicit, whose categories are then in numeric order (7 < 40 < 100)
+# and not in string order ('100' < '40' < '7')
+@pytest.mark.parametrize('numeric', [True, False])
+def test_sorted_codes_match_load_dataset_explicit(tmp_path, numeric):
+    rng = np.random.default_rng(0)
+    users = rng.choice([7, 40, 100, 5, 12, 3000], 500)
+    items = rng.integers(1, 250, 500)
+    if not numeric:
+        users = np.array(['A' + str(user) for user in users], dtype=object)
+        items = np.array(['B' + str(item).zfill(4) if item % 3 else str(item) for item in items], dtype=object)
+    write_amazon(str(tmp_path), users, items)
+
+    meta = stream_dataset('amazon-2', str(tmp_path), str(tmp_path / 'encoded'), chunksize=64)
+    encoded = load_encoded(str(tmp_path / 'encoded'))
+    expected = read_ratings('amazon-2', str(tmp_path))
+
+    assert meta['chunks'] == 8 and meta['rows'] == 500
+    for name in ['user_id', 'item_id', 'rating', 'timestamp']:
+        np.testing.assert_array_equal(encoded[name], expected[name], err_msg=name)
+
+    # the id tables map the codes back to the raw ids
+    user_ids = np.load(str(tmp_path / 'encoded' / 'user_ids.npy'))
+    assert user_ids[encoded['user_id']].tolist() == [str(user) for user in users]
+
+
+def test_missing_ids_are_rejected(tmp_path):
+    codes_dict = dict()
+    assert encode_chunk(pd.Series(['b', 'a', 'b']), codes_dict).tolist() == [0, 1, 0]
+    assert encode_chunk(pd.Series(['c', 'a']), codes_dict).tolist() == [2, 1]
+    with pytest.raises(ValueError):
+        encode_chunk(pd.Series(['a', None, 'd']), codes_dict)
+
+    with open(tmp_path / 'ratings.csv', 'w') as f:
+        f.write('u1,i1,4.0,1000000000\n,i2,3.0,1000000001\n')
+    with pytest.raises(ValueError):
+        stream_dataset('amazon-2', str(tmp_path), str(tmp_path / 'encoded'))
@@ -0,0 +1,48 @@
+from neighborhood_eval.neighborhood_accuracy import critical_nbhds_accuracy_vectorized
+from neighborhood_eval.neighborhood_rankings import get_critical_nbhds_vectorized
+from neighborhood_eval.sweep import critical_nbhds_accuracy_sweep, get_critical_nbhds_sweep, sweep_ks, sweep_summary
+from conftest import assert_same_critical
+import numpy as np
+import pytest
+
+
+def test_accuracy_sweep_matches_truncated_neighborhoods(workload):
+    neighborhoods, predictions_df, _, _ = workload
+    sweep_df = critical_nbhds_accuracy_sweep(neighborhoods, predictions_df, ks=(3, 6), p_threshs=(0.05, 0.5))
+
+    for k in (3, 6):
+        truncated = {uid: nbhd[:k] for uid, nbhd in neighborhoods.items()}
+        for p_thresh in (0.05, 0.5):
+            expected = critical_nbhds_accuracy_vectorized(truncated, predictions_df, p_thresh)
+            rows = sweep_df.xs((k, p_thresh), level=['k', 'p_thresh'])
+            critical = rows[rows['critical']].reset_index()
+            assert_same_critical(critical[expected.columns.drop(['nbhd', 'mask'])], expected)
+
+
+def test_rankings_sweep_matches_truncated_neighborhoods(workload):
+    neighborhoods, predictions_df, precisions_df, recalls_df = workload
+    sweep_df = get_critical_nbhds_sweep(neighborhoods, predictions_df, precisions_df, recalls_df, ks=(3, 6),
+                                        p_threshs=(0.5,))
+
+    for k in (3, 6):
+        truncated = {uid: nbhd[:k] for uid, nbhd in neighborhoods.items()}
+        expected = get_critical_nbhds_vectorized(truncated, predictions_df, precisions_df, recalls_df, 0.5)
+        rows = sweep_df.xs((k, 0.5), level=['k', 'p_thresh'])
+        assert list(rows[rows['critical']].index) == list(expected['uid'])
+
+
+def test_ks_are_sorted_and_deduplicated(workload):
+    neighborhoods, predictions_df, _, _ = workload
+    assert sweep_ks((6, 3, np.int64(6))) == [3, 6]
+
+    sweep_df = critical_nbhds_accuracy_sweep(neighborhoods, predictions_df, ks=(6, 3, 6))
+    assert list(sweep_summary(sweep_df).index.get_level_values('k')) == [3, 6]
+
+
+@pytest.mark.parametrize('ks', [(), (0,), (5, 0), (-1, 5), (2.5,), (True,), ('5',)])
+def test_invalid_ks_are_rejected(workload, ks):
+    neighborhoods, predictions_df, precisions_df, recalls_df = workload
+    with pytest.raises(ValueError):
+        critical_nbhds_accuracy_sweep(neighborhoods, predictions_df, ks=ks)
+    with pytest.raises(ValueError):
+        get_critical_nbhds_sweep(neighborhoods, predictions_df, precisions_df, recalls_df, ks=ks)
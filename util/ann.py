@@ -0,0 +1,200 @@
+'''
+    approximate nearest-neighbor backend for the neighborhood construction (IVF-style coarse quantizer in numpy)
+    users are clustered with a spherical k-means over a low-dimensional projection of their vectors, each user is then
+    compared only with the members of its n_probe closest clusters, and the candidates are scored with the cosine of
+    the full vectors (mean-centered rating rows or latent factors)
+    the fitted object exposes trainset/get_neighbors, so it plugs into get_knn like a fitted surprise KNN algorithm
+'''
+from util.knn import top_k_block
+from util.nbhd_builder import ratings_matrices, UserCodes
+from util.instrumentation import stage
+from scipy import sparse
+import pandas as pd
+import numpy as np
+
+
+class IVFNeighbors:
+
+    def __init__(self, n_clusters=None, n_probe=8, n_components=64, n_iter=10, seed=None):
+        self.n_clusters = n_clusters
+        self.n_probe = n_probe
+        self.n_components = n_components
+        self.n_iter = n_iter
+        self.rng = np.random.default_rng(seed)
+        self.knn = None
+
+    # users are described by their mean-centered, L2-normalized rating rows
+    def fit(self, ratings):
+        with stage('fit', rows=len(ratings), algo=type(self).__name__):
+            raw_users, r, b, _ = ratings_matrices(ratings)
+            means = np.asarray(r.sum(axis=1)).ravel() / np.maximum(np.asarray(b.sum(axis=1)).ravel(), 1)
+            centered = (r - sparse.diags(means) @ b).tocsr()
+
+            # random projection of the sparse rows, used only to build the coarse quantizer
+            gaussian = self.rng.standard_normal((centered.shape[1], self.n_components)) / np.sqrt(self.n_components)
+
+            return self._fit(raw_users, normalize_rows(centered), centered @ gaussian)
+
+    # users are described by latent factors (one row of factors per raw user id)
+    def fit_factors(self, user_ids, factors):
+        factors = np.asarray(factors, dtype=np.float64)
+
+        with stage('fit', rows=len(factors), algo=type(self).__name__):
+            return self._fit(pd.Index(user_ids), normalize_rows(factors), factors)
+
+    def _fit(self, raw_users, vectors, projection):
+        self.trainset = UserCodes(raw_users)
+        self.vectors = vectors
+        self.knn = None
+
+        n = len(raw_users)
+        n_clusters = self.n_clusters or max(1, int(np.sqrt(n)))
+        self.centroids, self.assignment = spherical_kmeans(
+            normalize_rows(projection), min(n_clusters, n), self.n_iter, self.rng)
+        self.projection = normalize_rows(projection)
+
+        return self
+
+    # top-k approximate neighbors of all users as a CSR-style (indptr, indices) int32 structure over the user codes
+    def knn_csr(self, nbhd_size=10):
+        if self.knn is not None and self.knn[0] >= nbhd_size:
+            return prefix_csr(self.knn[1], self.knn[2], nbhd_size)
+
+        n = self.vectors.shape[0]
+        n_probe = min(self.n_probe, self.centroids.shape[0])
+        best_scores = np.full((n, nbhd_size), -np.inf)
+        best_ids = np.full((n, nbhd_size), -1, dtype=np.int64)
+
+        # the n_probe closest clusters of every user, then the members and the probing users of every cluster
+        probes = np.argpartition(-(self.projection @ self.centroids.T), n_probe - 1, axis=1)[:, :n_probe]
+        n_clusters = self.centroids.shape[0]
+        member_ptr, member_ids = cluster_csr(self.assignment, np.arange(n), n_clusters)
+        query_ptr, query_ids = cluster_csr(probes.ravel(), np.repeat(np.arange(n), n_probe), n_clusters)
+
+        for cluster in range(n_clusters):
+            members = member_ids[member_ptr[cluster]:member_ptr[cluster + 1]]
+            queries = query_ids[query_ptr[cluster]:query_ptr[cluster + 1]]
+            if not len(members) or not len(queries):
+                continue
+
+            scores = self.vectors[queries] @ self.vectors[members].T
+            scores = scores.toarray() if sparse.issparse(scores) else np.array(scores)
+            scores[queries[:, None] == members[None, :]] = -np.inf
+
+            # merge the cluster candidates into the running top-k of every query
+            merged_scores = np.hstack([best_scores[queries], scores])
+            merged_ids = np.hstack([best_ids[queries], np.broadcast_to(members, scores.shape)])
+            keep = np.argpartition(-merged_scores, nbhd_size - 1, axis=1)[:, :nbhd_size]
+            best_scores[queries] = np.take_along_axis(merged_scores, keep, axis=1)
+            best_ids[queries] = np.take_along_axis(merged_ids, keep, axis=1)
+
+        # sort every row by decreasing score then increasing id, and drop the slots that found no candidate
+        order = np.lexsort((best_ids, -best_scores), axis=1)
+        best_ids = np.take_along_axis(best_ids, order, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        valid = np.isfinite(best_scores)
+
+        indptr = np.zeros(n + 1, dtype=np.int32)
+        np.cumsum(valid.sum(axis=1), out=indptr[1:])
+        indices = best_ids[valid].astype(np.int32)
+        self.knn = (nbhd_size, indptr, indices)
+
+        return indptr, indices
+
+    # same contract as surprise's get_neighbors, served from a single batched search
+    def get_neighbors(self, iid, k):
+        indptr, indices = self.knn_csr(k)
+
+        return indices[indptr[iid]:indptr[iid + 1]].tolist()
+
+
+def normalize_rows(vectors):
+    if sparse.issparse(vectors):
+        norms = np.sqrt(np.asarray(vectors.multiply(vectors).sum(axis=1)).ravel())
+        return (sparse.diags(1 / np.where(norms == 0, 1, norms)) @ vectors).tocsr()
+
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+# k-means over unit vectors (cosine assignment), empty clusters keep their previous centroid
+def spherical_kmeans(vectors, n_clusters, n_iter, rng, block_size=65536):
+    centroids = vectors[rng.choice(vectors.shape[0], n_clusters, replace=False)]
+    assignment = np.zeros(vectors.shape[0], dtype=np.int64)
+
+    for _ in range(n_iter + 1):
+        for start in range(0, vectors.shape[0], block_size):
+            assignment[start:start + block_size] = np.argmax(vectors[start:start + block_size] @ centroids.T, axis=1)
+
+        one_hot = sparse.csr_matrix(
+            (np.ones(len(assignment)), (assignment, np.arange(len(assignment)))), shape=(n_clusters, len(assignment)))
+        sums = np.asarray(one_hot @ vectors)
+        filled = np.asarray(one_hot.sum(axis=1)).ravel() > 0
+        centroids = np.where(filled[:, None], normalize_rows(sums), centroids)
+
+    return centroids, assignment
+
+
+# first k entries of every row of a sorted CSR neighborhood structure
+def prefix_csr(indptr, indices, k):
+    lengths = np.minimum(np.diff(indptr), k)
+    new_indptr = np.zeros(len(indptr), dtype=indptr.dtype)
+    np.cumsum(lengths, out=new_indptr[1:])
+    keep = np.arange(len(indices)) - np.repeat(indptr[:-1], np.diff(indptr)) < np.repeat(lengths, np.diff(indptr))
+
+    return new_indptr, indices[keep]
+
+
+# rows grouped by cluster as a CSR-style (indptr, ids) structure, labels holds the cluster of every entry of rows
+# the stable sort keeps the rows of every cluster in increasing order, one pass instead of a scan per cluster
+def cluster_csr(labels, rows, n_clusters):
+    order = np.argsort(labels, kind='stable')
+    indptr = np.zeros(n_clusters + 1, dtype=np.int64)
+    np.cumsum(np.bincount(labels, minlength=n_clusters), out=indptr[1:])
+
+    return indptr, rows[order]
+
+
+# exact top-k cosine neighbors over the same vectors as the approximate index, computed in row blocks
+def exact_knn_csr(vectors, nbhd_size=10, block_size=1024):
+    n = vectors.shape[0]
+    k = min(nbhd_size, n - 1)
+    indices = np.empty((n, max(k, 0)), dtype=np.int32)
+
+    for start in range(0, n, block_size):
+        scores = vectors[start:start + block_size] @ vectors.T
+        scores = scores.toarray() if sparse.issparse(scores) else np.array(scores)
+        indices[start:start + block_size] = top_k_block(scores, start, k)
+
+    return np.arange(n + 1, dtype=np.int32) * indices.shape[1], indices.ravel()
+
+
+# recall of the approximate neighborhoods against the exact ones (dicts of raw ids, as returned by get_knn)
+# when an evaluate(neighborhoods) callable returning a critical neighborhoods frame is given, the critical
+# percentages of both runs and the overlap of their critical users are reported as well
+def knn_recall_report(exact_nbhds, approx_nbhds, evaluate=None):
+    recalls = dict()
+    for uid, nbhd in exact_nbhds.items():
+        recalls[uid] = len(set(nbhd) & set(approx_nbhds.get(uid, []))) / len(nbhd) if len(nbhd) else 1.0
+
+    recall_df = pd.DataFrame.from_dict(recalls, orient='index').reset_index() \
+        .rename({'index': 'user_id', 0: 'recall'}, axis=1)
+
+    report = {
+        'users': len(recall_df),
+        'mean_recall': recall_df.recall.mean(),
+        'median_recall': recall_df.recall.median(),
+        'min_recall': recall_df.recall.min()
+    }
+
+    if evaluate is not None:
+        critical_exact = set(evaluate(exact_nbhds).uid)
+        critical_approx = set(evaluate(approx_nbhds).uid)
+        union = critical_exact | critical_approx
+
+        report['critical_pct_exact'] = round(len(critical_exact) / len(exact_nbhds) * 100, 2)
+        report['critical_pct_approx'] = round(len(critical_approx) / len(approx_nbhds) * 100, 2)
+        report['critical_overlap'] = len(critical_exact & critical_approx) / len(union) if union else 1.0
+
+    return report, recall_df
@@ -0,0 +1,198 @@
+'''
+    content-addressed on-disk cache of the experiment artifacts (fitted models, neighborhoods, predictions)
+    an artifact is keyed by the fingerprint of everything it depends on (dataset snapshot, split seed, algorithm,
+    parameters), numeric arrays are stored as .npy files and memory-mapped when read back, other objects are pickled
+    the least recently used artifacts are evicted once the cache grows above max_bytes
+
+    cache = ArtifactCache('cache', max_bytes=20 * 2**30)
+    key = cache.key(dataset=frame_fingerprint(ratings), seed=42, algo='SVD', params=params, artifact='predictions')
+    predictions = cached_predictions(cache, key, lambda: predict_columnar(algo, testset))
+'''
+from recommenders.datasets.pandas_df_utils import _pandas_digest
+from collections import defaultdict
+from itertools import chain
+import pandas as pd
+import numpy as np
+import hashlib
+import pickle
+import shutil
+import json
+import time
+import os
+
+
+# digest of the columns of a dataframe (names, dtypes and values), the same streaming digest as the PandasHash of
+# recommenders' lru_cache_df, as hex
+def frame_fingerprint(df):
+    return _pandas_digest(df).hex()
+
+
+# fingerprint of a dataset snapshot written by util.snapshot (its metadata identifies the source file)
+def snapshot_fingerprint(snapshot_dir):
+    with open(os.path.join(snapshot_dir, 'meta.json'), 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class ArtifactCache:
+
+    def __init__(self, root, max_bytes=10 * 2**30):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+    # key of an artifact from everything it depends on (json-serializable values, sorted keys)
+    def key(self, **parts):
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.root, key)
+
+    def __contains__(self, key):
+        return os.path.exists(os.path.join(self.path(key), 'meta.json'))
+
+    # dict of arrays (memory-mapped when numeric) and the metadata stored with them, None when the key is missing
+    def get(self, key):
+        if key not in self:
+            return None
+
+        path = self.path(key)
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        # the modification time of the entry is its last access, used by the LRU eviction
+        os.utime(path)
+
+        arrays = dict()
+        for name, kind in meta['entries'].items():
+            if kind == 'npy':
+                arrays[name] = np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+            else:
+                with open(os.path.join(path, name + '.pkl'), 'rb') as f:
+                    arrays[name] = pickle.load(f)
+
+        return arrays, meta['info']
+
+    # store a dict of arrays or objects under the key, written to a temporary directory then renamed in place
+    def put(self, key, arrays, info=None):
+        path = self.path(key)
+        tmp_path = path + '.tmp' + str(os.getpid())
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        entries = dict()
+        for name, values in arrays.items():
+            if isinstance(values, np.ndarray) and values.dtype != object:
+                np.save(os.path.join(tmp_path, name + '.npy'), values)
+                entries[name] = 'npy'
+            else:
+                with open(os.path.join(tmp_path, name + '.pkl'), 'wb') as f:
+                    pickle.dump(values, f, protocol=pickle.HIGHEST_PROTOCOL)
+                entries[name] = 'pkl'
+
+        with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+            json.dump({'entries': entries, 'info': info or dict(), 'created': time.time()}, f, default=str)
+
+        shutil.rmtree(path, ignore_errors=True)
+        os.rename(tmp_path, path)
+        self.evict(keep=key)
+
+        return self.get(key)
+
+    # remove the least recently used entries until the cache fits in max_bytes (the entry just written is kept)
+    def evict(self, keep=None):
+        entries = []
+        for key in os.listdir(self.root):
+            path = self.path(key)
+            if not os.path.isdir(path) or '.tmp' in key:
+                continue
+            size = sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+            entries.append((os.path.getmtime(path), key, size))
+
+        total = sum(size for _, _, size in entries)
+        for _, key, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(self.path(key), ignore_errors=True)
+            total -= size
+
+        return total
+
+    def size(self):
+        return sum(entry.stat().st_size for key in os.listdir(self.root) if os.path.isdir(self.path(key))
+                   for entry in os.scandir(self.path(key)) if entry.is_file())
+
+    def clear(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+        os.makedirs(self.root, exist_ok=True)
+
+    # the cached artifact of the key, computed and stored when missing
+    def get_or_compute(self, key, compute, to_arrays=lambda value: value, from_arrays=lambda arrays, info: arrays):
+        cached = self.get(key)
+        if cached is None:
+            cached = self.put(key, to_arrays(compute()))
+
+        return from_arrays(*cached)
+
+
+# fitted model (e.g. a surprise algorithm), pickled as one object
+def cached_model(cache, key, fit):
+    return cache.get_or_compute(key, fit, lambda algo: {'model': algo}, lambda arrays, info: arrays['model'])
+
+
+# neighborhoods in the layout of get_knn, stored as a CSR over the codes of their users
+def cached_neighborhoods(cache, key, compute):
+    return cache.get_or_compute(key, compute, neighborhoods_to_arrays, arrays_to_neighborhoods)
+
+
+def neighborhoods_to_arrays(neighborhoods):
+    codes, users = pd.factorize(pd.Series(
+        list(chain(neighborhoods.keys(), chain.from_iterable(neighborhoods.values())))))
+    lengths = np.fromiter((len(nbhd) for nbhd in neighborhoods.values()), dtype=np.int64, count=len(neighborhoods))
+    indptr = np.zeros(len(neighborhoods) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=indptr[1:])
+
+    return {'users': np.asarray(users), 'anchors': codes[:len(neighborhoods)].astype(np.int64),
+            'indptr': indptr, 'indices': codes[len(neighborhoods):].astype(np.int64)}
+
+
+def arrays_to_neighborhoods(arrays, info=None):
+    users = arrays['users'].tolist()
+    indptr, indices = np.asarray(arrays['indptr']), np.asarray(arrays['indices'])
+
+    nbhds = defaultdict(list)
+    for row, anchor in enumerate(np.asarray(arrays['anchors']).tolist()):
+        nbhds[users[anchor]] = [users[code] for code in indices[indptr[row]:indptr[row + 1]].tolist()]
+
+    return nbhds
+
+
+# columnar predictions of util.predictions.predict_columnar (uid/iid categoricals are stored as codes + categories)
+def cached_predictions(cache, key, compute):
+    return cache.get_or_compute(key, compute, predictions_to_arrays, arrays_to_predictions)
+
+
+def predictions_to_arrays(predictions):
+    arrays = dict()
+    for name, values in predictions.items():
+        if isinstance(values, pd.Categorical):
+            arrays[name + '.codes'] = np.asarray(values.codes)
+            arrays[name + '.categories'] = np.asarray(values.categories)
+        else:
+            arrays[name] = np.asarray(values)
+
+    return arrays
+
+
+def arrays_to_predictions(arrays, info=None):
+    predictions = dict()
+    for name, values in arrays.items():
+        if name.endswith('.categories'):
+            continue
+        if name.endswith('.codes'):
+            column = name[:-len('.codes')]
+            predictions[column] = pd.Categorical.from_codes(np.asarray(values), arrays[column + '.categories'])
+        else:
+            predictions[name] = values
+
+    return predictions
@@ -1,8 +1,7 @@
+from util.instrumentation import stage
+from util.ratings_files import read_ratings
 from collections import Counter
 from surprise import Dataset, Reader
-# from datetime import datetime as dt
-import pandas as pd
-import os
 
 
 # Function to return the correct dataframe form for line/box plots
@@ -28,49 +27,22 @@ def load_train_test_surpriselib(x, y):
     return trainset, testset
 
 
-def load_dataset_explicit(ds_name, ds_path, total_users=10000):
-    ratings_file_name = 'ratings.csv'
-    ratings_path = os.path.join(ds_path, ratings_file_name)
-
-    ratings = 0
-    colnames = ['user_id', 'item_id', 'rating', 'timestamp']
+# fit a surprise algorithm on a trainset, timed as the 'fit' stage
+def fit_algo(algo, trainset):
+    with stage('fit', rows=trainset.n_ratings, algo=type(algo).__name__):
+        return algo.fit(trainset)
 
-    if ds_name == 'ml-1m':
-        ratings_file_name = 'ratings.dat'
-        ratings_path = os.path.join(ds_path, ratings_file_name)
-        ratings = pd.read_csv(ratings_path, delimiter='::', names=colnames)
 
-    elif ds_name == 'ml-latest-small':
-        ratings = pd.read_csv(ratings_path).rename({'movieId': 'item_id', 'userId': 'user_id'}, axis=1)
-        # ratings['date'] = ratings['timestamp'].apply(lambda x: dt.fromtimestamp(x).date())
-
-    elif ds_name == 'ml-latest':
-        ratings = pd.read_csv(ratings_path).rename({'movieId': 'item_id', 'userId': 'user_id'}, axis=1)
-        # define the users to extract from the dataset (1 -> n)
-        target_users = list(range(1, total_users))
-        ratings_small = ratings[ratings.user_id.isin(target_users)]
-        ratings = ratings_small
+def load_dataset_explicit(ds_name, ds_path, total_users=10000):
+    with stage('load_dataset', ds_name=ds_name) as record:
+        ratings = read_ratings(ds_name, ds_path)
 
-    elif ds_name == 'personality-isf2018':
-        ratings = pd.read_csv(ratings_path)\
-            .rename({' movie_id': 'item_id', 'useri': 'user_id', ' rating': 'rating'}, axis=1)
-        ratings["user_id"] = ratings["user_id"].astype('category')
-        ratings["user_cat"] = ratings["user_id"].cat.codes
-        # clean the ratings dataframe
-        ratings = ratings\
-            .drop(['user_id'], axis=1)\
-            .rename({'user_cat': 'user_id'}, axis=1)
+        if ds_name == 'ml-latest':
+            # define the users to extract from the dataset (1 -> n)
+            target_users = list(range(1, total_users))
+            ratings_small = ratings[ratings.user_id.isin(target_users)]
+            ratings = ratings_small
 
-    # encoding reference: https://pbpython.com/categorical-encoding.html
-    elif ds_name == 'amazon-2':
-        ratings = pd.read_csv(ratings_path, names=colnames)
-        ratings["user_id"] = ratings["user_id"].astype('category')
-        ratings["user_cat"] = ratings["user_id"].cat.codes
-        ratings["item_id"] = ratings["item_id"].astype('category')
-        ratings["item_cat"] = ratings["item_id"].cat.codes
-        # clean the ratings dataframe
-        ratings = ratings\
-            .drop(['user_id', 'item_id'], axis=1)\
-            .rename({'user_cat': 'user_id', 'item_cat': 'item_id'}, axis=1)
+        record['rows'] = len(ratings)
 
     return ratings
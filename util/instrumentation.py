@@ -0,0 +1,147 @@
+'''
+    stage-level instrumentation of the experiment pipeline (loading, fitting, neighborhoods, predictions, tests)
+    the loaders and evaluators wrap their steps in `with stage(name, rows=...)`, which is a shared no-op context until
+    tracing is enabled; an enabled tracer records wall time (recommenders' Timer), CPU time, RSS, the peak RSS of the
+    process and the row counts of every stage, and exports them as JSON or as a Chrome trace (chrome://tracing, Perfetto)
+    it is the per-stage, IPython-free counterpart of the per-cell report of recommenders' notebook_memory_management,
+    which cannot be reused here: importing it needs IPython and memory_profiler and it only reports notebook cells
+
+    tracer = enable_tracing()
+    ... run the experiment ...
+    disable_tracing()
+    tracer.to_chrome_trace('trace.json')
+'''
+from recommenders.utils.timer import Timer
+from contextlib import contextmanager
+import pandas as pd
+import resource
+import time
+import json
+import os
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+# resident set size of the process in MB (psutil when installed, /proc on linux, None elsewhere)
+def current_rss_mb():
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 2**20
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+# peak resident set size of the process since it started in MB, a high-water mark that no stage can reset
+def process_peak_rss_mb():
+    # ru_maxrss is in kilobytes on linux (bytes on macos)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class StageTracer:
+
+    def __init__(self):
+        self.records = []
+        self.stack = []
+        self.origin = time.perf_counter()
+
+    # time one named stage, the yielded record can be completed by the caller (e.g. record['rows'] = n)
+    # the process peak RSS is only raised by a stage that goes above every earlier stage, peak_rss_growth_mb is that
+    # rise (0 for a stage that stays below the high-water mark, however much it allocates)
+    @contextmanager
+    def stage(self, name, rows=None, **details):
+        record = {'name': name, 'parent': self.stack[-1]['name'] if self.stack else None, 'depth': len(self.stack),
+                  'rows': rows, 'rss_start_mb': current_rss_mb(), 'process_peak_rss_start_mb': process_peak_rss_mb()}
+        record.update(details)
+        self.stack.append(record)
+
+        cpu = time.process_time()
+        record['start'] = time.perf_counter() - self.origin
+        try:
+            with Timer() as timer:
+                yield record
+        finally:
+            record['wall'] = timer.interval
+            record['cpu'] = time.process_time() - cpu
+            record['rss_end_mb'] = current_rss_mb()
+            record['process_peak_rss_mb'] = process_peak_rss_mb()
+            record['peak_rss_growth_mb'] = record['process_peak_rss_mb'] - record['process_peak_rss_start_mb']
+            self.stack.pop()
+            self.records.append(record)
+
+    # one row per stage, in completion order
+    def summary(self):
+        return pd.DataFrame(self.records, columns=[
+            'name', 'parent', 'depth', 'rows', 'start', 'wall', 'cpu', 'rss_start_mb', 'rss_end_mb',
+            'process_peak_rss_start_mb', 'process_peak_rss_mb', 'peak_rss_growth_mb'])
+
+    def to_json(self, path=None):
+        report = {'pid': os.getpid(), 'stages': sorted(self.records, key=lambda record: record['start'])}
+        if path is None:
+            return report
+
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2, default=str)
+
+    # complete ('X') events in microseconds, nested stages show up under their parent
+    def to_chrome_trace(self, path=None):
+        events = [{
+            'name': record['name'],
+            'cat': 'stage',
+            'ph': 'X',
+            'ts': record['start'] * 1e6,
+            'dur': record['wall'] * 1e6,
+            'pid': os.getpid(),
+            'tid': 0,
+            'args': {key: value for key, value in record.items() if key not in ['name', 'start', 'wall']}
+        } for record in self.records]
+
+        trace = {'traceEvents': sorted(events, key=lambda event: event['ts']), 'displayTimeUnit': 'ms'}
+        if path is None:
+            return trace
+
+        with open(path, 'w') as f:
+            json.dump(trace, f, default=str)
+
+
+# the no-op stage shared by every call while tracing is disabled
+class _NoStage:
+
+    def __enter__(self):
+        return dict()
+
+    def __exit__(self, *args):
+        return False
+
+
+_NO_STAGE = _NoStage()
+_tracer = None
+
+
+def enable_tracing():
+    global _tracer
+    _tracer = StageTracer()
+
+    return _tracer
+
+
+def disable_tracing():
+    global _tracer
+    tracer, _tracer = _tracer, None
+
+    return tracer
+
+
+def active_tracer():
+    return _tracer
+
+
+def stage(name, rows=None, **details):
+    if _tracer is None:
+        return _NO_STAGE
+
+    return _tracer.stage(name, rows, **details)
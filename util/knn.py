@@ -1,7 +1,9 @@
 '''
     returns the top-k neighbors of all users in the dataset in a defaultdict
 '''
+from util.instrumentation import stage
 from collections import defaultdict
+import numpy as np
 
 
 def get_knn(data, clustering_algorithm, nbhd_size=10):
@@ -10,13 +12,77 @@ def get_knn(data, clustering_algorithm, nbhd_size=10):
 
     nbhds = defaultdict(list)
 
-    for uid in raw_user_ids:
-        # Retrieve inner id of the user
-        user_inner_id = clustering_algorithm.trainset.to_inner_uid(uid)
-        # Retrieve inner ids of the nearest neighbors of the user.
-        user_neighbors = clustering_algorithm.get_neighbors(user_inner_id, k=nbhd_size)
-        # Convert inner ids of the neighbors raw-ids.
-        user_neighbors = (clustering_algorithm.trainset.to_raw_uid(inner_id) for inner_id in user_neighbors)
-        nbhds[uid] = list(user_neighbors)
+    with stage('get_knn', rows=len(raw_user_ids), nbhd_size=nbhd_size):
+        for uid in raw_user_ids:
+            # Retrieve inner id of the user
+            user_inner_id = clustering_algorithm.trainset.to_inner_uid(uid)
+            # Retrieve inner ids of the nearest neighbors of the user.
+            user_neighbors = clustering_algorithm.get_neighbors(user_inner_id, k=nbhd_size)
+            # Convert inner ids of the neighbors raw-ids.
+            user_neighbors = (clustering_algorithm.trainset.to_raw_uid(inner_id) for inner_id in user_neighbors)
+            nbhds[uid] = list(user_neighbors)
+
+    return nbhds
+
+
+# top-k rows of a dense similarity matrix as a CSR-style (indptr, indices) int32 structure of inner ids
+# one argpartition per block of rows replaces the per-user get_neighbors calls, ties are broken by inner id like
+# surprise does, every row is sorted by decreasing similarity and never contains the row itself
+def get_knn_csr(sim, nbhd_size=10, block_size=2048):
+    n = sim.shape[0]
+    k = min(nbhd_size, n - 1)
+    indices = np.empty((n, max(k, 0)), dtype=np.int32)
+
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        indices[start:stop] = top_k_block(np.array(sim[start:stop], dtype=np.float64), start, k)
+
+    indptr = np.arange(n + 1, dtype=np.int32) * indices.shape[1]
+
+    return indptr, indices.ravel()
+
+
+# column indices of the k largest values of every row of a block starting at row `start` (block is modified in place)
+# the diagonal is excluded and the result is sorted by decreasing value, then by increasing column
+def top_k_block(block, start, k):
+    rows = np.arange(block.shape[0])
+    block[rows, rows + start] = -np.inf
+    if k <= 0:
+        return np.empty((block.shape[0], 0), dtype=np.int32)
+
+    # k-th largest similarity of every row
+    part = np.argpartition(-block, k - 1, axis=1)[:, :k]
+    kth = np.take_along_axis(block, part, axis=1).min(axis=1)[:, None]
+
+    # keep everything above the k-th value and fill up with the lowest column ids among the ties
+    ties = block == kth
+    n_missing = k - (block > kth).sum(axis=1, keepdims=True)
+    selected = (block > kth) | (ties & (np.cumsum(ties, axis=1) <= n_missing))
+
+    sel_rows, sel_cols = np.nonzero(selected)
+    order = np.lexsort((sel_cols, -block[sel_rows, sel_cols], sel_rows))
+
+    return sel_cols[order].reshape(block.shape[0], k).astype(np.int32)
+
+
+# same neighborhoods as get_knn, computed in one batch from the similarity matrix of the clustering algorithm
+# returns the CSR (indptr, indices) of inner ids, or a defaultdict of raw ids when as_dict is set
+def get_knn_batched(data, clustering_algorithm, nbhd_size=10, as_dict=True, block_size=2048):
+    with stage('get_knn_batched', rows=clustering_algorithm.sim.shape[0], nbhd_size=nbhd_size):
+        indptr, indices = get_knn_csr(clustering_algorithm.sim, nbhd_size, block_size)
+    if not as_dict:
+        return indptr, indices
+
+    return knn_csr_to_dict(data, clustering_algorithm.trainset, indptr, indices)
+
+
+# dict view of the CSR neighborhoods, keyed by the raw ids of the users in data
+def knn_csr_to_dict(data, trainset, indptr, indices):
+    raw_ids = np.array([trainset.to_raw_uid(inner_id) for inner_id in range(len(indptr) - 1)], dtype=object)
+
+    nbhds = defaultdict(list)
+    for uid in set(data.user_id.to_list()):
+        user_inner_id = trainset.to_inner_uid(uid)
+        nbhds[uid] = raw_ids[indices[indptr[user_inner_id]:indptr[user_inner_id + 1]]].tolist()
 
     return nbhds
@@ -0,0 +1,91 @@
+'''
+    builds the top-k neighbors of all users straight from the ratings dataframe, without fitting surprise's KNN
+    the similarities follow surprise's definitions (computed over the items rated by both users) but are evaluated
+    in blocks of rows over a sparse user x item matrix, so only a (block x users) slice is ever held in memory
+'''
+from util.instrumentation import stage
+from util.knn import top_k_block, knn_csr_to_dict
+from scipy import sparse
+import pandas as pd
+import numpy as np
+
+
+SIMILARITIES = ['cosine', 'msd', 'pearson']
+
+
+# dense user/item codes (in order of appearance, like the inner ids of a surprise trainset) and the rating matrices
+def ratings_matrices(ratings):
+    user_codes, raw_users = pd.factorize(ratings.user_id)
+    item_codes, _ = pd.factorize(ratings.item_id)
+    shape = (len(raw_users), item_codes.max() + 1 if len(item_codes) else 0)
+
+    values = ratings.rating.to_numpy(dtype=np.float64)
+    r = sparse.csr_matrix((values, (user_codes, item_codes)), shape=shape)
+    b = sparse.csr_matrix((np.ones(len(values)), (user_codes, item_codes)), shape=shape)
+    r2 = sparse.csr_matrix((values**2, (user_codes, item_codes)), shape=shape)
+
+    return pd.Index(raw_users), r, b, r2
+
+
+# similarities between the users in rows [start, stop) and all the users, 0 below min_support common items
+def similarity_block(r, b, r2, start, stop, name='pearson', min_support=1):
+    rb, bb, r2b = r[start:stop], b[start:stop], r2[start:stop]
+
+    # sums over the items rated by both users (freq: common items, prods: sum of ri * rj, sqi/sqj: squares)
+    freq = (bb @ b.T).toarray()
+    prods = (rb @ r.T).toarray()
+    sqi = (r2b @ b.T).toarray()
+    sqj = (bb @ r2.T).toarray()
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if name == 'cosine':
+            sim = prods / np.sqrt(sqi * sqj)
+        elif name == 'msd':
+            sim = 1 / ((sqi + sqj - 2 * prods) / freq + 1)
+        elif name == 'pearson':
+            si = (rb @ b.T).toarray()
+            sj = (bb @ r.T).toarray()
+            num = freq * prods - si * sj
+            denum = np.sqrt((freq * sqi - si**2) * (freq * sqj - sj**2))
+            sim = np.where(denum == 0, 0, num / denum)
+        else:
+            raise ValueError('Unknown similarity: ' + str(name) + ', expected one of ' + str(SIMILARITIES))
+
+    sim[(freq < min_support) | ~np.isfinite(sim)] = 0
+
+    return sim
+
+
+# top-k neighbors of every user as a CSR-style (indptr, indices) int32 structure over the user codes,
+# or a defaultdict of raw ids (same layout as get_knn) when as_dict is set
+# peak memory is O(block_size x users) instead of the O(users^2) similarity matrix of surprise
+def build_knn(ratings, sim_name='pearson', nbhd_size=10, min_support=1, block_size=1024, as_dict=True):
+    raw_users, r, b, r2 = ratings_matrices(ratings)
+    n = len(raw_users)
+    k = min(nbhd_size, n - 1)
+    indices = np.empty((n, max(k, 0)), dtype=np.int32)
+
+    with stage('build_knn', rows=n, sim_name=sim_name, nbhd_size=nbhd_size):
+        for start in range(0, n, block_size):
+            stop = min(start + block_size, n)
+            sim = similarity_block(r, b, r2, start, stop, sim_name, min_support)
+            indices[start:stop] = top_k_block(sim, start, k)
+
+    indptr = np.arange(n + 1, dtype=np.int32) * indices.shape[1]
+    if not as_dict:
+        return indptr, indices.ravel()
+
+    return knn_csr_to_dict(ratings, UserCodes(raw_users), indptr, indices.ravel())
+
+
+# minimal trainset-like mapping between raw user ids and codes, used by knn_csr_to_dict
+class UserCodes:
+
+    def __init__(self, raw_users):
+        self.raw_users = raw_users
+
+    def to_inner_uid(self, uid):
+        return self.raw_users.get_loc(uid)
+
+    def to_raw_uid(self, inner_id):
+        return self.raw_users[inner_id]
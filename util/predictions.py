@@ -0,0 +1,120 @@
+'''
+    columnar replacement for algo.test(testset) + pd.DataFrame(predictions) + the row-wise prediction_loss apply
+    the testset is scored in batches straight into preallocated numpy arrays, users and items are kept as categorical
+    codes, and the result can be passed to the vectorized neighborhood evaluators in place of predictions_df
+'''
+from util.instrumentation import stage
+import pandas as pd
+import numpy as np
+
+
+# score a testset (surprise list of (uid, iid, r_ui) or a dataframe with user_id/item_id/rating columns)
+# returns a dict of columns: uid/iid (pd.Categorical), r_ui, est, was_impossible and prediction_loss
+def predict_columnar(algo, testset, batch_size=100000, loss='squared'):
+    if isinstance(testset, pd.DataFrame):
+        uids, iids, r_ui = testset['user_id'], testset['item_id'], testset['rating']
+    else:
+        uids, iids, r_ui = zip(*testset) if len(testset) else ((), (), ())
+
+    uid = pd.Categorical(pd.Series(uids, dtype=object) if not isinstance(uids, pd.Series) else uids)
+    iid = pd.Categorical(pd.Series(iids, dtype=object) if not isinstance(iids, pd.Series) else iids)
+    n = len(uid)
+
+    predictions = {
+        'uid': uid,
+        'iid': iid,
+        'r_ui': np.asarray(r_ui, dtype=np.float64),
+        'est': np.empty(n, dtype=np.float64),
+        'was_impossible': np.empty(n, dtype=bool)
+    }
+
+    if is_factor_model(algo):
+        score = factor_scorer(algo, uid, iid)
+    else:
+        score = generic_scorer(algo, uid, iid, predictions['r_ui'])
+
+    with stage('predict', rows=n, algo=type(algo).__name__):
+        for start in range(0, n, batch_size):
+            stop = min(start + batch_size, n)
+            predictions['est'][start:stop], predictions['was_impossible'][start:stop] = score(start, stop)
+
+    predictions['prediction_loss'] = prediction_loss(predictions['r_ui'], predictions['est'], loss)
+
+    return predictions
+
+
+# vectorized loss columns (squared is the base error of test-1 in the notebooks)
+def prediction_loss(r_ui, est, loss='squared'):
+    if loss == 'squared':
+        return (r_ui - est)**2
+    if loss == 'absolute':
+        return np.abs(r_ui - est)
+
+    raise ValueError('Unknown loss: ' + str(loss) + ', expected squared or absolute')
+
+
+# dataframe view with the columns of pd.DataFrame(algo.test(testset)), for code that still expects predictions_df
+def to_predictions_df(predictions):
+    return pd.DataFrame({name: np.asarray(values) for name, values in predictions.items()})
+
+
+# SVD and NMF estimates are a closed form of the fitted biases and factors (SVD++ also needs the implicit ratings)
+def is_factor_model(algo):
+    return all(hasattr(algo, name) for name in ['pu', 'qi', 'bu', 'bi']) and not hasattr(algo, 'yj')
+
+
+def factor_scorer(algo, uid, iid):
+    trainset = algo.trainset
+    lower_bound, higher_bound = trainset.rating_scale
+    biased = getattr(algo, 'biased', True)
+    # surprise's NMF needs both the user and the item to be known, SVD falls back on the biases
+    needs_both = type(algo).__name__ == 'NMF' or not biased
+
+    # inner ids are looked up once per distinct user and item, -1 marks the unknown ones
+    user_inner = np.array([inner_id(trainset.to_inner_uid, u) for u in uid.categories], dtype=np.int64)[uid.codes]
+    item_inner = np.array([inner_id(trainset.to_inner_iid, i) for i in iid.categories], dtype=np.int64)[iid.codes]
+
+    def score(start, stop):
+        users, items = user_inner[start:stop], item_inner[start:stop]
+        known_user, known_item = users >= 0, items >= 0
+        both = known_user & known_item
+
+        est = np.zeros(stop - start)
+        est[both] = np.einsum('ij,ij->i', algo.qi[items[both]], algo.pu[users[both]])
+        if biased:
+            est += trainset.global_mean
+            est[known_user] += algo.bu[users[known_user]]
+            est[known_item] += algo.bi[items[known_item]]
+
+        was_impossible = ~both if needs_both else np.zeros(stop - start, dtype=bool)
+        est[was_impossible] = trainset.global_mean
+
+        return np.clip(est, lower_bound, higher_bound), was_impossible
+
+    return score
+
+
+# any other surprise algorithm: predict() row by row, written into the preallocated arrays batch by batch
+def generic_scorer(algo, uid, iid, r_ui):
+    user_values = np.asarray(uid.categories, dtype=object)
+    item_values = np.asarray(iid.categories, dtype=object)
+
+    def score(start, stop):
+        est = np.empty(stop - start)
+        was_impossible = np.empty(stop - start, dtype=bool)
+        for row, (u, i, r) in enumerate(zip(user_values[uid.codes[start:stop]], item_values[iid.codes[start:stop]],
+                                            r_ui[start:stop])):
+            prediction = algo.predict(u, i, r_ui=r)
+            est[row] = prediction.est
+            was_impossible[row] = prediction.details.get('was_impossible', False)
+
+        return est, was_impossible
+
+    return score
+
+
+def inner_id(to_inner, raw_id):
+    try:
+        return to_inner(raw_id)
+    except ValueError:
+        return -1
@@ -0,0 +1,58 @@
+'''
+    paths and parsers of the raw ratings files of the datasets
+    kept apart from the surprise helpers, so that the snapshot and streaming loaders can be used without surprise
+'''
+# from datetime import datetime as dt
+import pandas as pd
+import os
+
+
+# path of the raw ratings file of a dataset
+def ratings_path(ds_name, ds_path):
+    if ds_name == 'ml-1m':
+        return os.path.join(ds_path, 'ratings.dat')
+
+    return os.path.join(ds_path, 'ratings.csv')
+
+
+# parse the full ratings file of a dataset (no user filtering)
+def read_ratings(ds_name, ds_path):
+    path = ratings_path(ds_name, ds_path)
+
+    ratings = 0
+    colnames = ['user_id', 'item_id', 'rating', 'timestamp']
+
+    if ds_name == 'ml-1m':
+        # '::' would force the slow python engine, split on ':' with the C engine and skip the empty fields instead
+        ratings = pd.read_csv(path, sep=':', header=None, usecols=[0, 2, 4, 6], names=colnames)
+
+    elif ds_name == 'ml-latest-small':
+        ratings = pd.read_csv(path).rename({'movieId': 'item_id', 'userId': 'user_id'}, axis=1)
+        # ratings['date'] = ratings['timestamp'].apply(lambda x: dt.fromtimestamp(x).date())
+
+    elif ds_name == 'ml-latest':
+        ratings = pd.read_csv(path).rename({'movieId': 'item_id', 'userId': 'user_id'}, axis=1)
+
+    elif ds_name == 'personality-isf2018':
+        ratings = pd.read_csv(path)\
+            .rename({' movie_id': 'item_id', 'useri': 'user_id', ' rating': 'rating'}, axis=1)
+        ratings["user_id"] = ratings["user_id"].astype('category')
+        ratings["user_cat"] = ratings["user_id"].cat.codes
+        # clean the ratings dataframe
+        ratings = ratings\
+            .drop(['user_id'], axis=1)\
+            .rename({'user_cat': 'user_id'}, axis=1)
+
+    # encoding reference: https://pbpython.com/categorical-encoding.html
+    elif ds_name == 'amazon-2':
+        ratings = pd.read_csv(path, names=colnames)
+        ratings["user_id"] = ratings["user_id"].astype('category')
+        ratings["user_cat"] = ratings["user_id"].cat.codes
+        ratings["item_id"] = ratings["item_id"].astype('category')
+        ratings["item_cat"] = ratings["item_id"].cat.codes
+        # clean the ratings dataframe
+        ratings = ratings\
+            .drop(['user_id', 'item_id'], axis=1)\
+            .rename({'user_cat': 'user_id', 'item_cat': 'item_id'}, axis=1)
+
+    return ratings
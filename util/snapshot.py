@@ -0,0 +1,106 @@
+'''
+    binary columnar snapshots of the raw ratings files
+    each dataset is parsed once and stored as .npy columns (int32 ids, float32 ratings, int64 timestamps) sorted by
+    user, later loads memory-map the columns and read only the rows of the requested users through the user offsets
+'''
+from util.ratings_files import read_ratings, ratings_path
+from util.instrumentation import stage
+import pandas as pd
+import numpy as np
+import json
+import os
+
+
+SNAPSHOT_DTYPES = {'user_id': np.int32, 'item_id': np.int32, 'rating': np.float32, 'timestamp': np.int64}
+
+
+def snapshot_path(ds_path, snapshot_dir=None):
+    return snapshot_dir or os.path.join(ds_path, '.snapshot')
+
+
+# parse the raw ratings file and write the snapshot, the metadata file is written last and marks it as complete
+def build_snapshot(ds_name, ds_path, snapshot_dir=None):
+    snapshot_dir = snapshot_path(ds_path, snapshot_dir)
+    os.makedirs(snapshot_dir, exist_ok=True)
+
+    ratings = read_ratings(ds_name, ds_path)
+    ratings = ratings.rename({name: 'timestamp' for name in ratings.columns if name.strip() in ('timestamp', 'tstamp')},
+                             axis=1)
+    # stable sort: the files that are already ordered by user keep their row order
+    ratings = ratings.sort_values(by=['user_id'], kind='stable')
+
+    columns = dict()
+    for name, dtype in SNAPSHOT_DTYPES.items():
+        if name not in ratings.columns:
+            continue
+        values = ratings[name]
+        if name == 'timestamp' and not pd.api.types.is_numeric_dtype(values):
+            values = pd.to_datetime(values).astype('int64') // 10**9
+        elif name != 'rating' and not pd.api.types.is_integer_dtype(values):
+            raise ValueError(name + ' of ' + ds_name + ' must be integer encoded to be snapshotted')
+        columns[name] = values.to_numpy().astype(dtype)
+
+    # unique users and the offsets of their rows
+    users, counts = np.unique(columns['user_id'], return_counts=True)
+    offsets = np.zeros(len(users) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+
+    for name, values in dict(columns, users=users, offsets=offsets).items():
+        np.save(os.path.join(snapshot_dir, name + '.npy'), values)
+
+    source = ratings_path(ds_name, ds_path)
+    with open(os.path.join(snapshot_dir, 'meta.json'), 'w') as f:
+        json.dump({
+            'ds_name': ds_name,
+            'source': source,
+            'source_size': os.path.getsize(source),
+            'source_mtime': os.path.getmtime(source),
+            'columns': list(columns),
+            'rows': len(ratings)
+        }, f)
+
+    return snapshot_dir
+
+
+# metadata of a snapshot, None when it is missing or older than its raw file
+def snapshot_meta(ds_name, ds_path, snapshot_dir=None):
+    meta_path = os.path.join(snapshot_path(ds_path, snapshot_dir), 'meta.json')
+    if not os.path.exists(meta_path):
+        return None
+
+    with open(meta_path) as f:
+        meta = json.load(f)
+
+    source = ratings_path(ds_name, ds_path)
+    if meta['ds_name'] != ds_name or (os.path.exists(source) and (
+            os.path.getsize(source) != meta['source_size'] or os.path.getmtime(source) != meta['source_mtime'])):
+        return None
+
+    return meta
+
+
+# same ratings as load_dataset_explicit (rows ordered by user, compact dtypes), read from the snapshot built on the
+# first call
+# the ml-latest user filter (users 1 -> total_users - 1) becomes a lookup of the sorted user offsets
+def load_dataset_snapshot(ds_name, ds_path, total_users=10000, snapshot_dir=None, rebuild=False):
+    meta = None if rebuild else snapshot_meta(ds_name, ds_path, snapshot_dir)
+    if meta is None:
+        with stage('build_snapshot', ds_name=ds_name):
+            build_snapshot(ds_name, ds_path, snapshot_dir)
+        meta = snapshot_meta(ds_name, ds_path, snapshot_dir)
+
+    snapshot_dir = snapshot_path(ds_path, snapshot_dir)
+    start, stop = 0, meta['rows']
+    if ds_name == 'ml-latest':
+        users = np.load(os.path.join(snapshot_dir, 'users.npy'), mmap_mode='r')
+        offsets = np.load(os.path.join(snapshot_dir, 'offsets.npy'), mmap_mode='r')
+        start = int(offsets[np.searchsorted(users, 1)])
+        stop = int(offsets[np.searchsorted(users, total_users)])
+
+    # only the selected rows are paged in from the memory-mapped columns
+    with stage('load_snapshot', rows=stop - start, ds_name=ds_name):
+        ratings = pd.DataFrame({
+            name: np.array(np.load(os.path.join(snapshot_dir, name + '.npy'), mmap_mode='r')[start:stop])
+            for name in meta['columns']})
+
+    return ratings
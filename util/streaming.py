@@ -0,0 +1,139 @@
+'''
+    chunked streaming ingestion of ratings files larger than RAM (amazon review dumps)
+    the csv is read in chunks, users and items are encoded with id -> code dicts that grow chunk by chunk, and the
+    encoded chunks are written to disk as .npy columns (int32 codes, float32 ratings, int64 timestamps)
+    only one chunk and the two dicts are held in memory, the budget and the peak RSS of the process are reported at
+    the end
+'''
+from util.ratings_files import ratings_path
+from util.instrumentation import process_peak_rss_mb
+import pandas as pd
+import numpy as np
+import json
+import os
+
+
+# column layout of the raw files read in chunks (header row or not, column names)
+STREAM_FORMATS = {
+    'amazon-2': {'header': None, 'names': ['user_id', 'item_id', 'rating', 'timestamp'], 'encode': True},
+    'amazon-movies': {'header': None, 'names': ['user_id', 'item_id', 'rating', 'timestamp'], 'encode': True},
+    'ml-latest': {'header': 0, 'names': ['user_id', 'item_id', 'rating', 'timestamp'], 'encode': False},
+    'ml-latest-small': {'header': 0, 'names': ['user_id', 'item_id', 'rating', 'timestamp'], 'encode': False}
+}
+
+# rough parsing cost of one csv row held by pandas (two string ids, a float and an int, plus the encoded copy)
+ROW_BYTES = 400
+
+
+# encode the values of one chunk, the ids never seen before get the next codes (order of first appearance)
+# a missing id (NaN/None, code -1 of factorize) would be looked up as the last code, so it is rejected
+def encode_chunk(values, codes_dict):
+    chunk_codes, uniques = pd.factorize(values)
+    missing = np.count_nonzero(chunk_codes < 0)
+    if missing:
+        raise ValueError(str(missing) + ' rows have a missing id')
+    lookup = np.array([codes_dict.setdefault(value, len(codes_dict)) for value in uniques], dtype=np.int32)
+
+    return lookup[chunk_codes]
+
+
+def chunk_path(out_dir, chunk, name):
+    return os.path.join(out_dir, '{:05d}.{}.npy'.format(chunk, name))
+
+
+# order of the category codes of load_dataset_explicit, which lets pandas parse the ids: when every id is a number
+# the column is numeric and its categories are sorted by value (ids that only differ by their formatting, like 7 and
+# 007, become one category there and cannot match), otherwise they are strings sorted in string order
+def sorted_id_order(raw_ids):
+    numeric = pd.to_numeric(pd.Series(raw_ids), errors='coerce')
+    if len(raw_ids) and not numeric.isna().any():
+        return np.argsort(numeric.to_numpy(), kind='stable')
+
+    return np.argsort(raw_ids, kind='stable')
+
+
+# stream a ratings file into encoded .npy chunks under out_dir
+# chunksize is derived from memory_budget_mb when given, sort_ids renumbers the codes in sorted id order in a second
+# pass over the chunks so that they match the category codes of load_dataset_explicit (see sorted_id_order)
+def stream_dataset(ds_name, ds_path, out_dir, chunksize=1000000, memory_budget_mb=None, sort_ids=True):
+    if ds_name not in STREAM_FORMATS:
+        raise ValueError('No streaming format for ' + ds_name + ', expected one of ' + ', '.join(STREAM_FORMATS))
+
+    layout = STREAM_FORMATS[ds_name]
+    if memory_budget_mb is not None:
+        chunksize = max(1000, int(memory_budget_mb * 2**20) // ROW_BYTES)
+
+    os.makedirs(out_dir, exist_ok=True)
+    users, items = dict(), dict()
+    dtype = {'user_id': str, 'item_id': str} if layout['encode'] else None
+    n_chunks, n_rows = 0, 0
+
+    reader = pd.read_csv(ratings_path(ds_name, ds_path), header=layout['header'], names=layout['names'],
+                         dtype=dtype, chunksize=chunksize)
+    for chunk in reader:
+        columns = {'rating': chunk['rating'].to_numpy(dtype=np.float32),
+                   'timestamp': chunk['timestamp'].to_numpy(dtype=np.int64)}
+        if layout['encode']:
+            columns['user_id'] = encode_chunk(chunk['user_id'], users)
+            columns['item_id'] = encode_chunk(chunk['item_id'], items)
+        else:
+            columns['user_id'] = chunk['user_id'].to_numpy(dtype=np.int32)
+            columns['item_id'] = chunk['item_id'].to_numpy(dtype=np.int32)
+
+        for name, values in columns.items():
+            np.save(chunk_path(out_dir, n_chunks, name), values)
+        n_chunks += 1
+        n_rows += len(chunk)
+
+    if layout['encode']:
+        for name, codes_dict in [('user_id', users), ('item_id', items)]:
+            raw_ids = np.array(list(codes_dict), dtype=str)
+            if sort_ids:
+                # rank of every first-appearance code in sorted id order, applied to the chunks one at a time
+                order = sorted_id_order(raw_ids)
+                rank = np.empty(len(order), dtype=np.int32)
+                rank[order] = np.arange(len(order), dtype=np.int32)
+                raw_ids = raw_ids[order]
+                for chunk in range(n_chunks):
+                    path = chunk_path(out_dir, chunk, name)
+                    np.save(path, rank[np.load(path)])
+            np.save(os.path.join(out_dir, name + 's.npy'), raw_ids)
+
+    meta = {
+        'ds_name': ds_name,
+        'chunks': n_chunks,
+        'rows': n_rows,
+        'chunksize': chunksize,
+        'encoded': layout['encode'],
+        'users': len(users),
+        'items': len(items),
+        'memory_budget_mb': memory_budget_mb,
+        'process_peak_rss_mb': round(process_peak_rss_mb(), 1)
+    }
+    with open(os.path.join(out_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+    budget = '' if memory_budget_mb is None else ' (budget ' + str(memory_budget_mb) + ' MB)'
+    print(str(n_rows) + ' ratings streamed in ' + str(n_chunks) + ' chunks, process peak RSS ' +
+          str(meta['process_peak_rss_mb']) + ' MB' + budget)
+
+    return meta
+
+
+# the encoded chunks one at a time, as dicts of memory-mapped columns
+def iter_encoded_chunks(out_dir):
+    with open(os.path.join(out_dir, 'meta.json')) as f:
+        meta = json.load(f)
+
+    for chunk in range(meta['chunks']):
+        yield {name: np.load(chunk_path(out_dir, chunk, name), mmap_mode='r')
+               for name in ['user_id', 'item_id', 'rating', 'timestamp']}
+
+
+# all the encoded chunks as one ratings dataframe, for datasets that fit in memory once encoded
+def load_encoded(out_dir):
+    chunks = list(iter_encoded_chunks(out_dir))
+    if not chunks:
+        return pd.DataFrame(columns=['user_id', 'item_id', 'rating', 'timestamp'])
+
+    return pd.DataFrame({name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]})